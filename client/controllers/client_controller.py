@@ -1,7 +1,6 @@
 # client/controllers/client_controller.py
 import json
-import socket
-import zlib
+import threading
 
 from PySide6.QtCore import Qt, QDate
 from PySide6.QtWidgets import QApplication, QMessageBox
@@ -11,11 +10,15 @@ from client.views.report_generation_window import ReportWindow
 from client.views.template_constructor_window import TemplateConstructorWindow
 from client.views.user_authorization_window import LoginWindow
 from client.views.window_creating_new_template import WindowCreatingNewTemplate
+from client.services.server_connection import ServerConnection
 from client.services.template_table_service import TemplateTableService
+from common.protocol.series_encoding import decode_cell_result
 
 class ClientController:
     creating_window = None
     access_window = None
+    # Одно постоянное соединение с сервером на все окна клиента
+    server_connection = ServerConnection('localhost', 5000)
 
     def __init__(self):
         self.app = QApplication([])
@@ -36,18 +39,11 @@ class ClientController:
         msg_box.exec()
 
     @staticmethod
-    def send_request_to_server(request_data):
+    def send_request_to_server(request_data, on_frame=None):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect(('localhost', 5000))
-                json_request = json.dumps(request_data, ensure_ascii=False)
-                print(f"Отправляемый запрос: {json_request}")  # Логирование перед отправкой
-                compressed_data = zlib.compress(json.dumps(request_data, ensure_ascii=False).encode('UTF-8'))
-                s.sendall(compressed_data)
-
-                compressed_response = s.recv(8192)  # Получаем сжатый ответ
-                response = zlib.decompress(compressed_response).decode('UTF-8')
-                return json.loads(response)
+            json_request = json.dumps(request_data, ensure_ascii=False)
+            print(f"Отправляемый запрос: {json_request}")  # Логирование перед отправкой
+            return ClientController.server_connection.request(request_data, on_frame)
         except ConnectionResetError as e:
             print(f"Connection error: {e}")
             return None
@@ -58,6 +54,17 @@ class ClientController:
             print(f"Unexpected error: {e}")
             return None
 
+    @staticmethod
+    def send_batch_to_server(requests):
+        """
+        Отправляет несколько запросов одним пакетом (BATCH).
+        Возвращает список ответов в порядке запросов; при ошибке пакета все ответы None.
+        """
+        response = ClientController.send_request_to_server({"type": "BATCH", "data": requests})
+        if response and response.get("status") == "success":
+            return response.get("responses", [])
+        return [None] * len(requests)
+
     def open_template_constructor_window(self, username):
         template_names = self.get_template_names_in_db()  # Получение списка шаблонов из БД
         print(f"Шаблоны для конструктора: {template_names}")  # Отладка
@@ -72,10 +79,21 @@ class ClientController:
         self.template_constructor_view.show()
 
     def open_access_window(self):
-        template_names = self.get_template_names_in_db()
-        users_names = self.get_users_names_in_db()
+        # Имена шаблонов и пользователей получаем одним пакетом
+        template_response, users_response = ClientController.send_batch_to_server([
+            {"type": "GET_TEMPLATE_NAMES", "data": None},
+            {"type": "USERS_NAMES"},
+        ])
+        template_names = (template_response.get("template_names", [])
+                          if template_response and template_response.get("status") == "success" else [])
+        users_names = (users_response.get("users_names", [])
+                       if users_response and users_response.get("status") == "success" else [])
+        accessible_templates = self.get_accessible_templates_for_users_in_db(
+            [user['name'] for user in users_names]
+        )
         self.access_window = AccessSettingsWindow(template_names = template_names,
-                                                            users_names = users_names, controller = self)
+                                                            users_names = users_names, controller = self,
+                                                            accessible_templates = accessible_templates)
         self.access_window.load_data(users_names, template_names)
         self.access_window.show()
 
@@ -91,6 +109,24 @@ class ClientController:
         else:
             return []
 
+    def get_accessible_templates_for_users_in_db(self, users_names):
+        """
+        Получает доступные шаблоны сразу для всех пользователей одним пакетом.
+        Возвращает словарь {имя пользователя: [имена шаблонов]}.
+        """
+        if not users_names:
+            return {}
+        responses = ClientController.send_batch_to_server([
+            {"type": "GET_ACCESSIBLE_TEMPLATE_NAMES", "data": user_name} for user_name in users_names
+        ])
+        accessible_templates = {}
+        for user_name, response in zip(users_names, responses):
+            if response is None:
+                continue
+            templates = response.get("users_names", []) if response.get("status") == "success" else []
+            accessible_templates[user_name] = [template['name'] for template in templates]
+        return accessible_templates
+
     def update_accessible_templates_for_user(self, template_mame, user_name):
         change_data = {
             "template_name" : template_mame,
@@ -105,9 +141,11 @@ class ClientController:
         if response and response.get("status") == "success":
             # Всплывающее сообщение об успехе
             QMessageBox.information(None, "Успех", "Доступные шаблоны успешно обновлены.")
+            return True
         else:
             # Всплывающее сообщение об ошибке
             QMessageBox.critical(None, "Ошибка", "Произошла ошибка. Данные не обновлены.")
+            return False
 
     def open_report_window(self, user_name):
         # Получаем текущую дату для начала и конца
@@ -134,6 +172,7 @@ class ClientController:
         )
 
         self.report_window.create_report.connect(self.handle_report_request)
+        self.report_window.report_finished.connect(self.handle_report_finished)
         self.report_window.show()
 
     #---------------------------------------------------------------------------------------------------
@@ -168,32 +207,12 @@ class ClientController:
                 cell_name = cell["cell_name"]
                 parse_data["cell_value"][cell_name] = cell_value
 
-        # Если есть формулы, отправляем их на сервер для обработки
-        if parse_data["cell_value"]:
-            print("Данные для парсинга:", json.dumps(parse_data, indent=4, ensure_ascii=False))
-            parse_request = {
-                "type": "PARSE_CELL",
-                "data": parse_data
-            }
-            parse_response = ClientController.send_request_to_server(parse_request)
-
-            # Обновляем значения ячеек на основе ответа сервера
-            if parse_response and "cell_value" in parse_response:
-                parsed_values = parse_response["cell_value"]
-
-                for cell in cells:
-                    cell_name = cell["cell_name"]
-
-                    # Если ячейка есть в ответе от сервера
-                    if cell_name in parsed_values:
-                        updated_data = parsed_values[cell_name]
-
-                        # Обновляем только "type" и "value", сохраняя остальные данные
-                        cell["type"] = updated_data.get("type", "single")  # По умолчанию "single"
-                        cell["value"] = updated_data.get("value", "")
-                    else:
-                        # Ячейки, которые не были отправлены на парсинг, сохраняются без изменений
-                        cell.setdefault("type", "single")  # Если тип не указан, ставим "single"
+        # Ячейки с формулами сначала показываются пустыми: значения приходят с сервера
+        # по мере вычисления и заполняются в окне отчета по одной
+        for cell in cells:
+            cell.setdefault("type", "single")  # Если тип не указан, ставим "single"
+            if cell["cell_name"] in parse_data["cell_value"]:
+                cell["value"] = ""
 
         # Формируем итоговые данные шаблона
         final_template_data = {
@@ -208,6 +227,42 @@ class ClientController:
         # Вызываем сигнал data_processed и передаем данные в представление
         self.report_window.data_processed.emit(final_template_data, start_date, end_date)
 
+        # Если есть формулы, отправляем их на сервер для потоковой обработки
+        if parse_data["cell_value"]:
+            print("Данные для парсинга:", json.dumps(parse_data, indent=4, ensure_ascii=False))
+            self.report_window.set_report_in_progress(True)
+            threading.Thread(
+                target=self.stream_report_cells,
+                args=(self.report_window, self.report_window.report_generation, parse_data),
+                daemon=True
+            ).start()
+
+    @staticmethod
+    def stream_report_cells(report_window, generation, parse_data):
+        """
+        Запрашивает потоковое вычисление формул и передает результат каждой ячейки
+        в окно отчета сигналом. Выполняется в фоновом потоке, чтобы окно оставалось отзывчивым.
+        generation - номер формирования таблицы, для которой запрошен отчет.
+        """
+        parse_request = {
+            "type": "PARSE_CELL_STREAM",
+            "data": parse_data
+        }
+        summary = ClientController.send_request_to_server(
+            parse_request,
+            on_frame=lambda frame: report_window.cell_processed.emit(generation, frame["cell_name"],
+                                                                    decode_cell_result(frame))
+        )
+        report_window.report_finished.emit(generation,
+                                           summary or {"status": "error", "message": "Нет ответа от сервера"})
+
+    def handle_report_finished(self, generation, summary):
+        """Итог потокового формирования отчета; итоги отчетов прежних таблиц не показываются."""
+        if generation != self.report_window.report_generation:
+            return
+        if summary.get("status") != "success":
+            QMessageBox.critical(None, "Ошибка", summary.get("message", "Не удалось сформировать отчет."))
+
     #Создание окна Рапот-------------------------------------------------------------------------------
     def handle_report_window(self):
         if not self.template_constructor_view.template_name:
@@ -257,7 +312,7 @@ class ClientController:
                 cell_name = cell["cell_name"]
                 if cell_name in response["cell_value"]:
                     # Заменяем значение ячейки на данные из ответа
-                    cell.update(response["cell_value"][cell_name])
+                    cell.update(decode_cell_result(response["cell_value"][cell_name]))
 
         # Передаем данные в представление
         template_data = {
@@ -0,0 +1,231 @@
+# client/services/server_connection.py
+import socket
+import threading
+import time
+
+from common.protocol.codecs import CODEC_JSON, CODEC_NAMES
+from common.protocol.compression import CompressionPolicy
+from common.protocol.framing import FLAG_MORE, MAX_REQUEST_ID, receive_message, send_message
+from common.protocol.series_encoding import SERIES_ENCODINGS
+from common.protocol.zdict import DICTIONARIES, supported_versions
+
+
+class PendingRequest:
+    """Ожидание ответа на один отправленный запрос."""
+
+    def __init__(self, on_frame=None):
+        self.event = threading.Event()
+        self.response = None
+        # Обработчик промежуточных кадров потокового ответа
+        self.on_frame = on_frame
+        self.last_frame = time.monotonic()
+
+    def frame_received(self, payload):
+        self.last_frame = time.monotonic()
+        if self.on_frame is not None:
+            try:
+                self.on_frame(payload)
+            except Exception as e:
+                print(f"Ошибка обработки промежуточного кадра: {e}")
+
+    def resolve(self, response):
+        self.response = response
+        self.event.set()
+
+
+class ServerConnection:
+    """
+    Постоянное соединение клиента с сервером.
+
+    Запросы отправляются по одному сокету с уникальными идентификаторами,
+    фоновый поток читает ответы и передает их ожидающим вызовам, поэтому
+    несколько запросов могут находиться в работе одновременно.
+    Соединение устанавливается при первом запросе, закрывается после
+    простоя idle_timeout секунд и восстанавливается при следующем запросе.
+    Если сервер перегружен и отвечает "busy", запрос повторяется через
+    указанную сервером паузу, но не более busy_retries раз.
+    Сразу после подключения клиент согласует с сервером кодек сообщений
+    и словарь сжатия (HELLO); сервер, не знающий HELLO, продолжает работать в JSON.
+    """
+
+    def __init__(self, host='localhost', port=5000, response_timeout=120.0, idle_timeout=240.0, busy_retries=3):
+        self.host = host
+        self.port = port
+        self.response_timeout = response_timeout
+        self.idle_timeout = idle_timeout
+        self.busy_retries = busy_retries
+        self.codec = CODEC_JSON
+        self.zdict = None
+        # Сжатие запросов и его статистика по типам запросов
+        self.compression_policy = CompressionPolicy()
+
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+        # Подключение к серверу выполняется под отдельной блокировкой: lock нужен потоку
+        # чтения и другим запросам и не должен удерживаться на время сетевого обмена
+        self.connect_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.next_request_id = 1
+        self.last_activity = time.monotonic()
+
+    def request(self, request_data, on_frame=None):
+        """
+        Отправляет запрос и ждет ответ. Возвращает ответ или None при ошибке соединения.
+        Для потоковых запросов промежуточные кадры передаются в on_frame
+        (вызывается из потока чтения), а возвращается итоговый кадр.
+        """
+        response = self._send_and_wait(request_data, on_frame)
+        for _ in range(self.busy_retries):
+            if not (isinstance(response, dict) and response.get("status") == "busy"):
+                break
+            retry_after_ms = response.get("retry_after_ms", 200)
+            print(f"Сервер занят, повтор запроса через {retry_after_ms} мс")
+            time.sleep(retry_after_ms / 1000)
+            response = self._send_and_wait(request_data, on_frame)
+        return response
+
+    def _send_and_wait(self, request_data, on_frame=None):
+        request_id, pending, sock = self._register_request(on_frame)
+        try:
+            with self.send_lock:
+                send_message(sock, request_data, request_id, codec=self.codec,
+                             policy=self.compression_policy, stats_key=request_data.get("type"),
+                             zdict=self.zdict)
+        except OSError as e:
+            print(f"Ошибка отправки запроса: {e}")
+            self._drop_connection(sock)
+            return None
+
+        # Таймаут отсчитывается от последнего полученного кадра, поэтому длинный
+        # потоковый ответ не прерывается, пока кадры продолжают приходить
+        while not pending.event.wait(self.response_timeout):
+            if time.monotonic() - pending.last_frame >= self.response_timeout:
+                with self.lock:
+                    self.pending.pop(request_id, None)
+                print(f"Сервер не ответил на запрос {request_id} за {self.response_timeout} с")
+                return None
+        return pending.response
+
+    def close(self):
+        with self.lock:
+            sock = self.sock
+        if sock is not None:
+            self._drop_connection(sock)
+
+    def _register_request(self, on_frame=None):
+        sock = self._ensure_connected()
+        with self.lock:
+            if self.sock is not sock:
+                raise ConnectionResetError("Соединение с сервером закрыто")
+            request_id = self.next_request_id
+            self.next_request_id = request_id % MAX_REQUEST_ID + 1
+            pending = PendingRequest(on_frame)
+            self.pending[request_id] = pending
+            self.last_activity = time.monotonic()
+            return request_id, pending, sock
+
+    def _ensure_connected(self):
+        """Сокет текущего соединения; если его нет, подключается к серверу."""
+        sock = self.sock
+        if sock is not None:
+            return sock
+        with self.connect_lock:
+            sock = self.sock
+            if sock is None:
+                sock = self._connect()
+            return sock
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            codec, zdict = self._negotiate(sock)
+        except Exception:
+            sock.close()
+            raise
+        with self.lock:
+            self.codec, self.zdict = codec, zdict
+            self.sock = sock
+            self.last_activity = time.monotonic()
+        self.reader = threading.Thread(target=self._read_loop, args=(sock,), name="server-reader", daemon=True)
+        self.reader.start()
+        threading.Thread(target=self._idle_watch, args=(sock,), name="server-idle-watch", daemon=True).start()
+        return sock
+
+    def _negotiate(self, sock):
+        """
+        Согласует кодек сообщений и словарь сжатия до запуска потока чтения.
+        Возвращает (номер кодека, словарь или None).
+        """
+        hello = {"type": "HELLO", "data": {
+            "codecs": list(CODEC_NAMES),
+            "zdicts": supported_versions(),
+            # Упакованные ряды в результатах PARSE_CELL распаковывает ClientController
+            "series": list(SERIES_ENCODINGS),
+        }}
+        send_message(sock, hello)
+        message = receive_message(sock)
+        if message is None:
+            raise ConnectionError("Сервер закрыл соединение при согласовании")
+        _, _, response = message
+        if response.get("status") != "success":
+            return CODEC_JSON, None
+        return CODEC_NAMES.get(response.get("codec"), CODEC_JSON), DICTIONARIES.get(response.get("zdict"))
+
+    def _read_loop(self, sock):
+        while True:
+            try:
+                message = receive_message(sock)
+            except Exception as e:
+                print(f"Соединение с сервером прервано: {e}")
+                break
+
+            if message is None:
+                break
+
+            request_id, flags, response = message
+            with self.lock:
+                if flags & FLAG_MORE:
+                    pending = self.pending.get(request_id)
+                else:
+                    pending = self.pending.pop(request_id, None)
+                self.last_activity = time.monotonic()
+            if pending is None:
+                continue
+            if flags & FLAG_MORE:
+                pending.frame_received(response)
+            else:
+                pending.resolve(response)
+
+        self._drop_connection(sock)
+
+    def _idle_watch(self, sock):
+        """Закрывает соединение, если по нему не было запросов дольше idle_timeout."""
+        while True:
+            time.sleep(min(self.idle_timeout, 30.0))
+            with self.lock:
+                if self.sock is not sock:
+                    return
+                idle = not self.pending and time.monotonic() - self.last_activity > self.idle_timeout
+            if idle:
+                print("Соединение с сервером закрыто по простою")
+                self._drop_connection(sock)
+                return
+
+    def _drop_connection(self, sock):
+        """Закрывает соединение и завершает все ожидающие его запросы с пустым ответом."""
+        with self.lock:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            pending, self.pending = self.pending, {}
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for request in pending.values():
+            request.resolve(None)
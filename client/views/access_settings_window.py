@@ -4,11 +4,13 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt
 
 class AccessSettingsWindow(QMainWindow):
-    def __init__(self, template_names, users_names, controller):
+    def __init__(self, template_names, users_names, controller, accessible_templates=None):
         super().__init__()
         self.setWindowTitle("Настройки доступа")
         self.setFixedSize(400, 200)  # Увеличиваем размер окна
         self.controller = controller
+        # Доступные шаблоны пользователей, загруженные заранее одним пакетом
+        self.accessible_templates = accessible_templates or {}
 
         # Основной виджет
         central_widget = QWidget()
@@ -87,7 +89,8 @@ class AccessSettingsWindow(QMainWindow):
         selected_templates = [cb.text() for cb in self.checkboxes if cb.isChecked()]
         selected_name = self.name_list.currentItem().text() if self.name_list.currentItem() else None
 
-        self.controller.update_accessible_templates_for_user(selected_templates, selected_name)
+        if self.controller.update_accessible_templates_for_user(selected_templates, selected_name):
+            self.accessible_templates[selected_name] = selected_templates
         print("Выбранные шаблоны:", selected_templates)
         print("Выбранное имя:", selected_name)
 
@@ -96,8 +99,11 @@ class AccessSettingsWindow(QMainWindow):
             selected_user = current.text()
             print(f"Пользователь выбран: {selected_user}")
 
-            # Получаем доступные шаблоны для пользователя
-            accessible_templates = [item['name'] for item in self.controller.get_accessible_templates_for_user_in_db(selected_user)]
+            # Получаем доступные шаблоны для пользователя: из загруженных заранее или с сервера
+            accessible_templates = self.accessible_templates.get(selected_user)
+            if accessible_templates is None:
+                accessible_templates = [item['name'] for item in self.controller.get_accessible_templates_for_user_in_db(selected_user)]
+                self.accessible_templates[selected_user] = accessible_templates
 
             print("Доступные шаблоны:", accessible_templates)
 
@@ -14,6 +14,10 @@ from client.services.template_table_service import TemplateTableService
 class ReportWindow(QWidget):
     create_report = Signal(str, str, str)
     data_processed = Signal(dict, str, str)
+    # Результат одной ячейки потокового отчета: номер формирования, имя ячейки и {"type": ..., "value": ...}
+    cell_processed = Signal(int, str, dict)
+    # Итоговая сводка потокового отчета: номер формирования и сводка
+    report_finished = Signal(int, dict)
 
     def __init__(self, template_data, start_date, end_date, template_name , user_name, parent=None):
         super().__init__(parent)
@@ -24,6 +28,17 @@ class ReportWindow(QWidget):
         self.template_name = template_name
         self.user_name = user_name
         self.data_processed.connect(self.update_data_report)
+        self.cell_processed.connect(self.update_cell)
+        self.report_finished.connect(self.finish_report)
+
+        # Конфигурации ячеек шаблона и добавленные строки: {исходная строка: число добавленных строк}
+        self.cell_configs = {}
+        self.row_shifts = {}
+        # Объединения ячеек таблицы: (верхняя строка, левый столбец, нижняя строка, правый столбец)
+        self.merged_ranges = []
+        # Номер формирования отчета: растет при каждой загрузке таблицы,
+        # кадры потокового отчета с другим номером относятся к прежней таблице
+        self.report_generation = 0
 
         # Данные шаблона
         self.template_data = template_data
@@ -75,7 +90,7 @@ class ReportWindow(QWidget):
         layout.addWidget(self.end_date_edit)
 
         # Кнопка для формирования отчета
-        generate_report_button = QPushButton("Сформировать отчет")
+        self.generate_report_button = generate_report_button = QPushButton("Сформировать отчет")
         generate_report_button.clicked.connect(
             lambda: self.create_report.emit(
                 self.template_combo.currentText(),
@@ -105,6 +120,7 @@ class ReportWindow(QWidget):
         """
         # Очистка таблицы
         self.table.clearContents()
+        self.table.clearSpans()
         self.table.setRowCount(0)
         self.table.setColumnCount(0)
 
@@ -119,6 +135,10 @@ class ReportWindow(QWidget):
         header_labels = [TemplateTableService.generate_col_name(i) for i in range(self.table.columnCount())]
         self.table.setHorizontalHeaderLabels(header_labels)
 
+        self.cell_configs = {}
+        self.row_shifts = {}
+        self.merged_ranges = []
+
         # Заполняем таблицу данными
         for cell_info in self.template_data["cell_data"]:
             # Получаем позицию ячейки
@@ -126,6 +146,7 @@ class ReportWindow(QWidget):
             row_index, col_index = TemplateTableService.parse_cell_position(cell_name)
 
             cell_config = cell_info.get("config", {})
+            self.cell_configs[cell_name] = cell_config
 
             if cell_info.get("type") == "list":
                 # Если данные множественные, распределяем их по строкам
@@ -153,12 +174,15 @@ class ReportWindow(QWidget):
             merge_range = cell_info["config"].get("merger")
             if merge_range:
                 TemplateTableService.apply_merged_cells(self.table, [merge_range])
+                self.merged_ranges.append(TemplateTableService.parse_merge_range(merge_range))
 
         self.table.viewport().update()
 
     def shift_rows_down(self, start_row, count):
         """
         Сдвигает строки вниз начиная с `start_row` на `count` строк.
+        Объединения ниже `start_row` сдвигаются вместе со строками, объединения,
+        в которые попадают вставленные строки, растягиваются на них.
         """
         current_row_count = self.table.rowCount()
         new_row_count = max(current_row_count + count, start_row + count)
@@ -176,6 +200,60 @@ class ReportWindow(QWidget):
                     # Перемещаем ячейку вниз
                     self.table.setItem(row + count, col, item)
 
+        # Снимаем все объединения и применяем их заново на новых местах,
+        # чтобы сдвинутые объединения не пересекались с прежними
+        for top_row, left_col, _, _ in self.merged_ranges:
+            self.table.setSpan(top_row, left_col, 1, 1)
+        shifted_ranges = []
+        for top_row, left_col, bottom_row, right_col in self.merged_ranges:
+            if top_row >= start_row:
+                top_row += count
+            if bottom_row >= start_row:
+                bottom_row += count
+            self.table.setSpan(top_row, left_col, bottom_row - top_row + 1, right_col - left_col + 1)
+            shifted_ranges.append((top_row, left_col, bottom_row, right_col))
+        self.merged_ranges = shifted_ranges
+
+    def set_report_in_progress(self, in_progress):
+        """Блокирует повторное формирование, пока значения ячеек приходят с сервера."""
+        self.generate_report_button.setEnabled(not in_progress)
+        self.generate_report_button.setText("Формирование..." if in_progress else "Сформировать отчет")
+
+    def finish_report(self, generation, summary):
+        """Снимает блокировку формирования, когда завершился отчет текущей таблицы."""
+        if generation == self.report_generation:
+            self.set_report_in_progress(False)
+
+    def update_cell(self, generation, cell_name, cell_result):
+        """
+        Заполняет одну ячейку результатом потокового отчета.
+        Списочное значение раскладывается по строкам вниз, строки ниже сдвигаются;
+        позиции ячеек, пришедших позже, пересчитываются с учетом уже добавленных строк.
+        Кадры отчета, сформированного для прежней таблицы (generation устарел), пропускаются.
+        """
+        if generation != self.report_generation:
+            return
+        row_index, col_index = TemplateTableService.parse_cell_position(cell_name)
+        cell_config = self.cell_configs.get(cell_name, {})
+        target_row = row_index + sum(count for row, count in self.row_shifts.items() if row < row_index)
+
+        if cell_result.get("type") == "list":
+            values = cell_result.get("value") or []
+            needed_rows = len(values) - 1
+            added_rows = self.row_shifts.get(row_index, 0)
+            if needed_rows > added_rows:
+                self.shift_rows_down(target_row + 1 + added_rows, needed_rows - added_rows)
+                self.row_shifts[row_index] = needed_rows
+        else:
+            value = cell_result.get("value")
+            values = ["" if value is None else value]
+
+        for offset, value in enumerate(values):
+            item = QTableWidgetItem(str(value))
+            self.table.setItem(target_row + offset, col_index, item)
+            TemplateTableService.apply_cell_configuration(item, self.table, target_row + offset, col_index,
+                                                          cell_config)
+
     def name_on_template_selected(self, template_name):
         self.template_name = template_name
         print(f"Шаблон выбран: {template_name}")
@@ -188,5 +266,7 @@ class ReportWindow(QWidget):
         self.start_date = new_start_date
         self.end_date = new_end_date
 
-        # Перезагружаем таблицу с новыми данными
+        # Перезагружаем таблицу с новыми данными; отчет прежней таблицы больше не отображается
+        self.report_generation += 1
+        self.set_report_in_progress(False)
         self.download_table()
\ No newline at end of file
@@ -0,0 +1,201 @@
+# common/protocol/codecs.py
+"""
+Форматы тела сообщения (кодеки).
+
+CODEC_JSON   - исходный формат: JSON в UTF-8.
+CODEC_BINARY - компактный двоичный формат: каждое значение начинается с байта-тега,
+               вещественные числа передаются как 8-байтовые double, строки - с префиксом
+               длины, списки из одних float - одним блоком double без поэлементных тегов.
+
+Кодек выбирается для соединения при согласовании (запрос HELLO), а номер кодека
+передается в заголовке каждого кадра, поэтому любая сторона может прочитать кадр
+в любом из поддерживаемых форматов.
+"""
+import json
+import struct
+import sys
+from array import array
+
+CODEC_JSON = 1
+CODEC_BINARY = 2
+
+# Имена кодеков при согласовании, в порядке предпочтения
+CODEC_NAMES = {
+    "binary": CODEC_BINARY,
+    "json": CODEC_JSON,
+}
+
+# Теги значений двоичного формата
+TAG_NONE = 0x00
+TAG_TRUE = 0x01
+TAG_FALSE = 0x02
+TAG_INT = 0x03
+TAG_BIG_INT = 0x04
+TAG_FLOAT = 0x05
+TAG_STR = 0x06
+TAG_LIST = 0x07
+TAG_DICT = 0x08
+TAG_FLOAT_ARRAY = 0x09
+
+_LENGTH = struct.Struct("<I")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_INT_MIN = -(1 << 63)
+_INT_MAX = (1 << 63) - 1
+# Массивы double передаются в little-endian
+_SWAP_DOUBLES = sys.byteorder != "little"
+
+
+class CodecError(Exception):
+    """Ошибка кодирования или разбора тела сообщения."""
+
+
+def encode_json(payload):
+    return json.dumps(payload, ensure_ascii=False).encode("UTF-8")
+
+
+def decode_json(body):
+    return json.loads(body)
+
+
+def encode_binary(payload):
+    parts = []
+    _encode_value(payload, parts)
+    return b"".join(parts)
+
+
+def decode_binary(body):
+    view = memoryview(body)
+    try:
+        value, offset = _decode_value(view, 0)
+    except struct.error:
+        raise CodecError("Неожиданный конец сообщения")
+    if offset != len(view):
+        raise CodecError("Лишние данные после конца сообщения")
+    return value
+
+
+def _encode_value(value, parts):
+    if value is None:
+        parts.append(bytes((TAG_NONE,)))
+    elif value is True:
+        parts.append(bytes((TAG_TRUE,)))
+    elif value is False:
+        parts.append(bytes((TAG_FALSE,)))
+    elif isinstance(value, int):
+        if _INT_MIN <= value <= _INT_MAX:
+            parts.append(bytes((TAG_INT,)))
+            parts.append(_INT.pack(value))
+        else:
+            _encode_text(TAG_BIG_INT, str(value), parts)
+    elif isinstance(value, float):
+        parts.append(bytes((TAG_FLOAT,)))
+        parts.append(_FLOAT.pack(value))
+    elif isinstance(value, str):
+        _encode_text(TAG_STR, value, parts)
+    elif isinstance(value, (list, tuple)):
+        if len(value) > 1 and all(type(item) is float for item in value):
+            # Ряд вещественных чисел: один тег и сырые double подряд
+            doubles = array("d", value)
+            if _SWAP_DOUBLES:
+                doubles.byteswap()
+            parts.append(bytes((TAG_FLOAT_ARRAY,)))
+            parts.append(_LENGTH.pack(len(doubles)))
+            parts.append(doubles.tobytes())
+        else:
+            parts.append(bytes((TAG_LIST,)))
+            parts.append(_LENGTH.pack(len(value)))
+            for item in value:
+                _encode_value(item, parts)
+    elif isinstance(value, dict):
+        parts.append(bytes((TAG_DICT,)))
+        parts.append(_LENGTH.pack(len(value)))
+        for key, item in value.items():
+            # Ключи приводятся к строке, как в JSON
+            _encode_text(TAG_STR, key if isinstance(key, str) else json.dumps(key), parts)
+            _encode_value(item, parts)
+    else:
+        raise CodecError(f"Тип {type(value).__name__} не поддерживается двоичным кодеком")
+
+
+def _encode_text(tag, text, parts):
+    data = text.encode("UTF-8")
+    parts.append(bytes((tag,)))
+    parts.append(_LENGTH.pack(len(data)))
+    parts.append(data)
+
+
+def _decode_value(view, offset):
+    try:
+        tag = view[offset]
+    except IndexError:
+        raise CodecError("Неожиданный конец сообщения")
+    offset += 1
+
+    if tag == TAG_NONE:
+        return None, offset
+    if tag == TAG_TRUE:
+        return True, offset
+    if tag == TAG_FALSE:
+        return False, offset
+    if tag == TAG_INT:
+        return _INT.unpack_from(view, offset)[0], offset + _INT.size
+    if tag == TAG_FLOAT:
+        return _FLOAT.unpack_from(view, offset)[0], offset + _FLOAT.size
+    if tag in (TAG_STR, TAG_BIG_INT):
+        length = _LENGTH.unpack_from(view, offset)[0]
+        offset += _LENGTH.size
+        if offset + length > len(view):
+            raise CodecError("Неожиданный конец сообщения")
+        text = str(view[offset:offset + length], "UTF-8")
+        return (int(text) if tag == TAG_BIG_INT else text), offset + length
+    if tag == TAG_FLOAT_ARRAY:
+        count = _LENGTH.unpack_from(view, offset)[0]
+        offset += _LENGTH.size
+        end = offset + count * _FLOAT.size
+        if end > len(view):
+            raise CodecError("Неожиданный конец сообщения")
+        doubles = array("d")
+        doubles.frombytes(view[offset:end])
+        if _SWAP_DOUBLES:
+            doubles.byteswap()
+        return doubles.tolist(), end
+    if tag == TAG_LIST:
+        count = _LENGTH.unpack_from(view, offset)[0]
+        offset += _LENGTH.size
+        items = []
+        for _ in range(count):
+            item, offset = _decode_value(view, offset)
+            items.append(item)
+        return items, offset
+    if tag == TAG_DICT:
+        count = _LENGTH.unpack_from(view, offset)[0]
+        offset += _LENGTH.size
+        result = {}
+        for _ in range(count):
+            key, offset = _decode_value(view, offset)
+            result[key], offset = _decode_value(view, offset)
+        return result, offset
+    raise CodecError(f"Неизвестный тег значения: {tag}")
+
+
+ENCODERS = {
+    CODEC_JSON: encode_json,
+    CODEC_BINARY: encode_binary,
+}
+
+DECODERS = {
+    CODEC_JSON: decode_json,
+    CODEC_BINARY: decode_binary,
+}
+
+
+def negotiate_codec(offered_names):
+    """
+    Выбирает кодек соединения из предложенных клиентом имен (в порядке его предпочтения).
+    Если общих кодеков нет, остается JSON. Возвращает (имя, номер кодека).
+    """
+    for name in offered_names or []:
+        if name in CODEC_NAMES:
+            return name, CODEC_NAMES[name]
+    return "json", CODEC_JSON
@@ -0,0 +1,127 @@
+# common/protocol/compression.py
+"""
+Политика сжатия тела кадра.
+
+Сообщения меньше min_size не сжимаются: для ответов вида {"status": "exists"}
+заголовок zlib и затраты процессора больше выигрыша. Уровень сжатия выбирается
+по размеру сообщения, крупные сообщения сжимаются потоково (compressobj) частями,
+а данные, которые почти не сжимаются (например, ряды double), определяются по
+пробному сжатию начала сообщения и отправляются как есть.
+
+Если для соединения согласован предустановленный словарь (common.protocol.zdict),
+сжатие выполняется с ним, и порог min_size снижается до min_size_zdict:
+со словарем выгодно сжимать даже короткие сообщения.
+"""
+import threading
+import time
+import zlib
+
+
+class CompressionStats:
+    """Статистика сжатия по типам запросов: время процессора и сэкономленные байты."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_type = {}
+
+    def record(self, key, raw_size, sent_size, cpu_seconds, compressed):
+        with self.lock:
+            entry = self.by_type.setdefault(key or "UNKNOWN", {
+                "messages": 0,
+                "compressed": 0,
+                "raw_bytes": 0,
+                "sent_bytes": 0,
+                "cpu_ms": 0.0,
+            })
+            entry["messages"] += 1
+            entry["compressed"] += 1 if compressed else 0
+            entry["raw_bytes"] += raw_size
+            entry["sent_bytes"] += sent_size
+            entry["cpu_ms"] += cpu_seconds * 1000
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                key: dict(entry,
+                          saved_bytes=entry["raw_bytes"] - entry["sent_bytes"],
+                          cpu_ms=round(entry["cpu_ms"], 3))
+                for key, entry in self.by_type.items()
+            }
+
+
+class CompressionPolicy:
+    """
+    Выбор сжатия по размеру и содержимому сообщения.
+
+    levels - список (максимальный размер, уровень zlib) по возрастанию размера;
+    сообщения больше последней границы сжимаются уровнем large_level.
+    По умолчанию частые небольшие ответы сжимаются быстрым уровнем 1, ответы до 1 МБ -
+    уровнем 4, а крупные выгрузки, где каждый сэкономленный процент заметен, - уровнем 9.
+    """
+
+    def __init__(self, min_size=512, levels=((64 * 1024, 1), (1024 * 1024, 4)), large_level=9,
+                 stream_threshold=1024 * 1024, chunk_size=256 * 1024,
+                 sample_size=4096, min_sample_ratio=0.9, min_size_zdict=32, sample_recorder=None):
+        self.min_size = min_size
+        self.min_size_zdict = min_size_zdict
+        # Необязательный сбор образцов сообщений для обучения словаря (zdict.SampleRecorder)
+        self.sample_recorder = sample_recorder
+        self.levels = levels
+        self.large_level = large_level
+        self.stream_threshold = stream_threshold
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.min_sample_ratio = min_sample_ratio
+        self.stats = CompressionStats()
+
+    def level_for(self, size):
+        for max_size, level in self.levels:
+            if size <= max_size:
+                return level
+        return self.large_level
+
+    def is_compressible(self, data):
+        """Пробное сжатие начала сообщения: если оно почти не уменьшается, сжимать не стоит."""
+        if len(data) <= self.sample_size * 2:
+            return True
+        sample = memoryview(data)[:self.sample_size]
+        return len(zlib.compress(sample, 1)) < self.sample_size * self.min_sample_ratio
+
+    def compress(self, data, stats_key=None, zdict=None):
+        """
+        Возвращает (сжато ли, тело). zdict - согласованный словарь сжатия или None.
+        Результат учитывается в статистике по stats_key.
+        """
+        if self.sample_recorder is not None:
+            self.sample_recorder.record(data, stats_key)
+
+        started = time.thread_time()
+        body = data
+        compressed = False
+
+        min_size = self.min_size if zdict is None else self.min_size_zdict
+        if len(data) >= min_size and self.is_compressible(data):
+            level = self.level_for(len(data))
+            if len(data) > self.stream_threshold or zdict is not None:
+                candidate = self._compress_stream(data, level, zdict)
+            else:
+                candidate = zlib.compress(data, level)
+            if len(candidate) < len(data):
+                body = candidate
+                compressed = True
+
+        self.stats.record(stats_key, len(data), len(body), time.thread_time() - started, compressed)
+        return compressed, body
+
+    def _compress_stream(self, data, level, zdict=None):
+        """Потоковое сжатие частями, без промежуточных копий входных данных."""
+        compressor = zlib.compressobj(level) if zdict is None else zlib.compressobj(level, zdict=zdict)
+        view = memoryview(data)
+        chunks = [compressor.compress(view[offset:offset + self.chunk_size])
+                  for offset in range(0, len(view), self.chunk_size)]
+        chunks.append(compressor.flush())
+        return b"".join(chunks)
+
+
+# Политика по умолчанию для сторон, не задающих свою
+DEFAULT_POLICY = CompressionPolicy()
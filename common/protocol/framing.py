@@ -0,0 +1,198 @@
+# common/protocol/framing.py
+"""
+Кадровый (framed) протокол обмена между клиентом и сервером.
+
+Каждое сообщение передается одним кадром: заголовок фиксированной длины
+и тело ровно указанной в заголовке длины. Заголовок:
+
+    magic   (2 байта)  - b"UR", признак кадра протокола URD
+    version (1 байт)   - версия протокола
+    codec   (1 байт)   - формат тела сообщения (CODEC_* из common.protocol.codecs)
+    flags   (1 байт)   - флаги кадра (FLAG_*)
+    request (4 байта)  - идентификатор запроса, ответ приходит с тем же номером
+    length  (4 байта)  - длина тела в байтах (network byte order)
+
+Тело читается точно по длине в заранее выделенный буфер, поэтому размер
+сообщения больше не ограничен одним recv(8192). Идентификатор запроса
+позволяет держать несколько запросов в полёте на одном соединении.
+
+Для старых клиентов без кадров поддержан прежний формат: одно сжатое zlib
+JSON-сообщение без заголовка (receive_legacy_message / send_legacy_message).
+"""
+import struct
+import zlib
+
+from common.protocol.codecs import CODEC_JSON, DECODERS, ENCODERS, encode_json
+from common.protocol.compression import DEFAULT_POLICY
+from common.protocol.zdict import decompress
+
+PROTOCOL_MAGIC = b"UR"
+PROTOCOL_VERSION = 2
+
+HEADER = struct.Struct("!2sBBBxII")
+
+# Идентификаторы запросов циклически занимают диапазон uint32, 0 не используется
+MAX_REQUEST_ID = 0xFFFFFFFF
+
+# Флаги кадра
+FLAG_COMPRESSED = 0x01
+# Кадр - часть потокового ответа, за ним последуют кадры с тем же request_id
+FLAG_MORE = 0x02
+
+# Защита от повреждённых заголовков: больше этого размера кадр не принимаем
+MAX_MESSAGE_SIZE = 512 * 1024 * 1024
+
+# До этого размера заголовок и тело отправляются одним вызовом sendall,
+# крупные тела отправляются отдельно, чтобы не копировать их ради заголовка
+SMALL_MESSAGE_SIZE = 64 * 1024
+
+
+class ProtocolError(Exception):
+    """Нарушение формата кадра."""
+
+
+def recv_exact(sock, size):
+    """
+    Читает из сокета ровно size байт в заранее выделенный буфер.
+    Возвращает bytearray длиной size.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Соединение закрыто до получения всего кадра")
+        received += count
+    return buffer
+
+
+def pack_header(request_id, codec, flags, length):
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Сообщение слишком большое: {length} байт")
+    return HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, codec, flags, request_id, length)
+
+
+def unpack_header(header):
+    """Разбирает заголовок кадра и возвращает (request_id, codec, flags, length)."""
+    magic, version, codec, flags, request_id, length = HEADER.unpack(header)
+    if magic != PROTOCOL_MAGIC:
+        raise ProtocolError("Неверная сигнатура кадра")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Неподдерживаемая версия протокола: {version}")
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Сообщение слишком большое: {length} байт")
+    return request_id, codec, flags, length
+
+
+def send_frame(sock, body, codec, flags, request_id=0):
+    """Отправляет один кадр: заголовок и тело."""
+    header = pack_header(request_id, codec, flags, len(body))
+    if len(body) <= SMALL_MESSAGE_SIZE:
+        sock.sendall(header + body)
+    else:
+        sock.sendall(header)
+        sock.sendall(body)
+
+
+def receive_frame(sock, prefix=b""):
+    """
+    Получает один кадр и возвращает (request_id, codec, flags, body).
+    prefix - уже прочитанное начало заголовка.
+    Если соединение закрыто до начала кадра, возвращает None.
+    """
+    header = bytearray(HEADER.size)
+    header[:len(prefix)] = prefix
+    view = memoryview(header)
+    received = len(prefix)
+    while received < HEADER.size:
+        count = sock.recv_into(view[received:], HEADER.size - received)
+        if count == 0:
+            if received == 0:
+                return None
+            raise ConnectionError("Соединение закрыто посреди заголовка кадра")
+        received += count
+
+    request_id, codec, flags, length = unpack_header(header)
+    body = recv_exact(sock, length)
+    return request_id, codec, flags, body
+
+
+def encode_payload(payload, codec=CODEC_JSON, policy=None, stats_key=None, zdict=None):
+    """
+    Сериализует сообщение выбранным кодеком и сжимает его по политике сжатия.
+    stats_key - тип запроса для статистики сжатия, zdict - согласованный словарь сжатия.
+    Возвращает (codec, flags, body).
+    """
+    encoder = ENCODERS.get(codec)
+    if encoder is None:
+        raise ProtocolError(f"Неизвестный формат сообщения: {codec}")
+    compressed, body = (policy or DEFAULT_POLICY).compress(encoder(payload), stats_key, zdict)
+    return codec, FLAG_COMPRESSED if compressed else 0, body
+
+
+def decode_payload(codec, flags, body):
+    """Восстанавливает сообщение из тела кадра."""
+    decoder = DECODERS.get(codec)
+    if decoder is None:
+        raise ProtocolError(f"Неизвестный формат сообщения: {codec}")
+    if flags & FLAG_COMPRESSED:
+        # Словарь, если он использовался, определяется по идентификатору в zlib-потоке
+        body = decompress(body)
+    return decoder(body)
+
+
+def send_message(sock, payload, request_id=0, more=False, codec=CODEC_JSON, policy=None, stats_key=None,
+                 zdict=None):
+    """
+    Сериализует, сжимает и отправляет сообщение одним кадром.
+    more=True помечает кадр как промежуточную часть потокового ответа.
+    """
+    codec, flags, body = encode_payload(payload, codec, policy, stats_key, zdict)
+    if more:
+        flags |= FLAG_MORE
+    send_frame(sock, body, codec, flags, request_id)
+
+
+def receive_message(sock, prefix=b""):
+    """
+    Получает один кадр и возвращает (request_id, flags, сообщение)
+    или None, если соединение закрыто.
+    """
+    frame = receive_frame(sock, prefix)
+    if frame is None:
+        return None
+    request_id, codec, flags, body = frame
+    return request_id, flags, decode_payload(codec, flags, body)
+
+
+def is_frame_prefix(data):
+    """Проверяет, что первые байты соединения - начало кадра, а не сообщение старого клиента."""
+    return bytes(data[:len(PROTOCOL_MAGIC)]) == PROTOCOL_MAGIC
+
+
+def receive_legacy_message(sock, prefix=b""):
+    """
+    Получает сообщение старого клиента: один zlib-поток с JSON без заголовка.
+    Конец сообщения определяется по концу zlib-потока.
+    """
+    decompressor = zlib.decompressobj()
+    chunks = [decompressor.decompress(prefix)] if prefix else []
+    buffer = bytearray(SMALL_MESSAGE_SIZE)
+    while not decompressor.eof:
+        count = sock.recv_into(buffer)
+        if count == 0:
+            raise ConnectionError("Соединение закрыто до получения всего сообщения")
+        chunks.append(decompressor.decompress(memoryview(buffer)[:count]))
+        if sum(len(chunk) for chunk in chunks) > MAX_MESSAGE_SIZE:
+            raise ProtocolError("Сообщение слишком большое")
+    return DECODERS[CODEC_JSON](b"".join(chunks))
+
+
+def encode_legacy_message(payload):
+    """Ответ старому клиенту: сжатый zlib JSON без заголовка."""
+    return zlib.compress(encode_json(payload))
+
+
+def send_legacy_message(sock, payload):
+    sock.sendall(encode_legacy_message(payload))
@@ -0,0 +1,235 @@
+# common/protocol/series_encoding.py
+"""
+Компактная передача числовых рядов (результаты ячеек "type": "list").
+
+Значения PAR_VALUE меняются от суток к суткам медленно, поэтому вместо списка
+чисел передается упакованный ряд:
+
+"delta" - для значений с фиксированным числом знаков после запятой: значения
+          умножаются на 10**decimals, и передаются разности соседних целых
+          в zigzag-варинтах (1-2 байта на значение вместо 8-18);
+"xor"   - для произвольных double: каждое значение передается как XOR с
+          предыдущим, без нулевых старших и младших байтов (упрощенный
+          побайтовый вариант XOR-кодирования Gorilla).
+
+Упакованные байты передаются строкой base64, поэтому ряд одинаково проходит
+и через JSON, и через двоичный кодек. Набор кодировок согласуется в HELLO;
+клиенту, не заявившему кодировки, ряды передаются обычными списками.
+"""
+import base64
+import math
+import struct
+
+# Кодировки рядов при согласовании, в порядке предпочтения
+SERIES_ENCODINGS = ("delta", "xor")
+
+# Ряды короче не упаковываются: выигрыш меньше служебных полей
+MIN_SERIES_LENGTH = 8
+# Наибольшее число знаков после запятой для кодировки "delta"
+MAX_DECIMALS = 6
+# Целые больше 2**53 не представимы в double точно
+_MAX_SCALED = 1 << 53
+
+_DOUBLE = struct.Struct(">d")
+_UINT64 = struct.Struct(">Q")
+
+
+class SeriesEncodingError(Exception):
+    """Ошибка разбора упакованного ряда."""
+
+
+def negotiate_encodings(offered_names):
+    """Выбирает общие с клиентом кодировки рядов (в порядке предпочтения сервера)."""
+    offered = set(offered_names or [])
+    return [name for name in SERIES_ENCODINGS if name in offered]
+
+
+def encode_series(values, encodings):
+    """
+    Упаковывает числовой ряд первой подходящей из разрешенных кодировок.
+    Возвращает результат ячейки ({"type": "list", "encoding": ..., "value": ...})
+    или None, если ряд не числовой или слишком короткий для упаковки.
+    """
+    if len(values) < MIN_SERIES_LENGTH or not encodings:
+        return None
+    if not all(type(value) in (int, float) for value in values):
+        return None
+
+    if "delta" in encodings:
+        encoded = _encode_delta(values)
+        if encoded is not None:
+            return encoded
+    if "xor" in encodings and all(math.isfinite(value) for value in values):
+        return _encode_xor(values)
+    return None
+
+
+def decode_series(cell_result):
+    """Возвращает список значений упакованного ряда из результата ячейки."""
+    encoding = cell_result.get("encoding")
+    try:
+        data = base64.b64decode(cell_result["value"])
+        count = cell_result["count"]
+        if encoding == "delta":
+            return _decode_delta(data, count, cell_result["decimals"], cell_result.get("integer", False))
+        if encoding == "xor":
+            return _decode_xor(data, count)
+    except (KeyError, ValueError, IndexError, struct.error) as e:
+        raise SeriesEncodingError(f"Некорректный упакованный ряд: {e}")
+    raise SeriesEncodingError(f"Неизвестная кодировка ряда: {encoding}")
+
+
+def decode_cell_result(cell_result):
+    """Результат ячейки с распакованным рядом; неупакованные результаты возвращаются как есть."""
+    if not isinstance(cell_result, dict) or "encoding" not in cell_result:
+        return cell_result
+    decoded = {key: value for key, value in cell_result.items()
+               if key not in ("encoding", "count", "decimals", "integer")}
+    decoded["value"] = decode_series(cell_result)
+    return decoded
+
+
+# --- delta + zigzag varint -----------------------------------------------------------
+
+def _decimals_for(values):
+    """Наименьшее число знаков после запятой, при котором все значения восстанавливаются точно."""
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        for value in values:
+            scaled = round(value * scale)
+            if abs(scaled) >= _MAX_SCALED or scaled / scale != value:
+                break
+        else:
+            return decimals
+    return None
+
+
+def _encode_delta(values):
+    integer = all(type(value) is int for value in values)
+    if integer:
+        if any(abs(value) >= 1 << 63 for value in values):
+            return None
+        decimals = 0
+    else:
+        # NaN и бесконечности в целые не переводятся: такой ряд передается xor или списком
+        if not all(math.isfinite(value) for value in values):
+            return None
+        decimals = _decimals_for(values)
+        if decimals is None:
+            return None
+
+    scale = 10 ** decimals
+    data = bytearray()
+    previous = 0
+    for value in values:
+        scaled = value if integer else round(value * scale)
+        _write_varint(data, _zigzag(scaled - previous))
+        previous = scaled
+
+    result = {
+        "type": "list",
+        "encoding": "delta",
+        "count": len(values),
+        "decimals": decimals,
+        "value": base64.b64encode(data).decode("ascii"),
+    }
+    if integer:
+        result["integer"] = True
+    return result
+
+
+def _decode_delta(data, count, decimals, integer):
+    scale = 10 ** decimals
+    values = []
+    offset = 0
+    current = 0
+    for _ in range(count):
+        delta, offset = _read_varint(data, offset)
+        current += _unzigzag(delta)
+        values.append(current if integer else current / scale)
+    if offset != len(data):
+        raise SeriesEncodingError("Лишние данные после конца ряда")
+    return values
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+def _write_varint(data, value):
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+# --- XOR double --------------------------------------------------------------------
+
+def _encode_xor(values):
+    """
+    Каждое значение - XOR его битов с битами предыдущего. Байт-заголовок содержит
+    число нулевых старших (старшие 4 бита) и младших (младшие 4 бита) байтов,
+    за ним следуют только значащие байты. Совпадающее значение занимает один байт.
+    """
+    data = bytearray()
+    previous = 0
+    for value in values:
+        bits = _UINT64.unpack(_DOUBLE.pack(float(value)))[0]
+        xor = bits ^ previous
+        previous = bits
+        if xor == 0:
+            data.append(0x80)
+            continue
+        raw = _UINT64.pack(xor)
+        leading = len(raw) - len(raw.lstrip(b"\0"))
+        trailing = len(raw) - len(raw.rstrip(b"\0"))
+        data.append(leading << 4 | trailing)
+        data += raw[leading:len(raw) - trailing]
+
+    return {
+        "type": "list",
+        "encoding": "xor",
+        "count": len(values),
+        "value": base64.b64encode(data).decode("ascii"),
+    }
+
+
+def _decode_xor(data, count):
+    values = []
+    offset = 0
+    previous = 0
+    for _ in range(count):
+        header = data[offset]
+        offset += 1
+        leading, trailing = header >> 4, header & 0x0F
+        if leading + trailing > 8:
+            raise SeriesEncodingError("Некорректный заголовок значения")
+        size = 8 - leading - trailing
+        if leading + trailing < 8:
+            if offset + size > len(data):
+                raise SeriesEncodingError("Неожиданный конец ряда")
+            xor = int.from_bytes(data[offset:offset + size], "big") << (8 * trailing)
+            offset += size
+        else:
+            xor = 0
+        previous ^= xor
+        values.append(_DOUBLE.unpack(_UINT64.pack(previous))[0])
+    if offset != len(data):
+        raise SeriesEncodingError("Лишние данные после конца ряда")
+    return values
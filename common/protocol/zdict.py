@@ -0,0 +1,216 @@
+# common/protocol/zdict.py
+"""
+Версионированные предустановленные словари zlib (zdict) для сообщений URD.
+
+Сообщения шаблонов и отчетов тысячи раз повторяют одни и те же ключи
+(cell_name, config, background_color, text_tilt, merger ...). Словарь,
+обученный на реальном трафике, заранее содержит эти строки, поэтому даже
+небольшие сообщения сжимаются хорошо без изменения схемы JSON.
+
+Словари хранятся файлами zdicts/v<версия>.zdict и никогда не меняются:
+новый словарь добавляется новой версией. Версия согласуется в HELLO,
+а в самом zlib-потоке записывается идентификатор словаря (adler32),
+по которому получатель находит нужный словарь.
+
+Обучение словаря на сохраненных образцах трафика:
+    python -m common.protocol.zdict train <каталог образцов> <файл словаря>
+"""
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import Counter
+
+ZDICT_DIR = os.path.join(os.path.dirname(__file__), "zdicts")
+
+# Максимальный размер словаря: окно zlib - 32 КБ
+MAX_ZDICT_SIZE = 32 * 1024
+
+
+def _load_dictionaries():
+    dictionaries = {}
+    if not os.path.isdir(ZDICT_DIR):
+        return dictionaries
+    for file_name in os.listdir(ZDICT_DIR):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".zdict" and name.startswith("v") and name[1:].isdigit():
+            with open(os.path.join(ZDICT_DIR, file_name), "rb") as file:
+                dictionaries[int(name[1:])] = file.read()
+    return dictionaries
+
+
+# {версия: словарь}
+DICTIONARIES = _load_dictionaries()
+# {adler32 словаря: словарь} - для распаковки по идентификатору из zlib-потока
+DICTIONARIES_BY_ID = {zlib.adler32(data): data for data in DICTIONARIES.values()}
+
+
+def supported_versions():
+    return sorted(DICTIONARIES, reverse=True)
+
+
+def negotiate_version(offered_versions):
+    """Выбирает наибольшую общую версию словаря или None, если общих нет."""
+    common = set(offered_versions or []) & set(DICTIONARIES)
+    return max(common) if common else None
+
+
+def dictionary_for_stream(body):
+    """
+    Возвращает словарь, которым сжат zlib-поток, или None, если словарь не использовался.
+    Идентификатор словаря (DICTID) записан в заголовке потока при установленном бите FDICT.
+    """
+    if len(body) < 6 or not body[1] & 0x20:
+        return None
+    dictionary_id = struct.unpack_from("!I", body, 2)[0]
+    dictionary = DICTIONARIES_BY_ID.get(dictionary_id)
+    if dictionary is None:
+        raise zlib.error(f"Неизвестный словарь сжатия: {dictionary_id:#010x}")
+    return dictionary
+
+
+def decompress(body):
+    """Распаковывает zlib-поток, сжатый со словарем или без него."""
+    dictionary = dictionary_for_stream(body)
+    if dictionary is None:
+        return zlib.decompress(body)
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    data = decompressor.decompress(body)
+    if not decompressor.eof:
+        raise zlib.error("Неполный zlib-поток")
+    return data
+
+
+# --- Обучение словаря ----------------------------------------------------------------
+
+def train_dictionary(samples, size=MAX_ZDICT_SIZE, segment_length=24, stride=4, overlap_length=8,
+                     max_overlap=0.5):
+    """
+    Строит словарь из образцов сообщений (несжатых тел кадров).
+
+    Отрезки длины segment_length, встречающиеся в образцах чаще всего, отбираются
+    жадно, пока не заполнен размер словаря. Соседние отрезки одного места сообщения
+    сдвинуты на stride и почти совпадают, поэтому в словарь они не копируются целиком:
+    отрезок, начало которого совпадает с концом уже выбранной цепочки (или конец -
+    с началом), продолжает ее только своей новой частью. Отрезок, который не продолжает
+    цепочку и больше чем на долю max_overlap состоит из подстрок длины overlap_length,
+    уже имеющихся в словаре, пропускается. Цепочки с самыми частыми отрезками ставятся
+    в конец словаря: zlib кодирует ссылки на близкие позиции короче.
+    """
+    counts = Counter()
+    for sample in samples:
+        seen = set()
+        for offset in range(0, max(len(sample) - segment_length, 0) + 1, stride):
+            segment = bytes(sample[offset:offset + segment_length])
+            if segment not in seen:
+                seen.add(segment)
+                # Отрезок учитывается один раз на образец: важна повторяемость между сообщениями
+                counts[segment] += 1
+
+    # Длины совпадения соседних отрезков, по которым цепочки продолжаются
+    overlaps = [length for length in range(segment_length - stride, overlap_length - 1, -stride)]
+    chains = []
+    # {длина: {конец цепочки: номер}} и {длина: {начало цепочки: номер}}
+    ends = {length: {} for length in overlaps}
+    starts = {length: {} for length in overlaps}
+    covered = set()
+    chosen_size = 0
+
+    def index_chain(number, add):
+        chain = chains[number]
+        for length in overlaps:
+            for index, key in ((ends, chain[-length:]), (starts, chain[:length])):
+                if add:
+                    index[length][key] = number
+                elif index[length].get(key) == number:
+                    del index[length][key]
+
+    def find(index, segment, from_end):
+        for length in overlaps:
+            key = segment[:length] if from_end else segment[-length:]
+            number = index[length].get(key)
+            if number is not None:
+                return number, length
+        return None, 0
+
+    for segment, count in counts.most_common():
+        if count < 2 or chosen_size >= size:
+            break
+        pieces = {segment[offset:offset + overlap_length]
+                  for offset in range(max(len(segment) - overlap_length, 0) + 1)}
+        if pieces <= covered:
+            continue
+        before, before_length = find(ends, segment, from_end=True)
+        after, after_length = find(starts, segment, from_end=False)
+        if after == before:
+            after = None
+        if before is None and after is None:
+            if len(pieces & covered) > max_overlap * len(pieces):
+                continue
+            chains.append(segment)
+            index_chain(len(chains) - 1, True)
+            added = len(segment)
+        else:
+            middle = segment[before_length:len(segment) - after_length]
+            if before is not None and after is not None:
+                # Отрезок соединяет две цепочки: вторая присоединяется к первой
+                index_chain(before, False)
+                index_chain(after, False)
+                chains[before] += middle + chains[after]
+                chains[after] = b""
+                index_chain(before, True)
+            elif before is not None:
+                index_chain(before, False)
+                chains[before] += segment[before_length:]
+                index_chain(before, True)
+            else:
+                index_chain(after, False)
+                chains[after] = segment[:len(segment) - after_length] + chains[after]
+                index_chain(after, True)
+            added = len(segment) - before_length - after_length
+        covered |= pieces
+        chosen_size += added
+
+    dictionary = b"".join(reversed([chain for chain in chains if chain]))
+    # Лишнее сверх размера отбрасывается с начала: там наименее полезные цепочки
+    return dictionary[-size:]
+
+
+class SampleRecorder:
+    """Сохраняет тела сообщений в каталог для последующего обучения словаря."""
+
+    def __init__(self, directory, max_samples=2000):
+        self.directory = directory
+        self.max_samples = max_samples
+        self.count = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, data, stats_key=None):
+        with self.lock:
+            if self.count >= self.max_samples:
+                return
+            self.count += 1
+            index = self.count
+        file_name = f"{stats_key or 'UNKNOWN'}_{index:06d}.bin"
+        with open(os.path.join(self.directory, file_name), "wb") as file:
+            file.write(data)
+
+
+def _load_samples(directory):
+    samples = []
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name), "rb") as file:
+            samples.append(file.read())
+    return samples
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "train":
+        print("Использование: python -m common.protocol.zdict train <каталог образцов> <файл словаря>")
+        sys.exit(1)
+    dictionary = train_dictionary(_load_samples(sys.argv[2]))
+    with open(sys.argv[3], "wb") as output:
+        output.write(dictionary)
+    print(f"Словарь {sys.argv[3]}: {len(dictionary)} байт, id {zlib.adler32(dictionary):#010x}")
@@ -1,12 +1,16 @@
 # URD/main_server.py
+import argparse
 import socket
 import threading
+from common.protocol.compression import CompressionPolicy
+from common.protocol.zdict import SampleRecorder
+from server.models.backends.factory import BACKEND_NAMES, create_backend
+from server.controllers.async_server import AsyncServerEngine
 from server.controllers.server_controller import ServerController
 
-def start_server():
-    server_controller = ServerController()  # Создаем экземпляр контроллера
+def start_server(server_controller, host='0.0.0.0', port=5000):
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind(('0.0.0.0', 5000))
+    server.bind((host, port))
     server.listen(5)
     print("Сервер запущен и ожидает подключений...")
 
@@ -14,10 +18,92 @@ def start_server():
         client_socket, addr = server.accept()
         print(f"Подключение от {addr}")
         client_handler = threading.Thread(
-            target=server_controller.handle_client,  # Используем метод экземпляра
-            args=(client_socket,)
+            target=server_controller.handle_client,  # Поток обслуживает всю сессию клиента
+            args=(client_socket, addr),
+            daemon=True
         )
         client_handler.start()
 
+def start_async_server(server_controller, host='0.0.0.0', port=5000, backlog=1024):
+    # Все соединения обслуживает один цикл событий, работа с БД идет в пуле обработчиков контроллера
+    engine = AsyncServerEngine(server_controller, host, port, backlog=backlog)
+    engine.run()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сервер URD")
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default="threads",
+                        help="threads - поток на соединение, asyncio - цикл событий и пул потоков для БД")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="mssql",
+                        help="Хранилище данных: mssql - MS SQL Server, sqlite - встроенные файлы SQLite")
+    parser.add_argument("--mssql-server", default="localhost", help="Адрес MS SQL Server")
+    parser.add_argument("--sqlite-dir", default="data",
+                        help="Каталог баз SQLite (создаются командой python -m server.models.backends.sqlite_backend init)")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", "--db-workers", dest="workers", type=int, default=8,
+                        help="Количество обработчиков запросов")
+    parser.add_argument("--queue-depth", type=int, default=64,
+                        help="Длина очереди запросов; при переполнении клиент получает ответ busy")
+    parser.add_argument("--retry-after-ms", type=int, default=200,
+                        help="Минимальная пауза перед повтором, сообщаемая клиенту в ответе busy")
+    parser.add_argument("--session-idle-timeout", type=float, default=300.0,
+                        help="Сессия клиента закрывается после стольких секунд без запросов")
+    parser.add_argument("--template-pool-min", type=int, default=1,
+                        help="Соединений с базой шаблонов, открываемых при запуске")
+    parser.add_argument("--template-pool-max", type=int, default=None,
+                        help="Наибольшее число соединений с базой шаблонов (по умолчанию --workers)")
+    parser.add_argument("--report-pool-min", type=int, default=1,
+                        help="Соединений с каждой базой параметров, открываемых при запуске")
+    parser.add_argument("--report-pool-max", type=int, default=None,
+                        help="Наибольшее число соединений с каждой базой параметров (по умолчанию --workers)")
+    parser.add_argument("--rollups", action="store_true",
+                        help="Вести итоги по суткам и месяцам и вычислять по ним агрегаты за длинные периоды")
+    parser.add_argument("--rollup-refresh-interval", type=float, default=900.0,
+                        help="Период обновления итогов, секунд")
+    parser.add_argument("--rollup-lookback-days", type=int, default=3,
+                        help="Сколько последних закрытых суток пересчитывать при обновлении итогов")
+    parser.add_argument("--quantile-exact-days", type=int, default=31,
+                        help="Квантили за периоды короче стольких суток считаются точно, а не по эскизам итогов")
+    parser.add_argument("--result-cache-mb", type=int, default=256,
+                        help="Объем кэша рядов и агрегатов шифров, МБ (0 - без кэша)")
+    parser.add_argument("--result-cache-closed-ttl", type=float, default=3600.0,
+                        help="Срок хранения результатов за закрытые периоды, секунд")
+    parser.add_argument("--result-cache-open-ttl", type=float, default=60.0,
+                        help="Срок хранения результатов за периоды, захватывающие текущие сутки, секунд")
+    parser.add_argument("--capture-zdict-samples", metavar="DIR",
+                        help="Сохранять образцы ответов в каталог для обучения словаря сжатия")
+    parser.add_argument("--backlog", type=int, default=1024,
+                        help="Длина очереди входящих подключений (только для asyncio)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    start_server()
+    args = parse_args()
+    sample_recorder = SampleRecorder(args.capture_zdict_samples) if args.capture_zdict_samples else None
+    if args.backend == "sqlite":
+        backend = create_backend("sqlite", directory=args.sqlite_dir)
+    else:
+        backend = create_backend("mssql", server=args.mssql_server)
+    server_controller = ServerController(  # Создаем экземпляр контроллера
+        session_idle_timeout=args.session_idle_timeout,
+        workers=args.workers,
+        queue_depth=args.queue_depth,
+        retry_after_ms=args.retry_after_ms,
+        compression_policy=CompressionPolicy(sample_recorder=sample_recorder),
+        report_pool_min=args.report_pool_min,
+        report_pool_max=args.report_pool_max,
+        template_pool_min=args.template_pool_min,
+        template_pool_max=args.template_pool_max,
+        backend=backend,
+        rollups=args.rollups,
+        rollup_refresh_interval=args.rollup_refresh_interval,
+        rollup_lookback_days=args.rollup_lookback_days,
+        quantile_exact_days=args.quantile_exact_days,
+        result_cache_bytes=args.result_cache_mb * 1024 * 1024,
+        result_cache_closed_ttl=args.result_cache_closed_ttl,
+        result_cache_open_ttl=args.result_cache_open_ttl
+    )
+    server_controller.warm_up()
+    if args.engine == "asyncio":
+        start_async_server(server_controller, args.host, args.port, args.backlog)
+    else:
+        start_server(server_controller, args.host, args.port)
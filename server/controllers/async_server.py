@@ -0,0 +1,239 @@
+# server/controllers/async_server.py
+import asyncio
+import time
+import zlib
+
+from common.protocol.codecs import CODEC_JSON
+from common.protocol.framing import (
+    FLAG_MORE, HEADER, MAX_MESSAGE_SIZE, PROTOCOL_MAGIC, SMALL_MESSAGE_SIZE, ProtocolError, decode_payload,
+    encode_legacy_message, encode_payload, is_frame_prefix, pack_header, unpack_header
+)
+from server.controllers.client_session import ResponseChannel
+
+
+class AsyncClientSession(asyncio.BufferedProtocol):
+    """
+    Сессия клиента в асинхронном движке сервера.
+
+    Кадры читаются прямо в заранее выделенные буферы (BufferedProtocol),
+    а обработка запросов (работа с БД) выполняется пулом обработчиков сервера,
+    поэтому простаивающее соединение не занимает отдельный поток.
+    Старый клиент без кадров определяется по первым байтам и обслуживается
+    в прежнем формате: один запрос и один ответ на соединение.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = engine.loop
+        self.transport = None
+        self.addr = None
+        self.last_activity = time.monotonic()
+        self.in_flight = 0
+        self.closed = False
+        self.codec = CODEC_JSON
+        self.zdict = None
+        self.series_encodings = ()
+        self.compression_policy = engine.server_controller.compression_policy
+        self.legacy = None
+        self.legacy_decompressor = None
+        self.legacy_chunks = []
+
+        self.header = bytearray(HEADER.size)
+        self.frame_header = None
+        self.buffer = self.header
+        self.received = 0
+
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+
+    # --- asyncio.BufferedProtocol ---------------------------------------------
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+        print(f"Подключение от {self.addr}")
+        self.engine.server_controller.sessions.add(self)
+
+    def get_buffer(self, sizehint):
+        return memoryview(self.buffer)[self.received:]
+
+    def buffer_updated(self, nbytes):
+        self.received += nbytes
+        self.last_activity = time.monotonic()
+
+        try:
+            if self.legacy is None and self.received >= len(PROTOCOL_MAGIC):
+                self.legacy = not is_frame_prefix(self.header)
+                if self.legacy:
+                    self._start_legacy()
+            if self.legacy:
+                self._legacy_data_received()
+                return
+            if self.received < len(self.buffer):
+                return
+
+            if self.frame_header is None:
+                self.frame_header = unpack_header(self.header)
+                self.buffer = bytearray(self.frame_header[3])
+                self.received = 0
+                if self.buffer:
+                    return
+            self._frame_received()
+        except (ProtocolError, zlib.error) as e:
+            print(f"Ошибка получения данных от клиента: {e}")
+            self.transport.close()
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.can_write.set()
+        self.engine.server_controller.sessions.remove(self)
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    # --- обработка запросов ---------------------------------------------------
+    def _frame_received(self):
+        request_id, codec, flags, _ = self.frame_header
+        body = self.buffer
+
+        self.frame_header = None
+        self.buffer = self.header
+        self.received = 0
+
+        self.request_started()
+        server_controller = self.engine.server_controller
+        if not server_controller.worker_pool.submit(
+                self.engine.process_frame, self, request_id, codec, flags, body):
+            self._request_finished()
+            self._write_now(request_id, server_controller.busy_response())
+
+    def _start_legacy(self):
+        """Переключает сессию на чтение сообщения старого клиента: zlib-поток без заголовка."""
+        self.legacy_decompressor = zlib.decompressobj()
+        self.buffer = bytearray(SMALL_MESSAGE_SIZE)
+        self.buffer[:self.received] = self.header[:self.received]
+
+    def _legacy_data_received(self):
+        data = memoryview(self.buffer)[:self.received]
+        self.received = 0
+        self.legacy_chunks.append(self.legacy_decompressor.decompress(data))
+        if sum(len(chunk) for chunk in self.legacy_chunks) > MAX_MESSAGE_SIZE:
+            raise ProtocolError("Сообщение слишком большое")
+        if not self.legacy_decompressor.eof:
+            return
+
+        # Сообщение получено целиком: больше данных от старого клиента не ждем
+        self.transport.pause_reading()
+        body = b"".join(self.legacy_chunks)
+        self.legacy_chunks = []
+        self.request_started()
+        server_controller = self.engine.server_controller
+        if not server_controller.worker_pool.submit(
+                self.engine.process_frame, self, 0, CODEC_JSON, 0, body):
+            self._request_finished()
+            self._write_now(0, server_controller.busy_response())
+
+    def _write_now(self, request_id, payload):
+        """Отправляет короткий ответ прямо из цикла событий, без ожидания буфера передачи."""
+        if self.legacy:
+            self.transport.write(encode_legacy_message(payload))
+            self.transport.close()
+            return
+        codec, flags, body = encode_payload(payload, self.codec, self.compression_policy, zdict=self.zdict)
+        self.transport.write(pack_header(request_id, codec, flags, len(body)))
+        self.transport.write(body)
+
+    def send(self, request_id, payload, more=False, request_type=None):
+        """
+        Отправляет ответ клиенту. Вызывается из потока пула:
+        сериализация выполняется в потоке, запись в сокет — в цикле событий.
+        Поток ждет, пока буфер передачи не освободится, что ограничивает память под ответы.
+        """
+        if self.legacy:
+            if more:
+                # Старый клиент не поддерживает потоковые ответы
+                return
+            data = encode_legacy_message(payload)
+            asyncio.run_coroutine_threadsafe(self._write(data, close=True), self.loop).result()
+            return
+
+        codec, flags, body = encode_payload(payload, self.codec, self.compression_policy, request_type, self.zdict)
+        if more:
+            flags |= FLAG_MORE
+        header = pack_header(request_id, codec, flags, len(body))
+        asyncio.run_coroutine_threadsafe(self._write(header, body), self.loop).result()
+        self.last_activity = time.monotonic()
+
+    async def _write(self, *chunks, close=False):
+        if self.closed:
+            raise ConnectionError("Соединение с клиентом закрыто")
+        for chunk in chunks:
+            self.transport.write(chunk)
+        if close:
+            # Оставшиеся в буфере данные будут отправлены перед закрытием
+            self.transport.close()
+            return
+        await self.can_write.wait()
+
+    # --- интерфейс сессии для SessionRegistry и ServerController -------------
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self):
+        self.loop.call_soon_threadsafe(self._request_finished)
+
+    def _request_finished(self):
+        self.in_flight -= 1
+        self.last_activity = time.monotonic()
+
+    def idle_time(self):
+        if self.in_flight:
+            return 0.0
+        return time.monotonic() - self.last_activity
+
+    def close(self):
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+
+class AsyncServerEngine:
+    """
+    Асинхронный движок сервера: один цикл событий обслуживает все соединения,
+    обработчики ServerController выполняются его пулом с ограниченной очередью.
+    """
+
+    def __init__(self, server_controller, host='0.0.0.0', port=5000, backlog=1024):
+        self.server_controller = server_controller
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.loop = None
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await self.loop.create_server(
+            lambda: AsyncClientSession(self), self.host, self.port, backlog=self.backlog
+        )
+        print("Сервер (asyncio) запущен и ожидает подключений...")
+        async with server:
+            await server.serve_forever()
+
+    def process_frame(self, session, request_id, codec, flags, body):
+        """Разбирает кадр и выполняет запрос. Выполняется в потоке пула."""
+        try:
+            request = decode_payload(codec, flags, body)
+        except Exception as e:
+            print(f"Ошибка получения данных от клиента: {e}")
+            session.request_finished()
+            session.close()
+            return
+        channel = ResponseChannel(session, request_id, request.get("type") if isinstance(request, dict) else None)
+        self.server_controller.process_request(channel, request)
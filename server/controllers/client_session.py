@@ -0,0 +1,200 @@
+# server/controllers/client_session.py
+import socket
+import threading
+import time
+
+from common.protocol.codecs import CODEC_JSON
+from common.protocol.compression import DEFAULT_POLICY
+from common.protocol.framing import (
+    PROTOCOL_MAGIC, is_frame_prefix, receive_legacy_message, receive_message, recv_exact, send_legacy_message,
+    send_message
+)
+
+
+class ClientSession:
+    """
+    Долгоживущее соединение с клиентом.
+    По одному сокету может идти несколько запросов одновременно,
+    ответы различаются по идентификатору запроса.
+
+    Старый клиент (без кадров) определяется по первым байтам соединения:
+    он отправляет один сжатый запрос, получает ответ в прежнем формате,
+    после чего соединение закрывается.
+    """
+
+    def __init__(self, client_socket, addr, compression_policy=DEFAULT_POLICY):
+        self.client_socket = client_socket
+        self.addr = addr
+        self.compression_policy = compression_policy
+        self.send_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.last_activity = time.monotonic()
+        self.in_flight = 0
+        self.closed = False
+        # Кодек и словарь сжатия ответов, выбранные при согласовании (HELLO); по умолчанию JSON без словаря
+        self.codec = CODEC_JSON
+        self.zdict = None
+        # Кодировки числовых рядов в результатах PARSE_CELL (common.protocol.series_encoding)
+        self.series_encodings = ()
+        # None - протокол еще не определен, True - старый клиент без кадров
+        self.legacy = None
+        self.legacy_response_sent = threading.Event()
+
+        # Обнаружение "мертвых" клиентов средствами TCP
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    def receive(self):
+        """Получает следующий запрос: (request_id, request) или None при закрытии соединения."""
+        if self.legacy is None:
+            prefix = recv_exact(self.client_socket, len(PROTOCOL_MAGIC))
+            self.legacy = not is_frame_prefix(prefix)
+            if self.legacy:
+                request = receive_legacy_message(self.client_socket, prefix)
+                self.touch()
+                return 0, request
+            message = receive_message(self.client_socket, prefix)
+        elif self.legacy:
+            # Старый клиент ждет единственный ответ, после него соединение закрывается
+            self.legacy_response_sent.wait()
+            return None
+        else:
+            message = receive_message(self.client_socket)
+
+        if message is None:
+            return None
+        self.touch()
+        request_id, _, request = message
+        return request_id, request
+
+    def send(self, request_id, payload, more=False, request_type=None):
+        """Отправляет ответ на запрос request_id. Кадры разных потоков не перемешиваются."""
+        with self.send_lock:
+            if self.legacy:
+                if more:
+                    # Старый клиент не поддерживает потоковые ответы
+                    return
+                send_legacy_message(self.client_socket, payload)
+                self.legacy_response_sent.set()
+            else:
+                send_message(self.client_socket, payload, request_id, more, self.codec,
+                             self.compression_policy, request_type, self.zdict)
+        self.touch()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def request_started(self):
+        with self.state_lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self.state_lock:
+            self.in_flight -= 1
+        self.touch()
+
+    def idle_time(self):
+        """Время простоя сессии в секундах; сессия с запросами в работе не простаивает."""
+        with self.state_lock:
+            if self.in_flight:
+                return 0.0
+        return time.monotonic() - self.last_activity
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.legacy_response_sent.set()
+        try:
+            # shutdown прерывает поток, заблокированный в recv на этом сокете
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client_socket.close()
+
+
+class ResponseChannel:
+    """Канал ответа на конкретный запрос сессии."""
+
+    def __init__(self, session, request_id, request_type=None):
+        self.session = session
+        self.request_id = request_id
+        # Тип запроса нужен для статистики сжатия ответов
+        self.request_type = request_type
+
+    def send(self, payload, more=False):
+        """Отправляет ответ; more=True - промежуточный кадр потокового ответа."""
+        self.session.send(self.request_id, payload, more, self.request_type)
+
+
+class CollectingChannel:
+    """
+    Канал ответа на подзапрос пакета (BATCH): ответ не отправляется клиенту,
+    а сохраняется, чтобы войти в общий ответ пакета. Промежуточные кадры
+    потокового ответа собираются в список "partials" итогового ответа.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.response = None
+        self.partials = []
+
+    def send(self, payload, more=False):
+        if more:
+            self.partials.append(payload)
+            return
+        self.response = payload
+        if self.partials and isinstance(payload, dict):
+            self.response = dict(payload, partials=self.partials)
+
+
+class SessionRegistry:
+    """Реестр активных сессий с фоновым закрытием простаивающих соединений."""
+
+    def __init__(self, idle_timeout=300.0, reap_interval=30.0):
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.reaped_count = 0
+        self.reaper = None
+
+    def add(self, session):
+        with self.lock:
+            self.sessions.add(session)
+
+    def remove(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def active_count(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def reap_idle(self):
+        """Закрывает сессии, простаивающие дольше idle_timeout. Возвращает их количество."""
+        with self.lock:
+            expired = [session for session in self.sessions
+                       if session.closed or session.idle_time() > self.idle_timeout]
+            for session in expired:
+                self.sessions.discard(session)
+
+        for session in expired:
+            print(f"Закрытие неактивной сессии {session.addr}")
+            session.close()
+        self.reaped_count += len(expired)
+        return len(expired)
+
+    def start_reaper(self):
+        if self.reaper is not None:
+            return
+        self.reaper = threading.Thread(target=self._reap_loop, name="session-reaper", daemon=True)
+        self.reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                print(f"Ошибка при очистке сессий: {e}")
+
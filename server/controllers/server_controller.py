@@ -1,80 +1,278 @@
 # server/controller/server_controller.py
 import datetime
-import json
-import zlib
-from server.models.template_db_model import TemplateDBModel
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.protocol.codecs import CODEC_NAMES, negotiate_codec
+from common.protocol.compression import CompressionPolicy
+from common.protocol.framing import PROTOCOL_VERSION
+from common.protocol.series_encoding import encode_series, negotiate_encodings
+from common.protocol.zdict import DICTIONARIES, negotiate_version, supported_versions
+from server.controllers.client_session import ClientSession, CollectingChannel, ResponseChannel, SessionRegistry
+from server.models.backends.factory import create_backend
+from server.models.connection_pool import ConnectionPool, ConnectionPoolRegistry
+from server.models.report_db_model import REPORT_DATABASES
+from server.models.result_cache import DEFAULT_CLOSED_TTL, DEFAULT_MAX_BYTES, DEFAULT_OPEN_TTL, ResultCache
+from server.models.series import Series
+from server.models.template_db_model import TEMPLATE_DATABASE, TemplateDBModel
+from server.services.rollup_service import RollupService
 from server.services.template_database_service import TemplateDatabaseService
+from server.services.worker_pool import WorkerPool
 
 
 class ServerController:
-    def __init__(self):
-        self.template_db_model = TemplateDBModel()
-        self.service_db = TemplateDatabaseService()
+    # Запросы, изменяющие данные: в пакете они выполняются строго по порядку
+    MUTATING_REQUEST_TYPES = {
+        "SAVE_TEMPLATE",
+        "UPDATE_TEMPLATE",
+        "DELETE_TEMPLATE",
+        "UPDATE_ACCESSIBLE_TEMPLATE_NAMES",
+    }
+    MAX_BATCH_SIZE = 256
+
+    def __init__(self, session_idle_timeout=300.0, workers=8, queue_depth=64, retry_after_ms=200, batch_workers=4,
+                 compression_policy=None, report_pool_min=1, report_pool_max=None,
+                 template_pool_min=1, template_pool_max=None, backend=None,
+                 rollups=False, rollup_refresh_interval=900.0, rollup_lookback_days=3,
+                 quantile_exact_days=31, result_cache_bytes=DEFAULT_MAX_BYTES,
+                 result_cache_closed_ttl=DEFAULT_CLOSED_TTL, result_cache_open_ttl=DEFAULT_OPEN_TTL):
+        # Хранилище данных: MS SQL Server по умолчанию или встроенный SQLite
+        self.backend = backend if backend is not None else create_backend()
+        # Каждый запрос к базе шаблонов получает свое соединение и свою транзакцию
+        self.template_pool = ConnectionPool(
+            TEMPLATE_DATABASE, lambda: self.backend.connect(TEMPLATE_DATABASE),
+            min_size=template_pool_min, max_size=template_pool_max or workers
+        )
+        self.template_db_model = TemplateDBModel(self.template_pool, self.backend)
+        # Пулы соединений с базами параметров: по умолчанию не больше одного соединения на обработчик
+        self.report_pools = ConnectionPoolRegistry(
+            self.backend.connect, min_size=report_pool_min, max_size=report_pool_max or workers
+        )
+        # Итоги по суткам и месяцам для агрегатов за длинные периоды
+        self.rollups = RollupService(
+            self.report_pools, self.backend,
+            lookback_days=rollup_lookback_days, refresh_interval=rollup_refresh_interval,
+            exact_max_days=quantile_exact_days
+        ) if rollups else None
+        # Общий кэш рядов и агрегатов: одни и те же шифры за те же периоды запрашиваются многими отчетами
+        self.result_cache = ResultCache(
+            max_bytes=result_cache_bytes, closed_ttl=result_cache_closed_ttl, open_ttl=result_cache_open_ttl
+        ) if result_cache_bytes else None
+        self.service_db = TemplateDatabaseService(self.report_pools, self.backend, self.rollups, self.result_cache)
+        self.sessions = SessionRegistry(idle_timeout=session_idle_timeout)
+        self.sessions.start_reaper()
+        # Все запросы выполняются фиксированным пулом с ограниченной очередью
+        self.worker_pool = WorkerPool(size=workers, queue_depth=queue_depth, retry_after_ms=retry_after_ms)
+        # Отдельный пул для подзапросов пакета: пакет уже занимает обработчик основного пула
+        # и не должен ждать место в его очереди
+        self.batch_executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix="batch")
+        # Сжатие ответов и его статистика по типам запросов
+        self.compression_policy = compression_policy or CompressionPolicy()
+
+        self.handlers = {
+            "HELLO": self.handle_hello,
+            "LOGIN": self.handle_login,
+            "GET_TEMPLATE_NAMES": self.handle_get_template_names,
+            "GET_TEMPLATE_DATA": self.handle_get_template_data,
+            "SAVE_TEMPLATE": self.handle_save_template,
+            "CHECK_TEMPLATE_EXISTS": self.handle_check_template_exists,
+            "UPDATE_TEMPLATE": self.handle_update_template,
+            "DELETE_TEMPLATE": self.handle_delete_template,
+            "PARSE_CELL": self.handle_parse_cell,
+            "PARSE_CELL_STREAM": self.handle_parse_cell_stream,
+            "USERS_NAMES" : self.handle_get_users_names,
+            "GET_ACCESSIBLE_TEMPLATE_NAMES": self.handle_accessible_template_names,
+            "UPDATE_ACCESSIBLE_TEMPLATE_NAMES": self.handle_update_accessible_template_names,
+            "SERVER_STATS": self.handle_server_stats,
+            "BATCH": self.handle_batch,
+        }
+
+    def warm_up(self):
+        """Заранее открывает соединения с базами шаблонов и параметров при запуске сервера."""
+        try:
+            self.template_pool.warm_up()
+            print(f"Пул соединений с {TEMPLATE_DATABASE} готов")
+        except Exception as e:
+            print(f"Не удалось подготовить пул соединений с {TEMPLATE_DATABASE}: {e}")
+        self.report_pools.warm_up(REPORT_DATABASES)
+        if self.rollups is not None:
+            try:
+                self.rollups.ensure_schema()
+                self.rollups.start_refresher()
+                print("Обновление итогов запущено")
+            except Exception as e:
+                print(f"Не удалось подготовить таблицы итогов: {e}")
 
-    def send_response_to_client(self, client_socket, response_data):
+    def send_response_to_client(self, channel, response_data):
         """Отправляет сжатый ответ клиенту."""
         try:
-            json_data = json.dumps(response_data, ensure_ascii=False).encode("UTF-8")
-            compressed_data = zlib.compress(json_data)
-            client_socket.sendall(compressed_data)
+            channel.send(response_data)
         except Exception as e:
             print(f"Ошибка отправки данных клиенту: {e}")
 
-    def receive_request_from_client(self, client_socket):
+    def receive_request_from_client(self, session):
         """Получает сжатый запрос от клиента и распаковывает его."""
         try:
-            compressed_request = client_socket.recv(8192)
-            request = json.loads(zlib.decompress(compressed_request).decode("UTF-8"))
-            return request
+            return session.receive()
         except Exception as e:
-            print(f"Ошибка получения данных от клиента: {e}")
+            if not session.closed:
+                print(f"Ошибка получения данных от клиента: {e}")
             return None
 
-    def handle_client(self, client_socket):
+    def handle_client(self, client_socket, addr=None):
+        """
+        Обслуживает сессию клиента: читает запросы, пока клиент не закроет соединение
+        или сессия не будет закрыта по простою. Запросы выполняются пулом обработчиков,
+        поэтому на одном соединении может быть несколько запросов в работе.
+        """
+        session = ClientSession(client_socket, addr, self.compression_policy)
+        self.sessions.add(session)
+        try:
+            while True:
+                message = self.receive_request_from_client(session)
+                if message is None:
+                    break
+                request_id, request = message
+                channel = ResponseChannel(
+                    session, request_id, request.get("type") if isinstance(request, dict) else None
+                )
+                session.request_started()
+                if not self.worker_pool.submit(self.process_request, channel, request):
+                    session.request_finished()
+                    self.send_response_to_client(channel, self.busy_response())
+        finally:
+            self.sessions.remove(session)
+            session.close()
+
+    def busy_response(self):
+        """Ответ на запрос, не принятый из-за переполнения очереди пула."""
+        return {
+            "status": "busy",
+            "message": "Сервер перегружен, повторите запрос позже",
+            "retry_after_ms": self.worker_pool.suggested_retry_after_ms(),
+        }
+
+    def process_request(self, channel, request):
+        """Выполняет один запрос сессии."""
+        try:
+            self.dispatch_request(channel, request)
+        finally:
+            channel.session.request_finished()
+
+    def dispatch_request(self, channel, request):
         """Обрабатывает запрос от клиента."""
         try:
-            request = self.receive_request_from_client(client_socket)
-            if not request:
-                return
             print(f"Received request: {request}")
 
             if isinstance(request, dict):
                 request_type = request.get("type", "")
                 data = request.get("data", "")
 
-                handlers = {
-                    "LOGIN": self.handle_login,
-                    "GET_TEMPLATE_NAMES": self.handle_get_template_names,
-                    "GET_TEMPLATE_DATA": self.handle_get_template_data,
-                    "SAVE_TEMPLATE": self.handle_save_template,
-                    "CHECK_TEMPLATE_EXISTS": self.handle_check_template_exists,
-                    "UPDATE_TEMPLATE": self.handle_update_template,
-                    "DELETE_TEMPLATE": self.handle_delete_template,
-                    "PARSE_CELL": self.handle_parse_cell,
-                    "USERS_NAMES" : self.handle_get_users_names,
-                    "GET_ACCESSIBLE_TEMPLATE_NAMES": self.handle_accessible_template_names,
-                    "UPDATE_ACCESSIBLE_TEMPLATE_NAMES": self.handle_update_accessible_template_names,
-                }
-
-                handler = handlers.get(request_type)
+                handler = self.handlers.get(request_type)
                 if handler:
-                    handler(client_socket, data)
+                    handler(channel, data)
                 else:
                     self.send_response_to_client(
-                        client_socket,
+                        channel,
                         {"status": "error", "message": "Unknown request type"},
                     )
             else:
                 self.send_response_to_client(
-                    client_socket,
+                    channel,
                     {"status": "error", "message": "Invalid request format"},
                 )
         except Exception as e:
             print(f"Ошибка обработки запроса: {e}")
-        finally:
-            client_socket.close()
+            self.send_response_to_client(channel, {"status": "error", "message": "Internal server error"})
 
-    def handle_login(self, client_socket, data):
+    def handle_hello(self, channel, data):
+        """
+        Согласование параметров соединения. Клиент перечисляет поддерживаемые кодеки
+        в порядке предпочтения, версии словарей сжатия и кодировки числовых рядов;
+        сервер выбирает первый общий кодек, наибольшую общую версию словаря и общие
+        кодировки рядов. Клиенты, не отправившие HELLO, продолжают работать в JSON
+        без словаря и получают ряды обычными списками.
+        """
+        data = data if isinstance(data, dict) else {}
+        codec_name, codec = negotiate_codec(data.get("codecs", []))
+        zdict_version = negotiate_version(data.get("zdicts", []))
+        series_encodings = negotiate_encodings(data.get("series", []))
+        response_data = {
+            "status": "success",
+            "protocol_version": PROTOCOL_VERSION,
+            "codec": codec_name,
+            "codecs": list(CODEC_NAMES),
+            "zdict": zdict_version,
+            "zdicts": supported_versions(),
+            "series": series_encodings,
+        }
+        # Ответ на HELLO еще отправляется прежними параметрами, новые действуют со следующего ответа
+        self.send_response_to_client(channel, response_data)
+        channel.session.codec = codec
+        channel.session.zdict = DICTIONARIES.get(zdict_version)
+        channel.session.series_encodings = tuple(series_encodings)
+
+    def handle_batch(self, channel, requests):
+        """
+        Обрабатывает пакет запросов и возвращает список ответов в том же порядке.
+        Независимые (читающие) подзапросы выполняются параллельно, изменяющие данные
+        выполняются по одному после завершения всех предыдущих подзапросов.
+        """
+        if not isinstance(requests, list):
+            self.send_response_to_client(channel, {"status": "error", "message": "Invalid batch format"})
+            return
+        if len(requests) > self.MAX_BATCH_SIZE:
+            self.send_response_to_client(
+                channel, {"status": "error", "message": f"Batch is limited to {self.MAX_BATCH_SIZE} requests"}
+            )
+            return
+
+        responses = [None] * len(requests)
+        running = []
+
+        def wait_running():
+            for index, sub_channel, future in running:
+                future.result()
+                responses[index] = sub_channel.response
+            running.clear()
+
+        for index, sub_request in enumerate(requests):
+            sub_channel = CollectingChannel(channel.session)
+            request_type = sub_request.get("type") if isinstance(sub_request, dict) else None
+
+            if request_type == "BATCH":
+                responses[index] = {"status": "error", "message": "Nested batch is not allowed"}
+            elif request_type in self.MUTATING_REQUEST_TYPES:
+                wait_running()
+                self.dispatch_request(sub_channel, sub_request)
+                responses[index] = sub_channel.response
+            else:
+                future = self.batch_executor.submit(self.dispatch_request, sub_channel, sub_request)
+                running.append((index, sub_channel, future))
+        wait_running()
+
+        self.send_response_to_client(channel, {"status": "success", "responses": responses})
+
+    def handle_server_stats(self, channel, _):
+        """Возвращает состояние пулов обработчиков и соединений, сессий и статистику сжатия ответов."""
+        response_data = {
+            "status": "success",
+            "worker_pool": self.worker_pool.stats(),
+            "sessions": {
+                "active": self.sessions.active_count(),
+                "reaped": self.sessions.reaped_count,
+            },
+            "compression": self.compression_policy.stats.snapshot(),
+            "template_db_pool": self.template_pool.stats(),
+            "report_db_pools": self.report_pools.stats(),
+        }
+        if self.rollups is not None:
+            response_data["rollups_refreshed_to"] = self.rollups.stats()
+        if self.result_cache is not None:
+            response_data["result_cache"] = self.result_cache.stats()
+        self.send_response_to_client(channel, response_data)
+
+    def handle_login(self, channel, data):
         """Обрабатывает запрос на вход в систему."""
         username = data.get("username")
         password = data.get("password")
@@ -96,27 +294,27 @@ class ServerController:
             response_data = {"status": "error", "message": "Произошла неизвестная ошибка."}
 
         # Отправка ответа клиенту
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_get_users_names(self, client_socket, _):
+    def handle_get_users_names(self, channel, _):
         users_name = self.template_db_model.get_users_names()
         response_data = (
             {"status": "success", "users_names": users_name}
             if users_name
             else {"status": "error", "message": "No templates found"}
         )
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_accessible_template_names(self, client_socket, user_name):
+    def handle_accessible_template_names(self, channel, user_name):
         templates_names = self.template_db_model.get_accessible_template_names(user_name)
         response_data = (
             {"status": "success", "users_names": templates_names}
             if templates_names
             else {"status": "error", "message": "No templates found"}
         )
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_update_accessible_template_names(self, client_socket, change_data):
+    def handle_update_accessible_template_names(self, channel, change_data):
         print("in server_controller")
         print(change_data)
         template_name = change_data["template_name"]
@@ -129,9 +327,9 @@ class ServerController:
             if result
             else {"status": "error", "message": "No templates found"}
         )
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_get_template_names(self, client_socket, _):
+    def handle_get_template_names(self, channel, _):
         """Обрабатывает запрос на получение имен шаблонов."""
         template_names = self.template_db_model.get_template_names()
         response_data = (
@@ -139,9 +337,9 @@ class ServerController:
             if template_names
             else {"status": "error", "message": "No templates found"}
         )
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_get_template_data(self, client_socket, template_name):
+    def handle_get_template_data(self, channel, template_name):
         """Обрабатывает запрос на получение данных шаблона."""
         template_info = self.template_db_model.get_template_info(template_name)
         if template_info:
@@ -154,9 +352,9 @@ class ServerController:
             }
         else:
             response_data = {"status": "error", "message": "Template not found"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_save_template(self, client_socket, data):
+    def handle_save_template(self, channel, data):
         """Обрабатывает запрос на сохранение шаблона."""
         template_name = data.get("template_name")
         row_count = data.get("row_count")
@@ -168,16 +366,16 @@ class ServerController:
             template_name, row_count, col_count, cell_data, creation_date, background_color
         )
         response_data = {"status": "success"} if success else {"status": "failure"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_check_template_exists(self, client_socket, data):
+    def handle_check_template_exists(self, channel, data):
         """Обрабатывает запрос на проверку существования шаблона."""
         template_name = data.get("template_name")
         template_exists = self.template_db_model.template_exists(template_name)
         response_data = {"status": "exists"} if template_exists else {"status": "not_exists"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_update_template(self, client_socket, data):
+    def handle_update_template(self, channel, data):
         """Обрабатывает запрос на обновление шаблона."""
         template_name = data.get("template_name")
         row_count = data.get("row_count")
@@ -189,15 +387,15 @@ class ServerController:
             template_name, row_count, col_count, cell_data, creation_date, background_color
         )
         response_data = {"status": "success"} if success else {"status": "failure"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_delete_template(self, client_socket, template_name):
+    def handle_delete_template(self, channel, template_name):
         """Обрабатывает запрос на удаление шаблона."""
         success = self.template_db_model.delete_template(template_name)
         response_data = {"status": "success"} if success else {"status": "failure"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
-    def handle_parse_cell(self, client_socket, cell_data):
+    def handle_parse_cell(self, channel, cell_data):
         """
         Обрабатывает запрос на парсинг данных в ячейках.
         """
@@ -205,45 +403,85 @@ class ServerController:
             "cell_value": {}
         }
 
+        # Каждый шифр всех формул запроса получаем из БД один раз
+        prefetched = self.service_db.prefetch_parameters(
+            cell_data["cell_value"].values(), cell_data["start_time"], cell_data["end_time"]
+        )
+
         # Проходим по каждой ячейке
         for cell_name, cell_expression in cell_data["cell_value"].items():
-            # Используем сервис для обработки значения ячейки
-            parsed_result = self.service_db.handle_parse(cell_expression, cell_data["start_time"],
-                                                         cell_data["end_time"])
-            print(parsed_result)
-            # Если результат — это словарь, извлекаем значение по ключу
-            if isinstance(parsed_result, dict):
-                # Переходим к первому значению словаря
-                key, value = next(iter(parsed_result.items()))
-                parsed_result = value
-
-                # Проверяем, является ли результат списком или одиночным значением
-            if isinstance(parsed_result, list):
-                if len(parsed_result) > 1:
-                    # Если это список с несколькими значениями
-                    result["cell_value"][cell_name] = {
-                        "type": "list",
-                        "value": parsed_result
-                    }
-                elif len(parsed_result) == 1:
-                    # Если это список с одним значением
-                    result["cell_value"][cell_name] = {
-                        "type": "single",
-                        "value": parsed_result[0]
-                    }
-                else:
-                    # Пустой список
-                    result["cell_value"][cell_name] = {
-                        "type": "single",
-                        "value": None
-                    }
-            else:
-                # Если результат — одиночное значение
-                result["cell_value"][cell_name] = {
-                    "type": "single",
-                    "value": parsed_result
-                }
+            result["cell_value"][cell_name] = self.encode_cell_result(channel, self.parse_cell_value(
+                cell_expression, cell_data["start_time"], cell_data["end_time"], prefetched
+            ))
         # Формируем ответ
         response_data = result if result["cell_value"] else {"status": "error", "message": "No data parsed"}
-        self.send_response_to_client(client_socket, response_data)
+        self.send_response_to_client(channel, response_data)
 
+    def handle_parse_cell_stream(self, channel, cell_data):
+        """
+        Потоковый вариант PARSE_CELL: результат каждой ячейки отправляется отдельным
+        промежуточным кадром сразу после вычисления, в конце - итоговый кадр со сводкой.
+        """
+        cell_values = cell_data["cell_value"]
+        if not cell_values:
+            self.send_response_to_client(channel, {"status": "error", "message": "No data parsed"})
+            return
+
+        started = time.perf_counter()
+        prefetched = self.service_db.prefetch_parameters(
+            cell_values.values(), cell_data["start_time"], cell_data["end_time"]
+        )
+        error_count = 0
+        for cell_name, cell_expression in cell_values.items():
+            cell_result = self.parse_cell_value(cell_expression, cell_data["start_time"], cell_data["end_time"],
+                                                prefetched)
+            if isinstance(cell_result["value"], str) and cell_result["value"].startswith("[ERROR"):
+                error_count += 1
+            channel.send(dict(self.encode_cell_result(channel, cell_result), cell_name=cell_name), more=True)
+
+        summary = {
+            "status": "success",
+            "cell_count": len(cell_values),
+            "error_count": error_count,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        }
+        self.send_response_to_client(channel, summary)
+
+    def encode_cell_result(self, channel, cell_result):
+        """Упаковывает ряд значений ячейки, если клиент согласовал кодировки рядов."""
+        if cell_result["type"] != "list":
+            return cell_result
+        encoded = encode_series(cell_result["value"], channel.session.series_encodings)
+        return encoded if encoded is not None else cell_result
+
+    def parse_cell_value(self, cell_expression, start_time, end_time, prefetched=None):
+        """
+        Вычисляет значение одной ячейки и возвращает его в виде {"type": ..., "value": ...}.
+        prefetched - значения шифров, общие для всех ячеек запроса.
+        """
+        # Используем сервис для обработки значения ячейки
+        parsed_result = self.service_db.handle_parse(cell_expression, start_time, end_time, prefetched)
+        print(parsed_result)
+        # Если результат — это словарь, извлекаем значение по ключу
+        if isinstance(parsed_result, dict):
+            # Переходим к первому значению словаря
+            key, value = next(iter(parsed_result.items()))
+            parsed_result = value
+
+        # Ряд шифра передается клиенту списком значений
+        if isinstance(parsed_result, Series):
+            parsed_result = parsed_result.tolist()
+
+        # Проверяем, является ли результат списком или одиночным значением
+        if isinstance(parsed_result, list):
+            if len(parsed_result) > 1:
+                # Если это список с несколькими значениями
+                return {"type": "list", "value": parsed_result}
+            elif len(parsed_result) == 1:
+                # Если это список с одним значением
+                return {"type": "single", "value": parsed_result[0]}
+            else:
+                # Пустой список
+                return {"type": "single", "value": None}
+        # Если результат — одиночное значение
+        return {"type": "single", "value": parsed_result}
@@ -0,0 +1,17 @@
+# server/models/backends/factory.py
+
+BACKEND_NAMES = ("mssql", "sqlite")
+
+
+def create_backend(name="mssql", **options):
+    """
+    Создает хранилище по имени. Модули импортируются при выборе, поэтому
+    для работы на SQLite драйвер pymssql не требуется.
+    """
+    if name == "mssql":
+        from server.models.backends.mssql_backend import MSSQLBackend
+        return MSSQLBackend(**options)
+    if name == "sqlite":
+        from server.models.backends.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(**options)
+    raise ValueError(f"Неизвестное хранилище: {name}")
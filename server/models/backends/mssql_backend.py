@@ -0,0 +1,53 @@
+# server/models/backends/mssql_backend.py
+import pymssql
+
+from server.models.statement import StatementCache
+
+
+class MSSQLBackend:
+    """
+    Хранилище на MS SQL Server (pymssql).
+
+    Строки результатов возвращаются словарями, параметры запросов передаются как %s.
+    pymssql подставляет параметры в текст запроса на стороне клиента, поэтому
+    запросы Statement выполняются через sp_executesql: текст самого запроса
+    постоянен, и SQL Server переиспользует его план для любых значений.
+    """
+
+    name = "mssql"
+    Error = pymssql.Error
+
+    def __init__(self, server='localhost', charsets=None, default_charset='cp1251'):
+        self.server = server
+        # Кодировка соединения по базе данных: база шаблонов хранит текст в UTF-8
+        self.charsets = charsets if charsets is not None else {"DB_URD": "utf8"}
+        self.default_charset = default_charset
+        self.statements = StatementCache(self.prepare)
+
+    def connect(self, db):
+        """Открывает новое соединение с базой данных db."""
+        return pymssql.connect(
+            server=self.server,
+            database=db,
+            as_dict=True,
+            charset=self.charsets.get(db, self.default_charset)
+        )
+
+    def prepare(self, statement):
+        """Текст вызова sp_executesql для запроса statement (значения передаются как %(имя)s)."""
+        if not statement.params:
+            return statement.sql
+        # Текст запроса - строковый литерал T-SQL внутри шаблона pymssql
+        sql = statement.sql.replace("'", "''").replace("%", "%%")
+        declarations = ", ".join(f"@{name} {sql_type}" for name, sql_type in statement.params)
+        assignments = ", ".join(f"@{name} = %({name})s" for name, _ in statement.params)
+        return f"EXEC sp_executesql N'{sql}', N'{declarations}', {assignments}"
+
+    def execute(self, cursor, statement, **values):
+        """Выполняет запрос statement на курсоре cursor."""
+        params = statement.bind(**values)
+        cursor.execute(self.statements.text(statement), params or None)
+
+    def execute_many(self, cursor, statement, rows):
+        """Выполняет запрос statement для каждого словаря значений из rows."""
+        cursor.executemany(self.statements.text(statement), [statement.bind(**row) for row in rows])
@@ -0,0 +1,381 @@
+# server/models/backends/sqlite_backend.py
+"""
+Встроенное хранилище на SQLite с теми же схемами, что и базы MS SQL Server.
+
+Каждая база (DB_URD, DB_NN_*) - отдельный файл <каталог>/<база>.sqlite3.
+Соединения ведут себя как соединения pymssql с as_dict=True: строки - словари,
+параметры передаются как %s, префикс схемы dbo. допускается. Это позволяет
+запускать сервер, кэши и нагрузочные тесты на одной машине без SQL Server.
+Даты хранятся текстом ISO 8601 и сравниваются как строки, поэтому даты в запросах
+и параметры типа datetime приводятся к полному виду 'yyyy-MM-dd HH:mm:ss': граница
+'2024-02-01' включает отметку '2024-02-01 00:00:00', как в SQL Server.
+
+Создание баз (с --demo - с тестовыми данными за год):
+    python -m server.models.backends.sqlite_backend init <каталог> [--demo]
+"""
+import datetime
+import os
+import random
+import re
+import sqlite3
+import sys
+from functools import lru_cache
+
+from server.models.statement import PARAMETER_PATTERN, StatementCache
+
+SCHEMAS = {
+    "DB_URD": """
+        CREATE TABLE IF NOT EXISTS Users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS Templates (
+            template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            creation_date TEXT,
+            row_count INTEGER,
+            column_count INTEGER,
+            background_color TEXT
+        );
+        CREATE TABLE IF NOT EXISTS TemplateCells (
+            cell_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_id INTEGER NOT NULL REFERENCES Templates (template_id),
+            cell_name TEXT NOT NULL,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS IX_TemplateCells_template ON TemplateCells (template_id, cell_name);
+        CREATE TABLE IF NOT EXISTS TemplateCellConfigurations (
+            cell_id INTEGER NOT NULL REFERENCES TemplateCells (cell_id),
+            background_color TEXT,
+            height INTEGER,
+            width INTEGER,
+            text_color TEXT,
+            font TEXT,
+            format TEXT,
+            text_tilt INTEGER,
+            underline INTEGER,
+            text_size INTEGER,
+            cell_name TEXT,
+            merger TEXT,
+            bold INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS IX_TemplateCellConfigurations_cell ON TemplateCellConfigurations (cell_id);
+        CREATE TABLE IF NOT EXISTS AvailableTemplates (
+            user_id INTEGER NOT NULL REFERENCES Users (user_id),
+            template_id INTEGER NOT NULL REFERENCES Templates (template_id)
+        );
+        CREATE INDEX IF NOT EXISTS IX_AvailableTemplates_user ON AvailableTemplates (user_id);
+    """,
+    "DB_NN_Analytical_data": """
+        CREATE TABLE IF NOT EXISTS Lab_products (
+            PROD_ID INTEGER PRIMARY KEY,
+            PROD_NAME TEXT
+        );
+        CREATE TABLE IF NOT EXISTS lab_elements (
+            el_id INTEGER PRIMARY KEY,
+            el_name TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lab_sequences (
+            seq_id INTEGER NOT NULL,
+            el_id INTEGER NOT NULL REFERENCES lab_elements (el_id),
+            el_vpos INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS Lab_data (
+            PROD_ID INTEGER NOT NULL,
+            LEVEL_ID INTEGER NOT NULL,
+            SEQ_ID INTEGER,
+            PROD_TIME TIMESTAMP NOT NULL,
+            Q REAL,
+            EL1 REAL, EL2 REAL, EL3 REAL, EL4 REAL, EL5 REAL, EL6 REAL, EL7 REAL,
+            EL8 REAL, EL9 REAL, EL10 REAL, EL11 REAL, EL12 REAL, EL13 REAL, EL14 REAL
+        );
+        CREATE INDEX IF NOT EXISTS IX_Lab_data_prod ON Lab_data (PROD_ID, LEVEL_ID, PROD_TIME);
+    """,
+    "DB_NN_Technological_data": """
+        CREATE TABLE IF NOT EXISTS Units (
+            UNIT_ID INTEGER PRIMARY KEY,
+            UNIT_NAME TEXT
+        );
+        CREATE TABLE IF NOT EXISTS Tech_config (
+            PAR_ID INTEGER PRIMARY KEY,
+            NAME TEXT,
+            UNIT INTEGER REFERENCES Units (UNIT_ID)
+        );
+        CREATE TABLE IF NOT EXISTS Tech_time_day (
+            PAR_TIME_ID INTEGER PRIMARY KEY,
+            PAR_TIME TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS IX_Tech_time_day_time ON Tech_time_day (PAR_TIME);
+        CREATE TABLE IF NOT EXISTS Tech_data_day (
+            PAR_ID INTEGER NOT NULL,
+            PAR_TIME_ID INTEGER NOT NULL REFERENCES Tech_time_day (PAR_TIME_ID),
+            PAR_VALUE REAL
+        );
+        CREATE INDEX IF NOT EXISTS IX_Tech_data_day_par ON Tech_data_day (PAR_ID, PAR_TIME_ID);
+    """,
+    "DB_NN_Xline_data": """
+        CREATE TABLE IF NOT EXISTS Units (
+            UNIT_ID INTEGER PRIMARY KEY,
+            UNIT_NAME TEXT
+        );
+        CREATE TABLE IF NOT EXISTS Xline_config (
+            PAR_ID INTEGER PRIMARY KEY,
+            NAME TEXT,
+            UNIT INTEGER REFERENCES Units (UNIT_ID)
+        );
+        CREATE TABLE IF NOT EXISTS Xline_time_day (
+            PAR_TIME_ID INTEGER PRIMARY KEY,
+            PAR_TIME TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS IX_Xline_time_day_time ON Xline_time_day (PAR_TIME);
+        CREATE TABLE IF NOT EXISTS Xline_data_day (
+            PAR_ID INTEGER NOT NULL,
+            PAR_TIME_ID INTEGER NOT NULL REFERENCES Xline_time_day (PAR_TIME_ID),
+            PAR_VALUE REAL
+        );
+        CREATE INDEX IF NOT EXISTS IX_Xline_data_day_par ON Xline_data_day (PAR_ID, PAR_TIME_ID);
+    """,
+}
+
+# Префикс схемы SQL Server: в SQLite схема dbo не нужна
+_SCHEMA_PREFIX = re.compile(r"\bdbo\.", re.IGNORECASE)
+# Дата или отметка времени в кавычках внутри текста запроса
+_DATETIME_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?)'")
+
+
+def _parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+# Даты хранятся текстом ISO 8601 и читаются как datetime, как в pymssql
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+
+
+def normalize_datetime(value):
+    """
+    Значение даты в виде, в котором даты хранятся в базе:
+    '2024-02-01' и '2024-02-01T00:00:00' становятся '2024-02-01 00:00:00'.
+    """
+    if isinstance(value, datetime.datetime):
+        return _adapt_datetime(value)
+    if isinstance(value, datetime.date):
+        return _adapt_datetime(datetime.datetime.combine(value, datetime.time()))
+    if isinstance(value, str):
+        try:
+            return _adapt_datetime(datetime.datetime.fromisoformat(value.strip()))
+        except ValueError:
+            return value
+    return value
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+@lru_cache(maxsize=1024)
+def translate_query(query):
+    """Переводит запрос в синтаксис SQLite; запросы моделей повторяются, поэтому результат кэшируется."""
+    query = _DATETIME_LITERAL.sub(lambda match: f"'{normalize_datetime(match.group(1))}'", query)
+    return _SCHEMA_PREFIX.sub("", query).replace("%s", "?")
+
+
+class SQLiteCursor:
+    """Курсор с интерфейсом pymssql: параметры %s, строки-словари, контекстный менеджер."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=None):
+        if params is None:
+            self.cursor.execute(translate_query(query))
+        else:
+            if not isinstance(params, (tuple, list, dict)):
+                params = (params,)
+            self.cursor.execute(translate_query(query), params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self.cursor.executemany(translate_query(query), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self.cursor.fetchmany(size) if size is not None else self.cursor.fetchmany()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SQLiteConnection:
+    """Соединение с интерфейсом, которым модели пользуются у pymssql."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return SQLiteCursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+
+class SQLiteBackend:
+    """Хранилище на файлах SQLite в каталоге directory."""
+
+    name = "sqlite"
+    Error = sqlite3.Error
+
+    def __init__(self, directory="data", busy_timeout=30.0):
+        self.directory = directory
+        self.busy_timeout = busy_timeout
+        self.statements = StatementCache(self.prepare)
+
+    def path(self, db):
+        return os.path.join(self.directory, f"{db}.sqlite3")
+
+    def connect(self, db):
+        """Открывает новое соединение с базой данных db."""
+        path = self.path(db)
+        if not os.path.exists(path):
+            raise sqlite3.OperationalError(f"База данных {db} не создана: {path}")
+        # Пул передает соединение между потоками, но одновременно им пользуется один поток
+        connection = sqlite3.connect(
+            path, timeout=self.busy_timeout, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+        )
+        connection.row_factory = _dict_row
+        # WAL: чтение не блокируется записью в другом соединении
+        connection.execute("PRAGMA journal_mode=WAL")
+        return SQLiteConnection(connection)
+
+    def prepare(self, statement):
+        """Текст запроса statement для sqlite3: параметры @имя передаются как :имя."""
+        return PARAMETER_PATTERN.sub(r":\1", _SCHEMA_PREFIX.sub("", statement.sql))
+
+    def execute(self, cursor, statement, **values):
+        """Выполняет запрос statement на курсоре cursor (sqlite3 сам кэширует разобранные запросы)."""
+        cursor.execute(self.statements.text(statement), self.bind(statement, values))
+
+    def execute_many(self, cursor, statement, rows):
+        """Выполняет запрос statement для каждого словаря значений из rows."""
+        cursor.executemany(self.statements.text(statement), [self.bind(statement, row) for row in rows])
+
+    @staticmethod
+    def bind(statement, values):
+        """Значения параметров statement; параметры datetime приводятся к полной отметке времени."""
+        params = statement.bind(**values)
+        for param_name, sql_type in statement.params:
+            if sql_type == "datetime":
+                params[param_name] = normalize_datetime(params[param_name])
+        return params
+
+    def create_schema(self, databases=None):
+        """Создает файлы баз данных и таблицы, которых еще нет."""
+        os.makedirs(self.directory, exist_ok=True)
+        for db in databases or SCHEMAS:
+            with sqlite3.connect(self.path(db)) as connection:
+                connection.executescript(SCHEMAS[db])
+            print(f"База {db}: {self.path(db)}")
+
+    def seed_demo_data(self, start=datetime.date(2024, 1, 1), days=366, parameters=50, seed=1):
+        """Заполняет пустые базы тестовыми суточными данными для нагрузочных тестов."""
+        rng = random.Random(seed)
+        times = [(index + 1, datetime.datetime.combine(start + datetime.timedelta(days=index), datetime.time()))
+                 for index in range(days)]
+
+        with sqlite3.connect(self.path("DB_URD")) as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO Users (name, password, role) VALUES (?, ?, ?)",
+                [("admin", "admin", "admin"), ("user", "user", "user")]
+            )
+
+        for db, prefix in (("DB_NN_Technological_data", "Tech"), ("DB_NN_Xline_data", "Xline")):
+            with sqlite3.connect(self.path(db)) as connection:
+                if connection.execute(f"SELECT COUNT(*) FROM {prefix}_time_day").fetchone()[0]:
+                    continue
+                connection.executemany("INSERT INTO Units (UNIT_ID, UNIT_NAME) VALUES (?, ?)",
+                                       [(1, "т"), (2, "%"), (3, "м3")])
+                connection.executemany(f"INSERT INTO {prefix}_time_day (PAR_TIME_ID, PAR_TIME) VALUES (?, ?)", times)
+                connection.executemany(
+                    f"INSERT INTO {prefix}_config (PAR_ID, NAME, UNIT) VALUES (?, ?, ?)",
+                    [(par_id, f"{prefix} параметр {par_id}", par_id % 3 + 1) for par_id in range(1, parameters + 1)]
+                )
+                rows = []
+                for par_id in range(1, parameters + 1):
+                    value = rng.uniform(10, 1000)
+                    for time_id, _ in times:
+                        value = max(0.0, value + rng.gauss(0, value * 0.02))
+                        # Часть суток без достоверного значения
+                        rows.append((par_id, time_id, None if rng.random() < 0.02 else round(value, 2)))
+                connection.executemany(
+                    f"INSERT INTO {prefix}_data_day (PAR_ID, PAR_TIME_ID, PAR_VALUE) VALUES (?, ?, ?)", rows
+                )
+
+        with sqlite3.connect(self.path("DB_NN_Analytical_data")) as connection:
+            if not connection.execute("SELECT COUNT(*) FROM Lab_data").fetchone()[0]:
+                elements = ["Ni", "Cu", "Co", "Fe", "S", "SO2", "H2SO4"]
+                connection.executemany("INSERT INTO lab_elements (el_id, el_name) VALUES (?, ?)",
+                                       list(enumerate(elements, start=1)))
+                connection.executemany("INSERT INTO lab_sequences (seq_id, el_id, el_vpos) VALUES (?, ?, ?)",
+                                       [(1, el_id, el_id) for el_id in range(1, len(elements) + 1)])
+                connection.executemany("INSERT INTO Lab_products (PROD_ID, PROD_NAME) VALUES (?, ?)",
+                                       [(prod_id, f"Продукт {prod_id}") for prod_id in range(300, 310)])
+                rows = []
+                for prod_id in range(300, 310):
+                    for level_id in range(1, 4):
+                        for _, prod_time in times:
+                            rows.append((prod_id, level_id, 1, prod_time, round(rng.uniform(100, 500), 1),
+                                         *[round(rng.uniform(0, 20), 3) for _ in elements]))
+                columns = ", ".join(f"EL{index}" for index in range(1, len(elements) + 1))
+                placeholders = ", ".join("?" for _ in range(5 + len(elements)))
+                connection.executemany(
+                    f"INSERT INTO Lab_data (PROD_ID, LEVEL_ID, SEQ_ID, PROD_TIME, Q, {columns}) "
+                    f"VALUES ({placeholders})", rows
+                )
+        print("Тестовые данные добавлены")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "init":
+        print("Использование: python -m server.models.backends.sqlite_backend init <каталог> [--demo]")
+        sys.exit(1)
+    backend = SQLiteBackend(sys.argv[2])
+    backend.create_schema()
+    if "--demo" in sys.argv[3:]:
+        backend.seed_demo_data()
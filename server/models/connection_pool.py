@@ -0,0 +1,243 @@
+# server/models/connection_pool.py
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Свободное соединение не появилось за отведенное время."""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с одной базой данных.
+
+    В пуле держится не меньше min_size и не больше max_size соединений.
+    Соединение, пролежавшее без дела дольше health_check_after секунд,
+    перед выдачей проверяется запросом health_check_query; неисправное
+    соединение закрывается и заменяется новым. Если все max_size соединений
+    заняты, connection() ждет освобождения не дольше checkout_timeout секунд.
+    """
+
+    def __init__(self, name, connect, min_size=1, max_size=8, checkout_timeout=30.0,
+                 health_check_after=5.0, health_check_query="SELECT 1"):
+        self.name = name
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.health_check_query = health_check_query
+
+        self.condition = threading.Condition()
+        # Свободные соединения: (соединение, время возврата в пул)
+        self.idle = []
+        self.size = 0
+        self.in_use = 0
+        self.created = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдает соединение на время блока with. При ошибке внутри блока незавершенная
+        транзакция откатывается, а соединение, которое не удалось откатить, закрывается.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, rollback=True)
+            raise
+        else:
+            self.release(connection)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        started = time.perf_counter()
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободного соединения с {self.name} за {self.checkout_timeout} с"
+                        )
+                    waited = True
+                    self.condition.wait(remaining)
+
+                if self.idle:
+                    connection, released_at = self.idle.pop()
+                else:
+                    # Место под новое соединение резервируется до подключения, чтобы не превысить max_size
+                    connection, released_at = None, None
+                    self.size += 1
+                self.in_use += 1
+                self.checkouts += 1
+                if waited:
+                    self.waits += 1
+                    self.wait_time += time.perf_counter() - started
+                    waited = False
+
+            if connection is None:
+                try:
+                    return self._open()
+                except Exception:
+                    self._forget()
+                    raise
+
+            if time.monotonic() - released_at < self.health_check_after or self._is_healthy(connection):
+                return connection
+
+            # Соединение неисправно: закрываем и пробуем следующее свободное или новое
+            with self.condition:
+                self.health_check_failures += 1
+                self.checkouts -= 1
+            self._discard(connection)
+
+    def release(self, connection, rollback=False):
+        if rollback:
+            try:
+                connection.rollback()
+            except Exception as e:
+                print(f"Соединение с {self.name} не удалось откатить и оно будет закрыто: {e}")
+                self._discard(connection)
+                return
+        with self.condition:
+            self.in_use -= 1
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def warm_up(self):
+        """Заранее открывает min_size соединений, чтобы первые запросы не ждали подключения."""
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+                raise
+            with self.condition:
+                self.idle.append((connection, time.monotonic()))
+                self.condition.notify()
+
+    def close(self):
+        """Закрывает свободные соединения. Занятые соединения вернутся в пул после использования."""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "created": self.created,
+                "discarded": self.discarded,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_ms": round(self.wait_time * 1000, 2),
+                "timeouts": self.timeouts,
+                "health_check_failures": self.health_check_failures,
+            }
+
+    def _open(self):
+        connection = self.connect()
+        with self.condition:
+            self.created += 1
+        return connection
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(self.health_check_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"Соединение с {self.name} неисправно: {e}")
+            return False
+
+    def _discard(self, connection):
+        self._close_quietly(connection)
+        with self.condition:
+            self.discarded += 1
+        self._forget()
+
+    def _forget(self):
+        """Освобождает место выданного соединения, которое не вернется в пул."""
+        with self.condition:
+            self.size -= 1
+            self.in_use -= 1
+            self.condition.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class ConnectionPoolRegistry:
+    """Пулы соединений по именам баз данных, создаются при первом обращении."""
+
+    def __init__(self, connect, min_size=1, max_size=8, checkout_timeout=30.0):
+        # connect(db) открывает новое соединение с базой db
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get(self, db):
+        with self.lock:
+            pool = self.pools.get(db)
+            if pool is None:
+                pool = ConnectionPool(
+                    db, lambda: self.connect(db),
+                    min_size=self.min_size, max_size=self.max_size, checkout_timeout=self.checkout_timeout
+                )
+                self.pools[db] = pool
+            return pool
+
+    def warm_up(self, databases):
+        """Открывает минимальное число соединений с каждой базой; ошибки подключения только логируются."""
+        for db in databases:
+            try:
+                self.get(db).warm_up()
+                print(f"Пул соединений с {db} готов")
+            except Exception as e:
+                print(f"Не удалось подготовить пул соединений с {db}: {e}")
+
+    def stats(self):
+        with self.lock:
+            pools = dict(self.pools)
+        return {db: pool.stats() for db, pool in pools.items()}
+
+    def close(self):
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.close()
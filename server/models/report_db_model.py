@@ -1,187 +1,539 @@
 # server/models/report_db_model.py
+import datetime
+
+import numpy as np
+
+from server.models.backends.factory import create_backend
+from server.models.connection_pool import ConnectionPool
+from server.models.result_cache import as_datetime, period_bound
+from server.models.series import Series, fetch_columns, split_by_id
+from server.models.statement import InListStatement, Statement
+
+# Базы данных параметров, с которыми работают отчеты
+REPORT_DATABASES = ("DB_NN_Analytical_data", "DB_NN_Technological_data", "DB_NN_Xline_data")
+
+_PERIOD = (("time_start", "datetime"), ("time_end", "datetime"))
+
+ANALYTICAL_TONNAGE = Statement("analytical_tonnage", """
+    SELECT Q
+    FROM dbo.Lab_data
+    WHERE PROD_ID = @product
+      AND LEVEL_ID = @level
+      AND PROD_TIME BETWEEN @time_start AND @time_end;
+""", (("product", "int"), ("level", "int")) + _PERIOD)
+
+ANALYTICAL_ELEMENT = Statement("analytical_element", """
+    -- Определяем позиции элементов для конкретного SEQ_ID, связанного с продуктом и уровнем
+    WITH ElementPositions AS (
+        SELECT 
+            ls.el_vpos, -- Позиция элемента в таблице lab_data (например, EL1, EL2 и т.д.)
+            le.el_name  -- Имя элемента (например, SO2, H2SO4 и т.д.)
+        FROM 
+            lab_sequences ls
+        INNER JOIN 
+            lab_elements le ON le.el_id = ls.el_id -- Соединяем последовательности с элементами
+        WHERE 
+            ls.seq_id = (
+                -- Получаем SEQ_ID для указанного продукта, уровня и временного интервала
+                SELECT DISTINCT ld.seq_id
+                FROM lab_data ld
+                WHERE 
+                    ld.prod_id = @product -- Фильтрация по продукту (например, 301)
+                    AND ld.level_id = @level -- Фильтрация по уровню (например, 3)
+                    AND ld.prod_time BETWEEN @time_start AND @time_end -- Фильтрация по времени
+            )
+            AND le.el_name = @element -- Фильтрация по имени элемента (например, H2SO4)
+    )
+    -- Получаем значение элемента из таблицы lab_data на основе позиции элемента (el_vpos)
+    SELECT 
+        ep.el_name, -- Имя элемента
+        CASE ep.el_vpos
+            WHEN 1 THEN ld.el1 -- Если позиция элемента = 1, берем значение из колонки EL1
+            WHEN 2 THEN ld.el2 -- Если позиция элемента = 2, берем значение из колонки EL2
+            WHEN 3 THEN ld.el3
+            WHEN 4 THEN ld.el4
+            WHEN 5 THEN ld.el5
+            WHEN 6 THEN ld.el6
+            WHEN 7 THEN ld.el7
+            WHEN 8 THEN ld.el8
+            WHEN 9 THEN ld.el9
+            WHEN 10 THEN ld.el10
+            WHEN 11 THEN ld.el11
+            WHEN 12 THEN ld.el12
+            WHEN 13 THEN ld.el13
+            WHEN 14 THEN ld.el14 -- Если позиция элемента = 14, берем значение из колонки EL14
+        END AS element_value -- Значение элемента
+    FROM 
+        ElementPositions ep -- Используем ранее определенные позиции элементов
+    INNER JOIN 
+        lab_data ld ON ld.prod_id = @product -- Фильтрация по продукту
+        AND ld.level_id = @level -- Фильтрация по уровню
+        AND ld.prod_time BETWEEN @time_start AND @time_end; -- Фильтрация по времени
+""", (("product", "int"), ("level", "int"), ("element", "nvarchar(64)")) + _PERIOD)
+
+TECHNOLOGICAL_VALUES = Statement("technological_values", """
+    SELECT 
+        td.PAR_VALUE
+    FROM 
+        dbo.Tech_data_day td
+    JOIN 
+        dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID = @product  -- ID продукта
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end;
+""", (("product", "int"),) + _PERIOD)
+
+XLINE_VALUES = Statement("xline_values", """
+    SELECT 
+        td.PAR_VALUE
+    FROM 
+        dbo.Xline_data_day td
+    JOIN 
+        dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID = @product  -- ID продукта
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end;
+""", (("product", "int"),) + _PERIOD)
+
+# Пакетные запросы: значения нескольких шифров одного источника за один запрос.
+# Строки упорядочены по времени, чтобы lst/snm получали значения в хронологическом порядке;
+# строки с одинаковым временем - по PAR_TIME_ID, как и в запросах первого и последнего значения.
+TECHNOLOGICAL_VALUES_BATCH = InListStatement("technological_values_batch", """
+    SELECT 
+        td.PAR_ID, ttd.PAR_TIME, td.PAR_VALUE
+    FROM 
+        dbo.Tech_data_day td
+    JOIN 
+        dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID IN ({ids})
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID;
+""", _PERIOD)
+
+XLINE_VALUES_BATCH = InListStatement("xline_values_batch", """
+    SELECT 
+        td.PAR_ID, ttd.PAR_TIME, td.PAR_VALUE
+    FROM 
+        dbo.Xline_data_day td
+    JOIN 
+        dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID IN ({ids})
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID;
+""", _PERIOD)
+
+# Агрегаты, вычисляемые в SQL, когда формула использует шифр только внутри ave/sum/min/max/count/tave:
+# клиенту передается одна строка на шифр вместо всего ряда.
+# TOTAL_COUNT - все строки за период (для tave), VALUE_COUNT - строки со значением.
+TECHNOLOGICAL_AGGREGATES_BATCH = InListStatement("technological_aggregates_batch", """
+    SELECT 
+        td.PAR_ID,
+        COUNT(*) AS TOTAL_COUNT,
+        COUNT(td.PAR_VALUE) AS VALUE_COUNT,
+        SUM(CAST(td.PAR_VALUE AS float)) AS VALUE_SUM,
+        AVG(CAST(td.PAR_VALUE AS float)) AS VALUE_AVG,
+        MIN(td.PAR_VALUE) AS VALUE_MIN,
+        MAX(td.PAR_VALUE) AS VALUE_MAX
+    FROM 
+        dbo.Tech_data_day td
+    JOIN 
+        dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID IN ({ids})
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    GROUP BY td.PAR_ID;
+""", _PERIOD)
+
+XLINE_AGGREGATES_BATCH = InListStatement("xline_aggregates_batch", """
+    SELECT 
+        td.PAR_ID,
+        COUNT(*) AS TOTAL_COUNT,
+        COUNT(td.PAR_VALUE) AS VALUE_COUNT,
+        SUM(CAST(td.PAR_VALUE AS float)) AS VALUE_SUM,
+        AVG(CAST(td.PAR_VALUE AS float)) AS VALUE_AVG,
+        MIN(td.PAR_VALUE) AS VALUE_MIN,
+        MAX(td.PAR_VALUE) AS VALUE_MAX
+    FROM 
+        dbo.Xline_data_day td
+    JOIN 
+        dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+    WHERE 
+        td.PAR_ID IN ({ids})
+        AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    GROUP BY td.PAR_ID;
+""", _PERIOD)
+
+# Первое и последнее значение за период (snm/lst): аналог TOP 1 ... ORDER BY PAR_TIME, PAR_TIME_ID
+# для каждого шифра списка, одним запросом
+TECHNOLOGICAL_EDGES_BATCH = InListStatement("technological_edges_batch", """
+    SELECT 
+        PAR_ID, PAR_VALUE, FIRST_RANK, LAST_RANK
+    FROM (
+        SELECT 
+            td.PAR_ID, td.PAR_VALUE,
+            ROW_NUMBER() OVER (PARTITION BY td.PAR_ID ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID) AS FIRST_RANK,
+            ROW_NUMBER() OVER (PARTITION BY td.PAR_ID ORDER BY ttd.PAR_TIME DESC, ttd.PAR_TIME_ID DESC) AS LAST_RANK
+        FROM 
+            dbo.Tech_data_day td
+        JOIN 
+            dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+        WHERE 
+            td.PAR_ID IN ({ids})
+            AND td.PAR_VALUE IS NOT NULL
+            AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    ) ranked
+    WHERE FIRST_RANK = 1 OR LAST_RANK = 1;
+""", _PERIOD)
+
+XLINE_EDGES_BATCH = InListStatement("xline_edges_batch", """
+    SELECT 
+        PAR_ID, PAR_VALUE, FIRST_RANK, LAST_RANK
+    FROM (
+        SELECT 
+            td.PAR_ID, td.PAR_VALUE,
+            ROW_NUMBER() OVER (PARTITION BY td.PAR_ID ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID) AS FIRST_RANK,
+            ROW_NUMBER() OVER (PARTITION BY td.PAR_ID ORDER BY ttd.PAR_TIME DESC, ttd.PAR_TIME_ID DESC) AS LAST_RANK
+        FROM 
+            dbo.Xline_data_day td
+        JOIN 
+            dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+        WHERE 
+            td.PAR_ID IN ({ids})
+            AND td.PAR_VALUE IS NOT NULL
+            AND ttd.PAR_TIME BETWEEN @time_start AND @time_end
+    ) ranked
+    WHERE FIRST_RANK = 1 OR LAST_RANK = 1;
+""", _PERIOD)
+
+ANALYTICAL_DATA_BATCH = InListStatement("analytical_data_batch", """
+    SELECT 
+        PROD_ID, LEVEL_ID, SEQ_ID, PROD_TIME, Q,
+        EL1, EL2, EL3, EL4, EL5, EL6, EL7, EL8, EL9, EL10, EL11, EL12, EL13, EL14
+    FROM 
+        dbo.Lab_data
+    WHERE 
+        PROD_ID IN ({ids})
+        AND PROD_TIME BETWEEN @time_start AND @time_end
+    ORDER BY PROD_TIME;
+""", _PERIOD)
+
+# Позиции элементов (el_vpos) в последовательностях анализов: справочник небольшой
+LAB_SEQUENCES = Statement("lab_sequences", """
+    SELECT 
+        ls.seq_id, ls.el_vpos, le.el_name
+    FROM 
+        lab_sequences ls
+    INNER JOIN 
+        lab_elements le ON le.el_id = ls.el_id
+""", ())
+
+ANALYTICAL_PRODUCT_NAME = Statement("analytical_product_name", """
+    SELECT PROD_NAME
+    FROM dbo.Lab_products
+    WHERE PROD_ID = @product
+""", (("product", "int"),))
+
+TECHNOLOGICAL_PRODUCT_NAME = Statement("technological_product_name", """
+    SELECT NAME
+    FROM dbo.Tech_config
+    WHERE PAR_ID = @product
+""", (("product", "int"),))
+
+XLINE_PRODUCT_NAME = Statement("xline_product_name", """
+    SELECT NAME
+    FROM dbo.Xline_config
+    WHERE PAR_ID = @product
+""", (("product", "int"),))
+
+TECHNOLOGICAL_PRODUCT_UNIT = Statement("technological_product_unit", """
+    SELECT u.UNIT_NAME
+    FROM dbo.Units u
+    WHERE u.UNIT_ID = (
+    SELECT xc.UNIT
+    FROM dbo.Tech_config xc
+    WHERE xc.PAR_ID = @product
+    )
+""", (("product", "int"),))
+
+XLINE_PRODUCT_UNIT = Statement("xline_product_unit", """
+    SELECT u.UNIT_NAME
+    FROM dbo.Units u
+    WHERE u.UNIT_ID = (
+    SELECT xc.UNIT
+    FROM dbo.Xline_config xc
+    WHERE xc.PAR_ID = @product
+    )
+""", (("product", "int"),))
 
-import pymssql
 
 class ReportDBModel:
-    def __init__(self, db, param=None):
+    """
+    Запросы к базам параметров. Все запросы параметризованы (Statement):
+    значения шифров и периодов передаются отдельно от текста запроса.
+    cache - общий кэш результатов (ResultCache): агрегаты и строки Lab_data хранятся
+    по (база, запрос, PAR_ID / PROD_ID, период), ряды T и X - суточными частями
+    по (база, запрос, PAR_ID, сутки); из БД запрашиваются только промахи.
+    """
+
+    def __init__(self, db, param=None, pool=None, backend=None, cache=None):
         self.db = db
         self.param = param
-        self.connection = pymssql.connect(
-            server='localhost',
-            database=self.db,
-            as_dict=True,
-            charset='cp1251'
-        )
+        self.cache = cache
+        self.backend = backend if backend is not None else create_backend()
+        # Соединения берутся из общего пула базы на время одного запроса
+        if pool is None:
+            pool = ConnectionPool(db, lambda: self.backend.connect(db), min_size=0)
+        self.pool = pool
 
     def get_analytical_value_tonnage(self, data, time_start, time_end):
-        query = f"""
-            SELECT Q
-            FROM dbo.Lab_data
-            WHERE PROD_ID = {data['product']}
-              AND LEVEL_ID = {data['level']}
-              AND PROD_TIME BETWEEN '{time_start}' AND '{time_end}';
-        """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+        return self._fetch_all(ANALYTICAL_TONNAGE, product=data['product'], level=data['level'],
+                               time_start=time_start, time_end=time_end)
 
     def get_analytical_value_element(self, data, time_start, time_end):
-        query = f"""
-            -- Определяем позиции элементов для конкретного SEQ_ID, связанного с продуктом и уровнем
-            WITH ElementPositions AS (
-                SELECT 
-                    ls.el_vpos, -- Позиция элемента в таблице lab_data (например, EL1, EL2 и т.д.)
-                    le.el_name  -- Имя элемента (например, SO2, H2SO4 и т.д.)
-                FROM 
-                    lab_sequences ls
-                INNER JOIN 
-                    lab_elements le ON le.el_id = ls.el_id -- Соединяем последовательности с элементами
-                WHERE 
-                    ls.seq_id = (
-                        -- Получаем SEQ_ID для указанного продукта, уровня и временного интервала
-                        SELECT DISTINCT ld.seq_id
-                        FROM lab_data ld
-                        WHERE 
-                            ld.prod_id = {data["product"]} -- Фильтрация по продукту (например, 301)
-                            AND ld.level_id = {data["level"]} -- Фильтрация по уровню (например, 3)
-                            AND ld.prod_time BETWEEN '{time_start}' AND '{time_end}' -- Фильтрация по времени
-                    )
-                    AND le.el_name = '{data["element"]}' -- Фильтрация по имени элемента (например, H2SO4)
-            )
-            -- Получаем значение элемента из таблицы lab_data на основе позиции элемента (el_vpos)
-            SELECT 
-                ep.el_name, -- Имя элемента
-                CASE ep.el_vpos
-                    WHEN 1 THEN ld.el1 -- Если позиция элемента = 1, берем значение из колонки EL1
-                    WHEN 2 THEN ld.el2 -- Если позиция элемента = 2, берем значение из колонки EL2
-                    WHEN 3 THEN ld.el3
-                    WHEN 4 THEN ld.el4
-                    WHEN 5 THEN ld.el5
-                    WHEN 6 THEN ld.el6
-                    WHEN 7 THEN ld.el7
-                    WHEN 8 THEN ld.el8
-                    WHEN 9 THEN ld.el9
-                    WHEN 10 THEN ld.el10
-                    WHEN 11 THEN ld.el11
-                    WHEN 12 THEN ld.el12
-                    WHEN 13 THEN ld.el13
-                    WHEN 14 THEN ld.el14 -- Если позиция элемента = 14, берем значение из колонки EL14
-                END AS element_value -- Значение элемента
-            FROM 
-                ElementPositions ep -- Используем ранее определенные позиции элементов
-            INNER JOIN 
-                lab_data ld ON ld.prod_id = {data["product"]} -- Фильтрация по продукту
-                AND ld.level_id = {data["level"]} -- Фильтрация по уровню
-                AND ld.prod_time BETWEEN '{time_start}' AND '{time_end}'; -- Фильтрация по времени
-        """
-
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+        return self._fetch_all(ANALYTICAL_ELEMENT, product=data["product"], level=data["level"],
+                               element=data["element"], time_start=time_start, time_end=time_end)
 
     def get_technological_value(self, data, time_start, time_end):
-        # Формирование SQL-запроса для технологических данных
-        query = f"""
-            SELECT 
-                td.PAR_VALUE
-            FROM 
-                dbo.Tech_data_day td
-            JOIN 
-                dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
-            WHERE 
-                td.PAR_ID = {data["product"]}  -- ID продукта
-                AND ttd.PAR_TIME BETWEEN '{time_start}' AND '{time_end}';
-            """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+        return self._fetch_all(TECHNOLOGICAL_VALUES, product=data["product"],
+                               time_start=time_start, time_end=time_end)
 
     def get_Xline_value(self, data, time_start, time_end):
-        # Формирование SQL-запроса для технологических данных
-        query = f"""
-            SELECT 
-                td.PAR_VALUE
-            FROM 
-                dbo.Xline_data_day td
-            JOIN 
-                dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
-            WHERE 
-                td.PAR_ID = {data["product"]}  -- ID продукта
-                AND ttd.PAR_TIME BETWEEN '{time_start}' AND '{time_end}';
-            """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+        return self._fetch_all(XLINE_VALUES, product=data["product"], time_start=time_start, time_end=time_end)
 
-    def get_name_product_analytical(self, prod_id):
-        query = f"""
-            SELECT PROD_NAME
-            FROM dbo.Lab_products
-            WHERE PROD_ID = %s
+    def get_technological_values(self, par_ids, time_start, time_end):
+        """Значения нескольких технологических параметров за период: {PAR_ID: Series}."""
+        return self._fetch_by_day(TECHNOLOGICAL_VALUES_BATCH, par_ids, time_start, time_end)
+
+    def get_Xline_values(self, par_ids, time_start, time_end):
+        """Значения нескольких параметров ручного ввода за период: {PAR_ID: Series}."""
+        return self._fetch_by_day(XLINE_VALUES_BATCH, par_ids, time_start, time_end)
+
+    def get_technological_aggregates(self, par_ids, time_start, time_end, edges=False):
         """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (prod_id,))
-            result = cursor.fetchone()  # Используем fetchone для одного результата
-            if result is None:  # Проверяем, что результат отсутствует
-                return "[ERROR: Ошибка в выражении]"
-            return result['PROD_NAME']
+        Агрегаты технологических параметров за период, вычисленные в SQL:
+        {PAR_ID: {"total", "count", "sum", "ave", "min", "max"[, "snm", "lst"]}}.
+        edges - получить также первое (snm) и последнее (lst) значение.
+        Параметр без строк за период получает пустой словарь.
+        """
+        return self._cached_by_id(
+            TECHNOLOGICAL_AGGREGATES_BATCH.name + (":edges" if edges else ""), par_ids, time_start, time_end,
+            lambda ids: self._fetch_aggregates(TECHNOLOGICAL_AGGREGATES_BATCH,
+                                               TECHNOLOGICAL_EDGES_BATCH if edges else None, ids, time_start, time_end),
+            default={})
+
+    def get_Xline_aggregates(self, par_ids, time_start, time_end, edges=False):
+        """Агрегаты параметров ручного ввода за период (как get_technological_aggregates)."""
+        return self._cached_by_id(
+            XLINE_AGGREGATES_BATCH.name + (":edges" if edges else ""), par_ids, time_start, time_end,
+            lambda ids: self._fetch_aggregates(XLINE_AGGREGATES_BATCH, XLINE_EDGES_BATCH if edges else None,
+                                               ids, time_start, time_end),
+            default={})
+
+    def get_analytical_rows(self, prod_ids, time_start, time_end):
+        """Строки Lab_data нескольких продуктов за период (все уровни и элементы)."""
+        if self.cache is None:
+            return self._fetch_in_list(ANALYTICAL_DATA_BATCH, prod_ids, time_start=time_start, time_end=time_end)
+
+        def fetch(ids):
+            rows_by_product = {}
+            for row in self._fetch_in_list(ANALYTICAL_DATA_BATCH, ids, time_start=time_start, time_end=time_end):
+                rows_by_product.setdefault(row["PROD_ID"], []).append(row)
+            return rows_by_product
+
+        rows_by_product = self._cached_by_id(ANALYTICAL_DATA_BATCH.name, prod_ids, time_start, time_end,
+                                             fetch, default=[])
+        return [row for rows in rows_by_product.values() for row in rows]
+
+    def get_lab_sequences(self):
+        """Позиции элементов в последовательностях: {seq_id: [(el_name, el_vpos)]}."""
+        sequences = {}
+        for row in self._fetch_all(LAB_SEQUENCES):
+            sequences.setdefault(row["seq_id"], []).append((row["el_name"], row["el_vpos"]))
+        return sequences
+
+    def get_name_product_analytical(self, prod_id):
+        return self._fetch_field(ANALYTICAL_PRODUCT_NAME, 'PROD_NAME', product=prod_id)
 
     def get_name_product_technological(self, par_id):
-        query = f"""
-                    SELECT NAME
-                    FROM dbo.Tech_config
-                    WHERE PAR_ID = %s
-                """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (par_id,))
-            result = cursor.fetchone()  # Используем fetchone для одного результата
-            if result is None:  # Проверяем, что результат отсутствует
-                return "[ERROR: Ошибка в выражении]"
-            return result['NAME']
+        return self._fetch_field(TECHNOLOGICAL_PRODUCT_NAME, 'NAME', product=par_id)
 
     def get_name_product_Xline(self, par_id):
-        query = f"""
-                    SELECT NAME
-                    FROM dbo.Xline_config
-                    WHERE PAR_ID = %s
-                """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (par_id,))
-            result = cursor.fetchone()  # Используем fetchone для одного результата
-            if result is None:  # Проверяем, что результат отсутствует
-                return "[ERROR: Ошибка в выражении]"
-            return result['NAME']
+        return self._fetch_field(XLINE_PRODUCT_NAME, 'NAME', product=par_id)
 
     def get_unit_product_technological(self, par_id):
-        query = f"""
-                    SELECT u.UNIT_NAME
-                    FROM dbo.Units u
-                    WHERE u.UNIT_ID = (
-                    SELECT xc.UNIT
-                    FROM dbo.Tech_config xc
-                    WHERE xc.PAR_ID = %s
-                    )
-                """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (par_id,))
-            result = cursor.fetchone()  # Используем fetchone для одного результата
-            if result is None:  # Проверяем, что результат отсутствует
-                return "[ERROR: Ошибка в выражении]"
-            return result['UNIT_NAME']
+        return self._fetch_field(TECHNOLOGICAL_PRODUCT_UNIT, 'UNIT_NAME', product=par_id)
 
     def get_unit_product_Xline(self, par_id):
-        query = f"""
-                    SELECT u.UNIT_NAME
-                    FROM dbo.Units u
-                    WHERE u.UNIT_ID = (
-                    SELECT xc.UNIT
-                    FROM dbo.Xline_config xc
-                    WHERE xc.PAR_ID = %s
-                    )
-                """
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, (par_id,))
+        return self._fetch_field(XLINE_PRODUCT_UNIT, 'UNIT_NAME', product=par_id)
+
+    def _cached_by_id(self, kind, ids, time_start, time_end, fetch, default=None):
+        """
+        Результат fetch(ids) -> {id: значение} через общий кэш: из БД запрашиваются
+        только id, которых нет в кэше. default - значение id, для которого fetch ничего не вернул.
+        """
+        if self.cache is None:
+            return fetch(ids)
+        # Одна и та же граница в разной записи ('2024-01-01' и '2024-01-01 00:00:00') дает один ключ
+        period = (period_bound(time_start), period_bound(time_end))
+        results = {}
+        missing = []
+        for item_id in ids:
+            value = self.cache.get((self.db, kind, item_id) + period)
+            if value is None:
+                missing.append(item_id)
+            else:
+                results[item_id] = value
+        if missing:
+            fetched = fetch(missing)
+            for item_id in missing:
+                value = fetched.get(item_id, default)
+                self.cache.put((self.db, kind, item_id) + period, value, period[1])
+                results[item_id] = value
+        return results
+
+    def _fetch_all(self, statement, **values):
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            self.backend.execute(cursor, statement, **values)
+            return cursor.fetchall()
+
+    def _fetch_in_list(self, statement, ids, **values):
+        """Выполняет запрос со списком IN по частям на одном соединении и объединяет строки."""
+        rows = []
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            for chunk_statement, params in statement.bind_chunks(sorted(set(ids)), **values):
+                self.backend.execute(cursor, chunk_statement, **params)
+                rows.extend(cursor.fetchall())
+        return rows
+
+    def _fetch_by_id(self, statement, par_ids, time_start, time_end):
+        """
+        Столбцовое чтение рядов: строки читаются порциями fetchmany сразу в массивы
+        PAR_ID, PAR_TIME и PAR_VALUE, затем делятся по шифрам.
+        """
+        values = {par_id: Series.empty() for par_id in par_ids}
+        values.update(split_by_id(*self._fetch_columns(statement, par_ids, time_start, time_end)))
+        return values
+
+    def _fetch_columns(self, statement, par_ids, time_start, time_end, time_dtype="datetime64[s]"):
+        """Столбцы PAR_ID, PAR_TIME и PAR_VALUE строк запроса (NULL - NaN)."""
+        columns = {"PAR_ID": np.int64, "PAR_TIME": time_dtype, "PAR_VALUE": np.float64}
+        parts = []
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            for chunk_statement, params in statement.bind_chunks(sorted(set(par_ids)),
+                                                                 time_start=time_start, time_end=time_end):
+                self.backend.execute(cursor, chunk_statement, **params)
+                parts.append(fetch_columns(cursor, columns))
+        if not parts:
+            return tuple(np.empty(0, dtype=dtype) for dtype in columns.values())
+        return tuple(np.concatenate([part[column] for part in parts]) for column in columns)
+
+    def _fetch_by_day(self, statement, par_ids, time_start, time_end):
+        """
+        Ряды T и X из суточных частей кэша: ряд периода собирается из частей (PAR_ID, сутки)
+        и обрезается по границам периода включительно, как BETWEEN в запросе за сам период.
+        Части хранят время с точностью до микросекунд и значения вместе с NULL (NaN),
+        поэтому обрезанный ряд (и его total) совпадает с результатом _fetch_by_id.
+        """
+        start, end = as_datetime(time_start), as_datetime(time_end)
+        if self.cache is None or start is None or end is None or start > end:
+            return self._fetch_by_id(statement, par_ids, time_start, time_end)
+        days = [start.date() + datetime.timedelta(days=offset)
+                for offset in range((end.date() - start.date()).days + 1)]
+        chunks = {}
+        missing = {}
+        for par_id in set(par_ids):
+            for day in days:
+                chunk = self.cache.get((self.db, statement.name, par_id, day))
+                if chunk is None:
+                    missing.setdefault(par_id, []).append(day)
+                else:
+                    chunks[(par_id, day)] = chunk
+        if missing:
+            chunks.update(self._fetch_day_chunks(statement, missing))
+
+        low, high = np.datetime64(start, "us"), np.datetime64(end, "us")
+        values = {}
+        for par_id in par_ids:
+            times = np.concatenate([chunks[(par_id, day)][0] for day in days])
+            raw_values = np.concatenate([chunks[(par_id, day)][1] for day in days])
+            selected = (times >= low) & (times <= high)
+            values[par_id] = Series.from_columns(times[selected].astype("datetime64[s]"), raw_values[selected])
+        return values
+
+    def _fetch_day_chunks(self, statement, missing):
+        """
+        Запрашивает недостающие суточные части missing ({PAR_ID: [сутки по возрастанию]})
+        и сохраняет их в кэш. Сутки каждого шифра делятся на непрерывные отрезки; шифры
+        с одинаковым отрезком запрашиваются одним запросом только за дни этого отрезка.
+        """
+        runs = {}
+        for par_id, days in missing.items():
+            run_start = previous = days[0]
+            for day in days[1:] + [None]:
+                if day is not None and day == previous + datetime.timedelta(days=1):
+                    previous = day
+                    continue
+                runs.setdefault((run_start, previous), []).append(par_id)
+                run_start = previous = day
+
+        chunks = {}
+        for (day_from, day_to), par_ids in runs.items():
+            # Конец суток - наибольшая отметка типа datetime SQL Server (точность 1/300 секунды)
+            ids, times, raw_values = self._fetch_columns(
+                statement, par_ids,
+                datetime.datetime.combine(day_from, datetime.time()),
+                datetime.datetime.combine(day_to, datetime.time(23, 59, 59, 997000)),
+                time_dtype="datetime64[us]",
+            )
+            # Устойчивая сортировка по PAR_ID сохраняет порядок времени внутри шифра
+            order = np.argsort(ids, kind="stable")
+            ids, times, raw_values = ids[order], times[order], raw_values[order]
+            days = times.astype("datetime64[D]")
+            for par_id in par_ids:
+                first, last = np.searchsorted(ids, [par_id, par_id + 1])
+                for offset in range((day_to - day_from).days + 1):
+                    day = day_from + datetime.timedelta(days=offset)
+                    day_start = np.datetime64(day, "D")
+                    day_first, day_last = first + np.searchsorted(days[first:last], [day_start, day_start + 1])
+                    chunk = (times[day_first:day_last].copy(), raw_values[day_first:day_last].copy())
+                    self.cache.put((self.db, statement.name, par_id, day), chunk,
+                                   datetime.datetime.combine(day, datetime.time(23, 59, 59)))
+                    chunks[(par_id, day)] = chunk
+        return chunks
+
+    def _fetch_aggregates(self, statement, edge_statement, par_ids, time_start, time_end):
+        aggregates = {}
+        for row in self._fetch_in_list(statement, par_ids, time_start=time_start, time_end=time_end):
+            aggregates[row["PAR_ID"]] = {
+                "total": row["TOTAL_COUNT"],
+                "count": row["VALUE_COUNT"],
+                "sum": _as_float(row["VALUE_SUM"]),
+                "ave": _as_float(row["VALUE_AVG"]),
+                "min": _as_float(row["VALUE_MIN"]),
+                "max": _as_float(row["VALUE_MAX"]),
+            }
+        if edge_statement is not None:
+            for row in self._fetch_in_list(edge_statement, par_ids, time_start=time_start, time_end=time_end):
+                aggregate = aggregates.get(row["PAR_ID"])
+                if aggregate is None:
+                    continue
+                if row["FIRST_RANK"] == 1:
+                    aggregate["snm"] = _as_float(row["PAR_VALUE"])
+                if row["LAST_RANK"] == 1:
+                    aggregate["lst"] = _as_float(row["PAR_VALUE"])
+        return aggregates
+
+    def _fetch_field(self, statement, field, **values):
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            self.backend.execute(cursor, statement, **values)
             result = cursor.fetchone()  # Используем fetchone для одного результата
             if result is None:  # Проверяем, что результат отсутствует
                 return "[ERROR: Ошибка в выражении]"
-            return result['UNIT_NAME']
+            return result[field]
+
+
+def _as_float(value):
+    # SUM/AVG по decimal-столбцам pymssql возвращает как Decimal
+    return None if value is None else float(value)
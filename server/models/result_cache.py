@@ -0,0 +1,136 @@
+# server/models/result_cache.py
+import datetime
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from server.models.series import Series
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Закрытый период (закончился до начала текущих суток) меняется только при поздней правке
+# данных, открытый - с каждым новым значением
+DEFAULT_CLOSED_TTL = 3600.0
+DEFAULT_OPEN_TTL = 60.0
+
+
+class ResultCache:
+    """
+    Общий для процесса кэш результатов запросов к базам параметров.
+
+    Записи вытесняются по давности использования (LRU), когда их суммарный размер
+    превышает max_bytes. Срок жизни записи зависит от периода: closed_ttl секунд,
+    если период закрыт, и open_ttl, если он захватывает текущие сутки.
+    Значения передаются вызывающему по ссылке и не должны изменяться.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, closed_ttl=DEFAULT_CLOSED_TTL, open_ttl=DEFAULT_OPEN_TTL,
+                 clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+        self.clock = clock
+        # ключ -> (значение, размер, момент устаревания); порядок - от давно использованных к недавним
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Значение по ключу или None, если его нет или оно устарело."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, time_end):
+        """Сохраняет значение результата за период, заканчивающийся time_end."""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        ttl = self.closed_ttl if is_closed_period(time_end) else self.open_ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, self.clock() + ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def as_datetime(value):
+    """Граница периода как datetime (местное время без пояса) или None, если ее не разобрать."""
+    if isinstance(value, datetime.datetime):
+        moment = value
+    elif isinstance(value, datetime.date):
+        moment = datetime.datetime.combine(value, datetime.time())
+    else:
+        try:
+            moment = datetime.datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def period_bound(value):
+    """Граница периода для ключа кэша: datetime, если ее удалось разобрать, иначе исходное значение."""
+    moment = as_datetime(value)
+    return value if moment is None else moment
+
+
+def is_closed_period(time_end):
+    """Период закрыт, если он закончился до начала текущих суток."""
+    end = as_datetime(time_end)
+    return end is not None and end < datetime.datetime.combine(datetime.date.today(), datetime.time())
+
+
+def estimate_size(value):
+    """Приблизительный размер значения в памяти: ряды - по массивам, строки БД - по полям."""
+    if isinstance(value, Series):
+        return sys.getsizeof(value) + value.times.nbytes + value.values.nbytes
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) if value.base is None else sys.getsizeof(value) + value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
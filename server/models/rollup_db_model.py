@@ -0,0 +1,319 @@
+# server/models/rollup_db_model.py
+import numpy as np
+
+from server.models.backends.factory import create_backend
+from server.models.connection_pool import ConnectionPool
+from server.models.series import fetch_columns
+from server.models.statement import InListStatement, Statement
+
+# Итоги хранятся по суткам (GRAIN = 'D') и по календарным месяцам (GRAIN = 'M');
+# PERIOD_START - первый день периода. TOTAL_COUNT - все строки, VALUE_COUNT - строки со значением,
+# FIRST_VALUE / LAST_VALUE - первое и последнее значение периода по времени.
+AGGREGATE_COLUMNS = ("TOTAL_COUNT", "VALUE_COUNT", "VALUE_SUM", "VALUE_MIN", "VALUE_MAX", "FIRST_VALUE", "LAST_VALUE")
+
+# Столбцы Lab_data, по которым считаются итоги аналитических данных
+LAB_VALUE_COLUMNS = ("Q",) + tuple(f"EL{index}" for index in range(1, 15))
+
+_TYPES = {
+    # тип: (SQLite, SQL Server)
+    "int": ("INTEGER", "int"),
+    "count": ("INTEGER NOT NULL", "int NOT NULL"),
+    "float": ("REAL", "float"),
+    "grain": ("TEXT NOT NULL", "char(1) NOT NULL"),
+    "date": ("DATE NOT NULL", "date NOT NULL"),
+    "column": ("TEXT", "varchar(8)"),
+    "blob": ("BLOB NOT NULL", "varbinary(max) NOT NULL"),
+}
+
+
+class RollupSource:
+    """
+    Источник данных, по которому ведутся итоги.
+
+    keys - столбцы ключа итогов (имя, тип); id_column - столбец списка IN при выборке итогов.
+    raw_sql - строки источника за период, упорядоченные по времени (@time_start, @time_end);
+              на месте {ids_filter} подставляется условие на список ключей raw_id_column;
+    first_time_sql - самая ранняя отметка времени источника;
+    sketch_table - таблица суточных эскизов квантилей (QuantileSketch), если они ведутся.
+    """
+
+    def __init__(self, name, db, table, keys, id_column, raw_sql, first_time_sql, raw_id_column=None,
+                 sketch_table=None):
+        self.name = name
+        self.db = db
+        self.table = table
+        self.sketch_table = sketch_table
+        self.keys = keys
+        self.key_names = tuple(key for key, _ in keys)
+        self.id_column = id_column
+        columns = self.key_names + ("GRAIN", "PERIOD_START") + AGGREGATE_COLUMNS
+
+        period = (("time_start", "datetime"), ("time_end", "datetime"))
+        self.raw_rows = Statement(f"{name}_rollup_raw", raw_sql.replace("{ids_filter}", ""), period)
+        # Сырые строки краевых неполных суток запрашиваются только для нужных ключей
+        self.raw_rows_by_id = InListStatement(
+            f"{name}_rollup_raw_by_id",
+            raw_sql.replace("{ids_filter}", f"AND {raw_id_column or id_column} IN ({{ids}})"), period
+        )
+        self.first_time = Statement(f"{name}_rollup_first_time", first_time_sql, ())
+        self.delete = Statement(f"{name}_rollup_delete", f"""
+            DELETE FROM dbo.{table}
+            WHERE GRAIN = @grain AND PERIOD_START BETWEEN @period_from AND @period_to;
+        """, (("grain", "char(1)"), ("period_from", "date"), ("period_to", "date")))
+        # Суточные итоги всех ключей за дни, по которым собирается итог месяца
+        self.day_select = Statement(f"{name}_rollup_day_select", f"""
+            SELECT
+                {", ".join(self.key_names)}, PERIOD_START, {", ".join(AGGREGATE_COLUMNS)}
+            FROM
+                dbo.{table}
+            WHERE
+                GRAIN = 'D' AND PERIOD_START BETWEEN @day_from AND @day_to
+            ORDER BY PERIOD_START;
+        """, (("day_from", "date"), ("day_to", "date")))
+        self.insert = Statement(f"{name}_rollup_insert", f"""
+            INSERT INTO dbo.{table} ({", ".join(columns)})
+            VALUES ({", ".join(f"@{column.lower()}" for column in columns)});
+        """, tuple((column.lower(), _param_type(column, dict(keys))) for column in columns))
+        # Месячные итоги полных месяцев и суточные итоги двух неполных краев диапазона
+        self.select = InListStatement(f"{name}_rollup_select", f"""
+            SELECT
+                {", ".join(self.key_names)}, GRAIN, PERIOD_START, {", ".join(AGGREGATE_COLUMNS)}
+            FROM
+                dbo.{table}
+            WHERE
+                {id_column} IN ({{ids}})
+                AND (
+                    (GRAIN = 'M' AND PERIOD_START BETWEEN @month_from AND @month_to)
+                    OR (GRAIN = 'D' AND (PERIOD_START BETWEEN @head_from AND @head_to
+                                         OR PERIOD_START BETWEEN @tail_from AND @tail_to))
+                )
+            ORDER BY PERIOD_START;
+        """, tuple((param, "date") for param in
+                   ("month_from", "month_to", "head_from", "head_to", "tail_from", "tail_to")))
+
+        if sketch_table is not None:
+            key_params = tuple((key.lower(), _param_type(key, dict(keys))) for key in self.key_names)
+            self.sketch_delete = Statement(f"{name}_sketch_delete", f"""
+                DELETE FROM dbo.{sketch_table}
+                WHERE PERIOD_START BETWEEN @period_from AND @period_to;
+            """, (("period_from", "date"), ("period_to", "date")))
+            self.sketch_insert = Statement(f"{name}_sketch_insert", f"""
+                INSERT INTO dbo.{sketch_table} ({", ".join(self.key_names)}, PERIOD_START, SKETCH)
+                VALUES ({", ".join(f"@{key}" for key, _ in key_params)}, @period_start, @sketch);
+            """, key_params + (("period_start", "date"), ("sketch", "varbinary(max)")))
+            self.sketch_select = InListStatement(f"{name}_sketch_select", f"""
+                SELECT
+                    {", ".join(self.key_names)}, PERIOD_START, SKETCH
+                FROM
+                    dbo.{sketch_table}
+                WHERE
+                    {id_column} IN ({{ids}})
+                    AND PERIOD_START BETWEEN @day_from AND @day_to;
+            """, (("day_from", "date"), ("day_to", "date")))
+
+    def schema(self, backend_name):
+        """Тексты создания таблиц итогов (и эскизов) для хранилища backend_name."""
+        dialect = 0 if backend_name == "sqlite" else 1
+        columns = list(self.keys) + [("GRAIN", "grain"), ("PERIOD_START", "date"),
+                                     ("TOTAL_COUNT", "count"), ("VALUE_COUNT", "count")]
+        columns += [(column, "float") for column in AGGREGATE_COLUMNS[2:]]
+        definitions = ", ".join(
+            f"{column} {_TYPES[column_type][dialect]}{' NOT NULL' if column in self.key_names else ''}"
+            for column, column_type in columns
+        )
+        primary_key = ", ".join(self.key_names + ("GRAIN", "PERIOD_START"))
+        schemas = [_create_table(dialect, self.table, definitions, primary_key)]
+        if self.sketch_table is not None:
+            definitions = ", ".join(
+                [f"{column} {_TYPES[column_type][dialect]} NOT NULL" for column, column_type in self.keys]
+                + [f"PERIOD_START {_TYPES['date'][dialect]}", f"SKETCH {_TYPES['blob'][dialect]}"]
+            )
+            primary_key = ", ".join(self.key_names + ("PERIOD_START",))
+            schemas.append(_create_table(dialect, self.sketch_table, definitions, primary_key))
+        return schemas
+
+
+def _create_table(dialect, table, definitions, primary_key):
+    if dialect == 0:
+        return f"CREATE TABLE IF NOT EXISTS {table} ({definitions}, PRIMARY KEY ({primary_key}))"
+    return (f"IF OBJECT_ID('dbo.{table}') IS NULL "
+            f"CREATE TABLE dbo.{table} ({definitions}, "
+            f"CONSTRAINT PK_{table} PRIMARY KEY ({primary_key}))")
+
+
+def _param_type(column, key_types):
+    if column in key_types:
+        return "varchar(8)" if key_types[column] == "column" else "int"
+    if column == "GRAIN":
+        return "char(1)"
+    if column == "PERIOD_START":
+        return "date"
+    return "int" if column in ("TOTAL_COUNT", "VALUE_COUNT") else "float"
+
+
+ROLLUP_SOURCES = {
+    "T": RollupSource("technological", "DB_NN_Technological_data", "Tech_rollup",
+                      (("PAR_ID", "int"),), "PAR_ID", """
+        SELECT
+            td.PAR_ID, ttd.PAR_TIME, td.PAR_VALUE
+        FROM
+            dbo.Tech_data_day td
+        JOIN
+            dbo.Tech_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+        WHERE
+            ttd.PAR_TIME BETWEEN @time_start AND @time_end
+            {ids_filter}
+        ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID;
+    """, "SELECT MIN(PAR_TIME) AS FIRST_TIME FROM dbo.Tech_time_day", raw_id_column="td.PAR_ID",
+                      sketch_table="Tech_sketch"),
+    "X": RollupSource("xline", "DB_NN_Xline_data", "Xline_rollup",
+                      (("PAR_ID", "int"),), "PAR_ID", """
+        SELECT
+            td.PAR_ID, ttd.PAR_TIME, td.PAR_VALUE
+        FROM
+            dbo.Xline_data_day td
+        JOIN
+            dbo.Xline_time_day ttd ON td.PAR_TIME_ID = ttd.PAR_TIME_ID
+        WHERE
+            ttd.PAR_TIME BETWEEN @time_start AND @time_end
+            {ids_filter}
+        ORDER BY ttd.PAR_TIME, ttd.PAR_TIME_ID;
+    """, "SELECT MIN(PAR_TIME) AS FIRST_TIME FROM dbo.Xline_time_day", raw_id_column="td.PAR_ID",
+                      sketch_table="Xline_sketch"),
+    # SEQ_ID входит в ключ: значение элемента определяется последовательностью анализов.
+    # Строки без последовательности (SEQ_ID IS NULL) учитываются под SEQ_ID = 0.
+    "L": RollupSource("analytical", "DB_NN_Analytical_data", "Lab_rollup",
+                      (("PROD_ID", "int"), ("LEVEL_ID", "int"), ("SEQ_ID", "int"), ("COLUMN_NAME", "column")),
+                      "PROD_ID", f"""
+        SELECT
+            PROD_ID, LEVEL_ID, COALESCE(SEQ_ID, 0) AS SEQ_ID, PROD_TIME, {", ".join(LAB_VALUE_COLUMNS)}
+        FROM
+            dbo.Lab_data
+        WHERE
+            PROD_TIME BETWEEN @time_start AND @time_end
+            {{ids_filter}}
+        ORDER BY PROD_TIME;
+    """, "SELECT MIN(PROD_TIME) AS FIRST_TIME FROM dbo.Lab_data"),
+}
+
+STATE_SCHEMA = {
+    "sqlite": "CREATE TABLE IF NOT EXISTS Rollup_state (SOURCE_NAME TEXT PRIMARY KEY, REFRESHED_TO DATE NOT NULL)",
+    "mssql": "IF OBJECT_ID('dbo.Rollup_state') IS NULL "
+             "CREATE TABLE dbo.Rollup_state (SOURCE_NAME varchar(32) NOT NULL PRIMARY KEY, REFRESHED_TO date NOT NULL)",
+}
+
+GET_REFRESHED_TO = Statement("rollup_get_refreshed_to", """
+    SELECT REFRESHED_TO FROM dbo.Rollup_state WHERE SOURCE_NAME = @source
+""", (("source", "varchar(32)"),))
+
+DELETE_REFRESHED_TO = Statement("rollup_delete_refreshed_to", """
+    DELETE FROM dbo.Rollup_state WHERE SOURCE_NAME = @source
+""", (("source", "varchar(32)"),))
+
+INSERT_REFRESHED_TO = Statement("rollup_insert_refreshed_to", """
+    INSERT INTO dbo.Rollup_state (SOURCE_NAME, REFRESHED_TO) VALUES (@source, @refreshed_to)
+""", (("source", "varchar(32)"), ("refreshed_to", "date")))
+
+
+class RollupDBModel:
+    """
+    Таблицы итогов одного источника (Tech_rollup, Xline_rollup, Lab_rollup) в базе источника.
+    REFRESHED_TO в Rollup_state - последний день, итоги которого построены по закрытым суткам.
+    """
+
+    def __init__(self, source, pool=None, backend=None):
+        self.source = source
+        self.backend = backend if backend is not None else create_backend()
+        if pool is None:
+            pool = ConnectionPool(source.db, lambda: self.backend.connect(source.db), min_size=0)
+        self.pool = pool
+
+    def ensure_schema(self):
+        """Создает таблицы итогов и состояния, если их еще нет."""
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for schema in self.source.schema(self.backend.name):
+                    cursor.execute(schema)
+                cursor.execute(STATE_SCHEMA["sqlite" if self.backend.name == "sqlite" else "mssql"])
+            connection.commit()
+
+    def get_refreshed_to(self):
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            self.backend.execute(cursor, GET_REFRESHED_TO, source=self.source.name)
+            row = cursor.fetchone()
+            return row["REFRESHED_TO"] if row else None
+
+    def get_first_time(self):
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            self.backend.execute(cursor, self.source.first_time)
+            row = cursor.fetchone()
+            return row["FIRST_TIME"] if row else None
+
+    def get_raw_columns(self, columns, time_start, time_end, ids=None):
+        """
+        Строки источника за период в столбцах numpy ({столбец: dtype}).
+        ids - ключи id_column, строки которых нужны (по умолчанию все); внутри ключа
+        строки упорядочены по времени.
+        """
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            if ids is None:
+                self.backend.execute(cursor, self.source.raw_rows, time_start=time_start, time_end=time_end)
+                return fetch_columns(cursor, columns)
+            parts = []
+            for statement, params in self.source.raw_rows_by_id.bind_chunks(
+                    sorted(set(ids)), time_start=time_start, time_end=time_end):
+                self.backend.execute(cursor, statement, **params)
+                parts.append(fetch_columns(cursor, columns))
+        if not parts:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in columns.items()}
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    def get_day_rollups(self, day_from, day_to):
+        """Суточные итоги всех ключей за дни day_from..day_to в порядке суток."""
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            self.backend.execute(cursor, self.source.day_select, day_from=day_from, day_to=day_to)
+            return cursor.fetchall()
+
+    def replace_rollups(self, day_from, day_to, rows, refreshed_to, sketch_rows=(), month=None):
+        """
+        Заменяет суточные итоги и эскизы дней day_from..day_to (и итог месяца, начинающегося
+        с month, если он задан) строками rows и sketch_rows и отмечает refreshed_to в одной транзакции.
+        """
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                self.backend.execute(cursor, self.source.delete, grain="D", period_from=day_from, period_to=day_to)
+                if month is not None:
+                    self.backend.execute(cursor, self.source.delete, grain="M", period_from=month, period_to=month)
+                if rows:
+                    self.backend.execute_many(cursor, self.source.insert, rows)
+                if self.source.sketch_table is not None:
+                    self.backend.execute(cursor, self.source.sketch_delete,
+                                         period_from=day_from, period_to=day_to)
+                    if sketch_rows:
+                        self.backend.execute_many(cursor, self.source.sketch_insert, sketch_rows)
+                self.backend.execute(cursor, DELETE_REFRESHED_TO, source=self.source.name)
+                self.backend.execute(cursor, INSERT_REFRESHED_TO, source=self.source.name,
+                                     refreshed_to=refreshed_to)
+            connection.commit()
+
+    def get_rollups(self, ids, month_from, month_to, head_from, head_to, tail_from, tail_to):
+        """Итоги по ключам ids: месяцы month_from..month_to и сутки двух краевых диапазонов."""
+        rows = []
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            for statement, params in self.source.select.bind_chunks(
+                    sorted(set(ids)), month_from=month_from, month_to=month_to,
+                    head_from=head_from, head_to=head_to, tail_from=tail_from, tail_to=tail_to):
+                self.backend.execute(cursor, statement, **params)
+                rows.extend(cursor.fetchall())
+        rows.sort(key=lambda row: row["PERIOD_START"])
+        return rows
+
+    def get_sketches(self, ids, day_from, day_to):
+        """Суточные эскизы квантилей по ключам ids за дни day_from..day_to (SKETCH - байты)."""
+        rows = []
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            for statement, params in self.source.sketch_select.bind_chunks(
+                    sorted(set(ids)), day_from=day_from, day_to=day_to):
+                self.backend.execute(cursor, statement, **params)
+                rows.extend(cursor.fetchall())
+        return rows
@@ -0,0 +1,165 @@
+# server/models/series.py
+import numpy as np
+
+# Строки читаются из курсора порциями этого размера
+FETCH_SIZE = 4096
+
+TIME_DTYPE = "datetime64[s]"
+
+# Операции, для которых нулевой делитель - ошибка
+_DIVISIONS = (np.true_divide, np.floor_divide, np.mod)
+
+
+class Series:
+    """
+    Ряд значений шифра за период: столбцы времени и значений в непрерывных массивах.
+
+    times  - numpy datetime64[s], values - numpy float64 той же длины, по возрастанию времени.
+    total  - число строк за период вместе с пустыми (NULL) значениями; пустые значения
+             в values не попадают, total нужен для tave.
+    """
+
+    __slots__ = ("times", "values", "total")
+
+    def __init__(self, times, values, total=None):
+        self.times = times
+        self.values = values
+        self.total = len(values) if total is None else total
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=TIME_DTYPE), np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def from_columns(cls, times, values):
+        """Ряд из столбцов времени и значений; значения NULL отбрасываются."""
+        times = np.asarray(times, dtype=TIME_DTYPE)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        if valid.all():
+            return cls(times, values)
+        return cls(times[valid], values[valid], total=len(values))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __bool__(self):
+        return len(self.values) > 0
+
+    def tolist(self):
+        return self.values.tolist()
+
+    # Поэлементная арифметика: ряд с числом - для каждого значения ряда,
+    # ряд с рядом - по совпадающим моментам времени (значения без пары отбрасываются).
+    # Деление на ноль и переполнение вызывают ZeroDivisionError и ArithmeticError, как и для чисел.
+    def _apply(self, function, other, reflected=False):
+        if isinstance(other, Series):
+            times, left, right = align(self, other)
+        elif isinstance(other, (int, float)):
+            times, left, right = self.times, self.values, other
+        else:
+            return NotImplemented
+        if reflected:
+            left, right = right, left
+        if function in _DIVISIONS and np.any(np.asarray(right) == 0):
+            # Как и для чисел: ноль среди делителей - ошибка, а не пропуск значения
+            raise ZeroDivisionError("Деление на ноль")
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            values = function(left, right)
+        if not np.isfinite(values).all():
+            raise ArithmeticError("Результат вне допустимого диапазона")
+        return Series(times, values)
+
+    def __add__(self, other):
+        return self._apply(np.add, other)
+
+    def __radd__(self, other):
+        return self._apply(np.add, other, reflected=True)
+
+    def __sub__(self, other):
+        return self._apply(np.subtract, other)
+
+    def __rsub__(self, other):
+        return self._apply(np.subtract, other, reflected=True)
+
+    def __mul__(self, other):
+        return self._apply(np.multiply, other)
+
+    def __rmul__(self, other):
+        return self._apply(np.multiply, other, reflected=True)
+
+    def __truediv__(self, other):
+        return self._apply(np.true_divide, other)
+
+    def __rtruediv__(self, other):
+        return self._apply(np.true_divide, other, reflected=True)
+
+    def __floordiv__(self, other):
+        return self._apply(np.floor_divide, other)
+
+    def __rfloordiv__(self, other):
+        return self._apply(np.floor_divide, other, reflected=True)
+
+    def __mod__(self, other):
+        return self._apply(np.mod, other)
+
+    def __rmod__(self, other):
+        return self._apply(np.mod, other, reflected=True)
+
+    def __pow__(self, other):
+        return self._apply(np.power, other)
+
+    def __rpow__(self, other):
+        return self._apply(np.power, other, reflected=True)
+
+    def __neg__(self):
+        return Series(self.times, -self.values)
+
+    def __pos__(self):
+        return self
+
+    def __repr__(self):
+        return f"Series({len(self.values)} значений)"
+
+
+def align(left, right):
+    """
+    Выравнивает два ряда по времени: возвращает общие моменты и значения обоих рядов в них.
+    Ряды с одинаковыми столбцами времени (например, L...P и L...Q одного продукта) не сдвигаются.
+    """
+    if len(left.times) == len(right.times) and np.array_equal(left.times, right.times):
+        return left.times, left.values, right.values
+    times, left_index, right_index = np.intersect1d(left.times, right.times, return_indices=True)
+    return times, left.values[left_index], right.values[right_index]
+
+
+def fetch_columns(cursor, columns, fetch_size=FETCH_SIZE):
+    """
+    Читает строки выполненного запроса порциями fetchmany в столбцы numpy.
+    columns - {имя столбца: dtype}. Decimal приводится к float64, NULL становится NaN.
+    """
+    parts = {column: [] for column in columns}
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for column, dtype in columns.items():
+            parts[column].append(np.array([row[column] for row in rows], dtype=dtype))
+    return {
+        column: np.concatenate(parts[column]) if parts[column] else np.empty(0, dtype=dtype)
+        for column, dtype in columns.items()
+    }
+
+
+def split_by_id(ids, times, values):
+    """Делит столбцы строк нескольких шифров на ряды: {id: Series}, порядок времени сохраняется."""
+    if len(ids) == 0:
+        return {}
+    order = np.argsort(ids, kind="stable")
+    ids, times, values = ids[order], times[order], values[order]
+    unique_ids, starts = np.unique(ids, return_index=True)
+    ends = np.append(starts[1:], len(ids))
+    return {
+        int(par_id): Series.from_columns(times[start:end], values[start:end])
+        for par_id, start, end in zip(unique_ids, starts, ends)
+    }
@@ -0,0 +1,93 @@
+# server/models/statement.py
+import re
+
+# Параметры в тексте запроса записываются как @имя (синтаксис T-SQL)
+PARAMETER_PATTERN = re.compile(r"@(\w+)")
+
+
+class Statement:
+    """
+    Параметризованный запрос с постоянным текстом.
+
+    Значения не подставляются в текст запроса, а передаются отдельно, поэтому
+    SQL Server компилирует план один раз на запрос, а не на каждый шифр и период.
+    params - объявления параметров (имя, тип T-SQL) в порядке их описания.
+    Текст для конкретного драйвера строит хранилище (prepare) и кэширует его.
+    """
+
+    def __init__(self, name, sql, params):
+        self.name = name
+        self.sql = sql
+        self.params = tuple(params)
+        unknown = set(PARAMETER_PATTERN.findall(sql)) - {param_name for param_name, _ in self.params}
+        if unknown:
+            raise ValueError(f"Запрос {name}: не объявлены параметры {sorted(unknown)}")
+
+    def bind(self, **values):
+        """Проверяет, что переданы значения всех параметров, и возвращает их словарь."""
+        missing = [param_name for param_name, _ in self.params if param_name not in values]
+        if missing:
+            raise ValueError(f"Запрос {self.name}: нет значений параметров {missing}")
+        return {param_name: values[param_name] for param_name, _ in self.params}
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+
+class StatementCache:
+    """Текст запросов, подготовленный хранилищем, по именам запросов."""
+
+    def __init__(self, prepare):
+        # prepare(statement) строит текст запроса для драйвера хранилища
+        self.prepare = prepare
+        self.texts = {}
+
+    def text(self, statement):
+        text = self.texts.get(statement.name)
+        if text is None:
+            # Повторная подготовка при гонке потоков безвредна: результат одинаков
+            text = self.prepare(statement)
+            self.texts[statement.name] = text
+        return text
+
+
+class InListStatement:
+    """
+    Запрос со списком значений IN (...) переменной длины.
+
+    Чтобы число разных текстов запроса (и планов) оставалось небольшим, список
+    дополняется повтором последнего значения до ближайшего размера из bucket_sizes;
+    длинные списки делятся на части по наибольшему размеру.
+    В тексте запроса место списка обозначается {ids}, параметры списка - @id0, @id1, ...
+    """
+
+    def __init__(self, name, sql, params, id_type="int", bucket_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256)):
+        self.name = name
+        self.sql = sql
+        self.params = tuple(params)
+        self.id_type = id_type
+        self.bucket_sizes = bucket_sizes
+        self.statements = {}
+
+    def for_size(self, size):
+        statement = self.statements.get(size)
+        if statement is None:
+            ids = ", ".join(f"@id{index}" for index in range(size))
+            id_params = tuple((f"id{index}", self.id_type) for index in range(size))
+            statement = Statement(f"{self.name}_{size}", self.sql.replace("{ids}", ids), id_params + self.params)
+            self.statements[size] = statement
+        return statement
+
+    def bind_chunks(self, ids, **values):
+        """Делит значения на части и возвращает [(Statement, параметры)] по одной на часть."""
+        ids = list(ids)
+        largest = self.bucket_sizes[-1]
+        chunks = []
+        for offset in range(0, len(ids), largest):
+            chunk = ids[offset:offset + largest]
+            size = next(size for size in self.bucket_sizes if size >= len(chunk))
+            padded = chunk + [chunk[-1]] * (size - len(chunk))
+            id_values = {f"id{index}": value for index, value in enumerate(padded)}
+            statement = self.for_size(size)
+            chunks.append((statement, statement.bind(**id_values, **values)))
+        return chunks
@@ -1,18 +1,43 @@
 # server/models/template_db_model.py
 import json
+from contextlib import contextmanager
+
+from server.models.backends.factory import create_backend
+from server.models.connection_pool import ConnectionPool
+
+TEMPLATE_DATABASE = "DB_URD"
 
-import pymssql
 
 class TemplateDBModel:
-    def __init__(self):
-        # Подключаемся к базе данных MS SQL Server
-        self.connection = pymssql.connect(
-            server='localhost',
-            database='DB_URD',
-            as_dict=True,
-            charset="utf8"
+    """
+    Хранилище шаблонов и пользователей.
+
+    Каждый запрос выполняется на своем соединении из пула в отдельной транзакции:
+    изменения одного клиента фиксируются или откатываются целиком и не затрагивают
+    запросы других клиентов, выполняющиеся одновременно.
+    """
+
+    def __init__(self, pool=None, backend=None):
+        # Хранилище (MS SQL Server или SQLite) определяет драйвер и класс ошибок базы данных
+        self.backend = backend if backend is not None else create_backend()
+        self.pool = pool if pool is not None else ConnectionPool(
+            TEMPLATE_DATABASE, lambda: self.backend.connect(TEMPLATE_DATABASE)
         )
 
+    @contextmanager
+    def transaction(self):
+        """
+        Транзакция на соединении из пула: фиксируется по завершении блока with,
+        при исключении откатывается (откат выполняет пул).
+        """
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                connection.commit()
+            finally:
+                cursor.close()
+
     def get_user_by_credentials(self, username, password):
         # Проверка на существование пользователя
         user = self._execute_query(
@@ -111,113 +136,85 @@ class TemplateDBModel:
 
     def save_template(self, template_name, row_count, col_count, cell_data, creation_date, background_color):
         try:
-            cursor = self.connection.cursor()
-
-            # Вставляем шаблон в таблицу Templates
-            cursor.execute("""
-                INSERT INTO Templates (name, creation_date, row_count, column_count, background_color)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (template_name, creation_date, row_count, col_count, background_color))
-
-            # Зафиксировать изменения
-            self.connection.commit()
+            with self.transaction() as cursor:
+                # Вставляем шаблон в таблицу Templates
+                cursor.execute("""
+                    INSERT INTO Templates (name, creation_date, row_count, column_count, background_color)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (template_name, creation_date, row_count, col_count, background_color))
 
-            # Получаем template_id для дальнейшего использования
-            cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
-            template_id = cursor.fetchone()['template_id']
+                # Получаем template_id для дальнейшего использования
+                cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
+                template_id = cursor.fetchone()['template_id']
 
-            # Сохраняем данные ячеек в таблице TemplateCells
-            self._save_template_cells(cursor, template_id, cell_data)
+                # Сохраняем данные ячеек в таблице TemplateCells
+                self._save_template_cells(cursor, template_id, cell_data)
 
-            # Зафиксировать изменения
-            self.connection.commit()
             print("Шаблон успешно сохранен в базе данных.")
             return True
 
-        except pymssql.Error as e:
+        except self.backend.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
-            self.connection.rollback()
             return False
 
-        finally:
-            cursor.close()
-
     def update_template(self, template_name, row_count, col_count, cell_data, creation_date, background_color):
         try:
-            cursor = self.connection.cursor()
-
-            # Обновляем данные о шаблоне в таблице Templates
-            cursor.execute("""
-                UPDATE Templates
-                SET creation_date = %s, row_count = %s, column_count = %s, background_color = %s
-                WHERE name = %s
-            """, (creation_date, row_count, col_count, background_color, template_name))
-
-            # Зафиксировать изменения в таблице Templates
-            self.connection.commit()
-
-            # Получаем template_id для дальнейшего использования
-            cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
-            template_id = cursor.fetchone()['template_id']
-
-            # Удаляем все существующие данные ячеек и их конфигурации для данного шаблона
-            cursor.execute(
-                "DELETE FROM TemplateCellConfigurations "
-                "WHERE cell_id IN "
-                    "(SELECT cell_id "
-                    "FROM TemplateCells "
-                    "WHERE template_id = %s)",
-                (template_id,))
-            cursor.execute("DELETE FROM TemplateCells WHERE template_id = %s", (template_id,))
-
-            self._save_template_cells(cursor, template_id, cell_data)
-
-            self.connection.commit()
+            with self.transaction() as cursor:
+                # Обновляем данные о шаблоне в таблице Templates
+                cursor.execute("""
+                    UPDATE Templates
+                    SET creation_date = %s, row_count = %s, column_count = %s, background_color = %s
+                    WHERE name = %s
+                """, (creation_date, row_count, col_count, background_color, template_name))
+
+                # Получаем template_id для дальнейшего использования
+                cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
+                template_id = cursor.fetchone()['template_id']
+
+                # Удаляем все существующие данные ячеек и их конфигурации для данного шаблона
+                cursor.execute(
+                    "DELETE FROM TemplateCellConfigurations "
+                    "WHERE cell_id IN "
+                        "(SELECT cell_id "
+                        "FROM TemplateCells "
+                        "WHERE template_id = %s)",
+                    (template_id,))
+                cursor.execute("DELETE FROM TemplateCells WHERE template_id = %s", (template_id,))
+
+                self._save_template_cells(cursor, template_id, cell_data)
 
             print("Шаблон успешно обновлен в базе данных.")
             return True
 
-        except pymssql.Error as e:
+        except self.backend.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
-            self.connection.rollback()
             return False
 
-        finally:
-            cursor.close()
-
     def delete_template(self, template_name):
         try:
-            cursor = self.connection.cursor()
-
-            # Получаем template_id для дальнейшего использования
-            cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
-            template_id = cursor.fetchone()['template_id']
-
-            # Удаляем конфигурации ячеек, связанные с шаблоном
-            cursor.execute(
-                "DELETE FROM TemplateCellConfigurations WHERE cell_id IN (SELECT cell_id FROM TemplateCells WHERE template_id = %s)",
-                (template_id,))
+            with self.transaction() as cursor:
+                # Получаем template_id для дальнейшего использования
+                cursor.execute("SELECT template_id FROM Templates WHERE name = %s", (template_name,))
+                template_id = cursor.fetchone()['template_id']
 
-            # Удаляем все существующие данные ячеек для данного шаблона
-            cursor.execute("DELETE FROM TemplateCells WHERE template_id = %s", (template_id,))
+                # Удаляем конфигурации ячеек, связанные с шаблоном
+                cursor.execute(
+                    "DELETE FROM TemplateCellConfigurations WHERE cell_id IN (SELECT cell_id FROM TemplateCells WHERE template_id = %s)",
+                    (template_id,))
 
-            # Удаляем сам шаблон
-            cursor.execute("DELETE FROM Templates WHERE name = %s", (template_name,))
+                # Удаляем все существующие данные ячеек для данного шаблона
+                cursor.execute("DELETE FROM TemplateCells WHERE template_id = %s", (template_id,))
 
-            # Зафиксировать изменения в базе данных
-            self.connection.commit()
+                # Удаляем сам шаблон
+                cursor.execute("DELETE FROM Templates WHERE name = %s", (template_name,))
 
             print(f"Шаблон '{template_name}' успешно удален из базы данных.")
             return True
 
-        except pymssql.Error as e:
+        except self.backend.Error as e:
             print(f"Ошибка выполнения запроса: {e}")
-            self.connection.rollback()
             return False
 
-        finally:
-            cursor.close()
-
     def template_exists(self, template_name):
         result = self._execute_query(
             "SELECT COUNT(*) AS count FROM Templates WHERE name = %s",
@@ -249,41 +246,45 @@ class TemplateDBModel:
 
     def update_accessible_template_names_in_db(self, user_name, template_names):
         try:
-            # Получаем ID пользователя
-            user_id_query = "SELECT user_id FROM dbo.Users WHERE name = %s"
-            user_id = self._execute_query(query=user_id_query, params=(user_name,), fetch_one=True)
-            print(f"User ID = {user_id}")
-            if not user_id:
-                print(f"Пользователь {user_name} не найден")
-                return False
-
-            user_id = user_id['user_id']  # Распаковываем результат fetch_one()
-            print(f"User ID найден: {user_id}")
-
-            # Удаляем записи для данного пользователя
-            delete_query = "DELETE FROM dbo.AvailableTemplates WHERE user_id = %s"
-            self._execute_query(query=delete_query, params=(user_id,))
-            print(f"Удалены старые записи для user_id {user_id}")
-
-            # Получаем ID шаблонов, соответствующих именам
-            template_ids_query = "SELECT template_id FROM Templates WHERE name = %s"
-
-            for template_name in template_names:
-                template_id = self._execute_query(query=template_ids_query, params=(template_name,), fetch_one=True)
-                print(f"Template ID = {template_id}")
-                if template_id:
-                    template_id = template_id["template_id"]  # Распаковываем результат fetch_one()
-                    print(f"Template ID найден для {template_name}: {template_id}")
-
-                    # Добавляем новую запись в таблицу
-                    insert_query = """
-                        INSERT INTO AvailableTemplates (user_id, template_id)
-                        VALUES (%s, %s)
-                    """
-                    self._execute_query(query=insert_query, params=(user_id, template_id))
-                    print(f"Добавлена запись: user_id {user_id}, template_id {template_id}")
-                else:
-                    print(f"Template ID не найден для {template_name}")
+            # Удаление старых и добавление новых записей - одна транзакция
+            with self.transaction() as cursor:
+                # Получаем ID пользователя
+                user_id_query = "SELECT user_id FROM dbo.Users WHERE name = %s"
+                user_id = self._execute_query(query=user_id_query, params=(user_name,), fetch_one=True, cursor=cursor)
+                print(f"User ID = {user_id}")
+                if not user_id:
+                    print(f"Пользователь {user_name} не найден")
+                    return False
+
+                user_id = user_id['user_id']  # Распаковываем результат fetch_one()
+                print(f"User ID найден: {user_id}")
+
+                # Удаляем записи для данного пользователя
+                delete_query = "DELETE FROM dbo.AvailableTemplates WHERE user_id = %s"
+                self._execute_query(query=delete_query, params=(user_id,), cursor=cursor)
+                print(f"Удалены старые записи для user_id {user_id}")
+
+                # Получаем ID шаблонов, соответствующих именам
+                template_ids_query = "SELECT template_id FROM Templates WHERE name = %s"
+
+                for template_name in template_names:
+                    template_id = self._execute_query(
+                        query=template_ids_query, params=(template_name,), fetch_one=True, cursor=cursor
+                    )
+                    print(f"Template ID = {template_id}")
+                    if template_id:
+                        template_id = template_id["template_id"]  # Распаковываем результат fetch_one()
+                        print(f"Template ID найден для {template_name}: {template_id}")
+
+                        # Добавляем новую запись в таблицу
+                        insert_query = """
+                            INSERT INTO AvailableTemplates (user_id, template_id)
+                            VALUES (%s, %s)
+                        """
+                        self._execute_query(query=insert_query, params=(user_id, template_id), cursor=cursor)
+                        print(f"Добавлена запись: user_id {user_id}, template_id {template_id}")
+                    else:
+                        print(f"Template ID не найден для {template_name}")
 
             print(f"Обновлены доступные шаблоны для пользователя {user_name}: {template_names}")
             return True
@@ -292,56 +293,53 @@ class TemplateDBModel:
             print(f"Ошибка при обновлении шаблонов: {e}")
             return False
 
-    def _execute_query(self, query, params=None, fetch_one=False, fetch_all=False):
-        try:
-            cursor = self.connection.cursor()
+    def _execute_query(self, query, params=None, fetch_one=False, fetch_all=False, cursor=None):
+        """
+        Выполняет запрос в транзакции cursor или, если она не передана, в отдельной транзакции.
+        В транзакции вызывающего ошибки не перехватываются, чтобы она откатилась целиком.
+        """
+        if cursor is not None:
             cursor.execute(query, params)
-
             if fetch_one:
                 return cursor.fetchone()
             elif fetch_all:
                 return cursor.fetchall()
-            else:
-                return None
-        except pymssql.Error as e:
-            print(f"Ошибка выполнения запроса: {e}")
             return None
-        finally:
-            cursor.close()
 
-    def _save_template_cells(self, cursor, template_id, cell_data):
         try:
-            cells = json.loads(cell_data)
-            for cell in cells:
-                cell_name = cell['cell_name']
-                value = cell['value']
-                config = cell['config']
+            with self.transaction() as cursor:
+                return self._execute_query(query, params, fetch_one, fetch_all, cursor)
+        except self.backend.Error as e:
+            print(f"Ошибка выполнения запроса: {e}")
+            return None
 
-                # Сохраняем данные ячейки в таблице TemplateCells
-                cursor.execute("""
-                            INSERT INTO TemplateCells (template_id, cell_name, data)
-                            VALUES (%s, %s, %s)
-                        """, (template_id, cell_name, value))
+    def _save_template_cells(self, cursor, template_id, cell_data):
+        """Сохраняет ячейки в транзакции вызывающего; при ошибке она откатывается целиком."""
+        cells = json.loads(cell_data)
+        for cell in cells:
+            cell_name = cell['cell_name']
+            value = cell['value']
+            config = cell['config']
+
+            # Сохраняем данные ячейки в таблице TemplateCells
+            cursor.execute("""
+                        INSERT INTO TemplateCells (template_id, cell_name, data)
+                        VALUES (%s, %s, %s)
+                    """, (template_id, cell_name, value))
 
-                # Получаем cell_id для связи с таблицей конфигураций
-                cursor.execute("SELECT cell_id FROM TemplateCells WHERE template_id = %s AND cell_name = %s",
-                               (template_id, cell_name))
-                cell_id = cursor.fetchone()['cell_id']
+            # Получаем cell_id для связи с таблицей конфигураций
+            cursor.execute("SELECT cell_id FROM TemplateCells WHERE template_id = %s AND cell_name = %s",
+                           (template_id, cell_name))
+            cell_id = cursor.fetchone()['cell_id']
 
-                # Сохраняем конфигурацию ячейки в таблице TemplateCellConfigurations
-                cursor.execute("""
-                    INSERT INTO TemplateCellConfigurations (cell_id, background_color, height, width,
-                    text_color, font, format, text_tilt, underline, text_size, cell_name, merger, bold)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (cell_id, config.get('background_color'), config.get('height'), config.get('width'),
-                      config.get('text_color'), config.get('font'), config.get('format'),
-                      config.get('text_tilt'), config.get('underline'), config.get('text_size'), cell_name,
-                      config.get('merger'), config.get('bold')))
-
-            self.connection.commit()
-            print("Все ячейки и их конфигурации успешно сохранены.")
-        except pymssql.Error as e:
-            print(f"Ошибка сохранения ячеек: {e}")
-            self.connection.rollback()
-        finally:
-            cursor.close()
+            # Сохраняем конфигурацию ячейки в таблице TemplateCellConfigurations
+            cursor.execute("""
+                INSERT INTO TemplateCellConfigurations (cell_id, background_color, height, width,
+                text_color, font, format, text_tilt, underline, text_size, cell_name, merger, bold)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (cell_id, config.get('background_color'), config.get('height'), config.get('width'),
+                  config.get('text_color'), config.get('font'), config.get('format'),
+                  config.get('text_tilt'), config.get('underline'), config.get('text_size'), cell_name,
+                  config.get('merger'), config.get('bold')))
+
+        print("Все ячейки и их конфигурации успешно сохранены.")
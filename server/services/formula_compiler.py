@@ -0,0 +1,341 @@
+# server/services/formula_compiler.py
+import operator
+import re
+from functools import lru_cache
+
+# Лексемы формулы. Аналитический шифр L<продукт>.<уровень>.<элемент>.<P|Q|T>
+# проверяется раньше имен, остальные шифры (T..., X...) разбираются как имена.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<analytic>L\d+(?:\.\d+)?(?:\.\w+)?(?:\.[PQT])?(?![\w.]))
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\*\*|//|[-+*/%(),])
+""", re.VERBOSE)
+
+BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "**": operator.pow,
+}
+UNARY_OPERATORS = {"+": operator.pos, "-": operator.neg}
+
+# Функции-справочники получают шифр, а не его значения за период
+PRODUCT_INFO_FUNCTIONS = {"getNameProd": "LTX", "getUnitProd": "TX"}
+PERIOD_FUNCTIONS = ("start_date", "end_date")
+# Функции, которые для шифра-аргумента могут быть вычислены в SQL (агрегат вместо ряда)
+AGGREGATE_FUNCTIONS = ("ave", "sum", "min", "max", "count", "lst", "snm", "tave")
+# Квантили шифра: median(T1), pct(T1, 95), iqr(T1); median и pct на длинных периодах - по суточным эскизам
+QUANTILE_FUNCTIONS = ("median", "pct", "iqr")
+
+FORMULA_CACHE_SIZE = 4096
+
+
+class FormulaError(Exception):
+    """Ошибка вычисления формулы; текст возвращается клиенту как [ERROR: текст]."""
+
+
+class FormulaContext:
+    """
+    Данные для вычисления формулы: значения шифров за период,
+    функции над рядами и справочники продуктов.
+    """
+
+    def __init__(self, values, time_start, time_end, functions, product_info):
+        self.values = values
+        self.time_start = time_start
+        self.time_end = time_end
+        self.functions = functions
+        # product_info(функция, тип шифра, номер) - имя или единица продукта
+        self.product_info = product_info
+
+
+class Number:
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, context):
+        return self.value
+
+
+class Cipher:
+    def __init__(self, cipher):
+        self.cipher = cipher
+
+    def evaluate(self, context):
+        value = context.values[self.cipher]
+        if isinstance(value, str):
+            raise FormulaError(value)
+        return value
+
+
+class UnknownName:
+    def __init__(self, name):
+        self.name = name
+
+    def evaluate(self, context):
+        raise FormulaError("Некорректное имя переменной или функции")
+
+
+class UnaryOperation:
+    def __init__(self, symbol, operand):
+        self.function = UNARY_OPERATORS[symbol]
+        self.operand = operand
+
+    def evaluate(self, context):
+        operand = self.operand.evaluate(context)
+        try:
+            return self.function(operand)
+        except TypeError as e:
+            raise FormulaError(f"Неизвестная ошибка: {e}")
+
+
+class BinaryOperation:
+    def __init__(self, symbol, left, right):
+        self.function = BINARY_OPERATORS[symbol]
+        self.left = left
+        self.right = right
+
+    def evaluate(self, context):
+        left = self.left.evaluate(context)
+        right = self.right.evaluate(context)
+        try:
+            return self.function(left, right)
+        except ZeroDivisionError:
+            raise FormulaError("Деление на ноль")
+        except ArithmeticError:
+            raise FormulaError("Результат вне допустимого диапазона")
+        except TypeError as e:
+            raise FormulaError(f"Неизвестная ошибка: {e}")
+
+
+class FunctionCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def evaluate(self, context):
+        function = context.functions.get(self.name)
+        if function is None:
+            raise FormulaError(f"Функция '{self.name}' не поддерживается")
+        values = [arg.evaluate(context) for arg in self.args]
+        # Несколько аргументов передаются кортежем: max(a, b) == max((a, b))
+        argument = values[0] if len(values) == 1 else tuple(values)
+        try:
+            return function(argument)
+        except Exception:
+            raise FormulaError("Ошибка ввода")
+
+
+class Aggregate(FunctionCall):
+    """
+    Функция от одного шифра (и числовых параметров, как процент в pct). Если агрегат
+    уже вычислен в SQL или по эскизам, его значение лежит в context.values под ключом
+    (функция, шифр, *параметры); иначе функция вычисляется над рядом.
+    """
+
+    def __init__(self, name, cipher, params=()):
+        super().__init__(name, [cipher] + [Number(param) for param in params])
+        self.key = (name, cipher.cipher) + tuple(params)
+
+    def evaluate(self, context):
+        value = context.values.get(self.key)
+        if value is None:
+            return super().evaluate(context)
+        if isinstance(value, str):
+            raise FormulaError(value)
+        return value
+
+
+class PeriodBound:
+    def __init__(self, name):
+        self.name = name
+
+    def evaluate(self, context):
+        return context.time_start if self.name == "start_date" else context.time_end
+
+
+class ProductInfo:
+    def __init__(self, name, cipher_type, product):
+        self.name = name
+        self.cipher_type = cipher_type
+        self.product = product
+
+    def evaluate(self, context):
+        return context.product_info(self.name, self.cipher_type, self.product)
+
+
+class Formula:
+    """
+    Скомпилированная формула ячейки.
+    ciphers    - {шифр: тип (T, L, X)} в порядке появления, их значения запрашиваются в БД;
+    series     - шифры, чей ряд значений нужен целиком (используются вне агрегатов);
+    aggregates - {(функция, шифр, *параметры): тип} для функций от одного шифра, которые
+                 можно вычислить в SQL или по эскизам квантилей, если ряд шифра не нужен;
+    error      - текст синтаксической ошибки, если формулу не удалось разобрать.
+    """
+
+    def __init__(self, root=None, ciphers=None, series=None, aggregates=None, error=None):
+        self.root = root
+        self.ciphers = ciphers or {}
+        self.series = series if series is not None else dict(self.ciphers)
+        self.aggregates = aggregates or {}
+        self.error = error
+
+    def evaluate(self, context):
+        if self.error is not None:
+            raise FormulaError(self.error)
+        return self.root.evaluate(context)
+
+
+class Parser:
+    """
+    Разбор формулы рекурсивным спуском:
+        expression := term (("+" | "-") term)*
+        term       := unary (("*" | "/" | "//" | "%") unary)*
+        unary      := ("+" | "-") unary | power
+        power      := primary ("**" unary)?
+        primary    := number | шифр | имя "(" аргументы ")" | "(" expression ")"
+    """
+
+    def __init__(self, text):
+        self.tokens = self.tokenize(text)
+        self.position = 0
+        self.ciphers = {}
+        self.aggregates = {}
+        # Число вхождений шифра вне агрегатов
+        self.direct_uses = {}
+
+    @staticmethod
+    def tokenize(text):
+        tokens = []
+        position = 0
+        while position < len(text):
+            match = TOKEN_PATTERN.match(text, position)
+            if match is None:
+                raise SyntaxError(f"Недопустимый символ {text[position]!r}")
+            if match.lastgroup != "space":
+                tokens.append((match.lastgroup, match.group()))
+            position = match.end()
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value):
+            raise SyntaxError(f"Ожидалось {value or 'выражение'}")
+        self.position += 1
+        return kind, text
+
+    def accept(self, *values):
+        kind, text = self.peek()
+        if kind == "op" and text in values:
+            self.position += 1
+            return text
+        return None
+
+    def parse(self):
+        root = self.expression()
+        if self.peek()[0] is not None:
+            raise SyntaxError(f"Лишний символ {self.peek()[1]!r}")
+        return root
+
+    def expression(self):
+        node = self.term()
+        while True:
+            symbol = self.accept("+", "-")
+            if symbol is None:
+                return node
+            node = BinaryOperation(symbol, node, self.term())
+
+    def term(self):
+        node = self.unary()
+        while True:
+            symbol = self.accept("*", "/", "//", "%")
+            if symbol is None:
+                return node
+            node = BinaryOperation(symbol, node, self.unary())
+
+    def unary(self):
+        symbol = self.accept("+", "-")
+        if symbol is not None:
+            return UnaryOperation(symbol, self.unary())
+        node = self.primary()
+        if self.accept("**"):
+            node = BinaryOperation("**", node, self.unary())
+        return node
+
+    def primary(self):
+        kind, text = self.take()
+        if kind == "number":
+            return Number(float(text) if any(char in text for char in ".eE") else int(text))
+        if kind == "analytic":
+            return self.cipher(text, "L")
+        if kind == "op" and text == "(":
+            node = self.expression()
+            self.take(")")
+            return node
+        if kind == "name":
+            if self.accept("("):
+                return self.call(text)
+            if len(text) > 1 and text[0] in "TX":
+                return self.cipher(text, text[0])
+            return UnknownName(text)
+        raise SyntaxError(f"Неожиданный символ {text!r}")
+
+    def call(self, name):
+        if name in PRODUCT_INFO_FUNCTIONS:
+            kind, text = self.take()
+            match = re.fullmatch(r"([LTX])(\d+)", text) if kind in ("name", "analytic") else None
+            self.take(")")
+            if match is None or match.group(1) not in PRODUCT_INFO_FUNCTIONS[name]:
+                raise SyntaxError(f"Некорректный шифр в {name}")
+            return ProductInfo(name, match.group(1), match.group(2))
+        if name in PERIOD_FUNCTIONS:
+            self.take(")")
+            return PeriodBound(name)
+        args = [self.expression()]
+        while self.accept(","):
+            args.append(self.expression())
+        self.take(")")
+        if name in AGGREGATE_FUNCTIONS and len(args) == 1 and isinstance(args[0], Cipher):
+            cipher = args[0].cipher
+            self.direct_uses[cipher] -= 1
+            self.aggregates[(name, cipher)] = self.ciphers[cipher]
+            return Aggregate(name, args[0])
+        if (name in QUANTILE_FUNCTIONS and isinstance(args[0], Cipher)
+                and all(isinstance(arg, Number) for arg in args[1:])):
+            cipher = args[0].cipher
+            params = tuple(arg.value for arg in args[1:])
+            self.direct_uses[cipher] -= 1
+            self.aggregates[(name, cipher) + params] = self.ciphers[cipher]
+            return Aggregate(name, args[0], params)
+        return FunctionCall(name, args)
+
+    def cipher(self, text, cipher_type):
+        self.ciphers.setdefault(text, cipher_type)
+        self.direct_uses[text] = self.direct_uses.get(text, 0) + 1
+        return Cipher(text)
+
+    def series(self):
+        return {cipher: cipher_type for cipher, cipher_type in self.ciphers.items() if self.direct_uses[cipher] > 0}
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_formula(text):
+    """
+    Компилирует текст формулы (без знака "=") в дерево вычисления.
+    Результат кэшируется по тексту: одинаковые формулы разбираются один раз.
+    """
+    try:
+        parser = Parser(text)
+        root = parser.parse()
+    except SyntaxError:
+        return Formula(error="Синтаксическая ошибка в выражении")
+    return Formula(root, parser.ciphers, parser.series(), parser.aggregates)
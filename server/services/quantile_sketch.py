@@ -0,0 +1,100 @@
+# server/services/quantile_sketch.py
+"""
+Объединяемый эскиз квантилей с относительной погрешностью (по схеме DDSketch).
+
+Значение x попадает в корзину с номером ceil(log_gamma(|x|)), gamma = (1 + a) / (1 - a):
+любой квантиль восстанавливается с относительной погрешностью не больше a.
+Эскизы складываются сложением счетчиков корзин, поэтому квантиль за год
+получается объединением суточных эскизов без чтения исходных строк.
+"""
+import math
+import struct
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Значения по модулю меньше считаются нулем
+MIN_VALUE = 1e-9
+
+_HEADER = struct.Struct("<dqii")
+
+
+class QuantileSketch:
+    """Эскиз квантилей: счетчики корзин положительных и отрицательных значений и число нулей."""
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, values):
+        """Добавляет значения (массив float64, NaN пропускаются)."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        magnitudes = np.abs(values)
+        self.zero_count += int((magnitudes < MIN_VALUE).sum())
+        for store, selected in ((self.positive, values >= MIN_VALUE), (self.negative, values <= -MIN_VALUE)):
+            if not selected.any():
+                continue
+            indexes = np.ceil(np.log(magnitudes[selected]) / self.log_gamma).astype(np.int64)
+            for index, count in zip(*np.unique(indexes, return_counts=True)):
+                store[int(index)] = store.get(int(index), 0) + int(count)
+        return self
+
+    def merge(self, other):
+        """Добавляет счетчики другого эскиза с той же точностью."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Эскизы с разной точностью не объединяются")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zero_count += other.zero_count
+        return self
+
+    def quantile(self, q):
+        """Квантиль q (0..1) с относительной погрешностью relative_accuracy; None для пустого эскиза."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        # Отрицательные значения по возрастанию: от наибольших по модулю корзин
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def _value(self, index):
+        # Середина корзины (gamma**(i-1), gamma**i] с равной относительной погрешностью к краям
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def to_bytes(self):
+        positive = np.array(sorted(self.positive.items()), dtype=np.int64).reshape(-1, 2)
+        negative = np.array(sorted(self.negative.items()), dtype=np.int64).reshape(-1, 2)
+        header = _HEADER.pack(self.relative_accuracy, self.zero_count, len(positive), len(negative))
+        return header + positive.tobytes() + negative.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        relative_accuracy, zero_count, positive_count, negative_count = _HEADER.unpack_from(data)
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = zero_count
+        pairs = np.frombuffer(bytes(data), dtype=np.int64, offset=_HEADER.size).reshape(-1, 2)
+        sketch.positive = {int(index): int(count) for index, count in pairs[:positive_count]}
+        sketch.negative = {int(index): int(count) for index, count in pairs[positive_count:positive_count + negative_count]}
+        return sketch
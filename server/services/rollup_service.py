@@ -0,0 +1,405 @@
+# server/services/rollup_service.py
+import datetime
+import threading
+import time
+
+import numpy as np
+
+from server.models.connection_pool import ConnectionPoolRegistry
+from server.models.rollup_db_model import LAB_VALUE_COLUMNS, ROLLUP_SOURCES, RollupDBModel
+from server.services.quantile_sketch import QuantileSketch
+
+_DAY = datetime.timedelta(days=1)
+_SECOND = datetime.timedelta(seconds=1)
+
+
+def summarize(key_columns, buckets, values):
+    """
+    Итоги значений по группам (ключ, период) одним проходом numpy.
+
+    key_columns - массивы столбцов ключа, buckets - период строки (datetime64[D] или [M]),
+    values - float64 с NaN на месте NULL; строки упорядочены по времени.
+    Возвращает (ключи групп, периоды групп, {столбец итога: массив}).
+    """
+    if len(values) == 0:
+        return [column[:0] for column in key_columns], buckets[:0], None
+    # lexsort устойчив: внутри группы строки остаются в порядке времени
+    order = np.lexsort([buckets] + list(reversed(key_columns)))
+    key_columns = [column[order] for column in key_columns]
+    buckets = buckets[order]
+    values = values[order]
+
+    changed = buckets[1:] != buckets[:-1]
+    for column in key_columns:
+        changed |= column[1:] != column[:-1]
+    starts = np.flatnonzero(np.concatenate(([True], changed)))
+    valid = ~np.isnan(values)
+
+    first = np.full(len(starts), np.nan)
+    last = np.full(len(starts), np.nan)
+    positions = np.flatnonzero(valid)
+    if len(positions):
+        groups = np.searchsorted(starts, positions, side="right") - 1
+        group_ids, first_index = np.unique(groups, return_index=True)
+        first[group_ids] = values[positions[first_index]]
+        group_ids, last_index = np.unique(groups[::-1], return_index=True)
+        last[group_ids] = values[positions[::-1][last_index]]
+
+    totals = {
+        "TOTAL_COUNT": np.diff(np.append(starts, len(values))),
+        "VALUE_COUNT": np.add.reduceat(valid.astype(np.int64), starts),
+        "VALUE_SUM": np.add.reduceat(np.where(valid, values, 0.0), starts),
+        "VALUE_MIN": np.fmin.reduceat(values, starts),
+        "VALUE_MAX": np.fmax.reduceat(values, starts),
+        "FIRST_VALUE": first,
+        "LAST_VALUE": last,
+    }
+    return [column[starts] for column in key_columns], buckets[starts], totals
+
+
+def merge_aggregates(parts):
+    """
+    Объединяет итоги соседних периодов (в порядке времени) в итог всего периода:
+    {"total", "count", "sum", "ave", "min", "max", "snm", "lst"}.
+    """
+    merged = {"total": 0, "count": 0, "sum": 0.0, "min": None, "max": None, "snm": None, "lst": None}
+    for part in parts:
+        merged["total"] += part["total"]
+        if not part["count"]:
+            continue
+        merged["count"] += part["count"]
+        merged["sum"] += part["sum"]
+        merged["min"] = part["min"] if merged["min"] is None else min(merged["min"], part["min"])
+        merged["max"] = part["max"] if merged["max"] is None else max(merged["max"], part["max"])
+        if merged["snm"] is None:
+            merged["snm"] = part["snm"]
+        merged["lst"] = part["lst"]
+    merged["ave"] = merged["sum"] / merged["count"] if merged["count"] else None
+    return merged
+
+
+def merge_month_rows(key_names, month, day_rows):
+    """
+    Строки итогов месяца month, собранные из строк суточных итогов его дней
+    (в порядке суток; имена столбцов в нижнем регистре).
+    """
+    parts = {}
+    for row in day_rows:
+        parts.setdefault(tuple(row[name.lower()] for name in key_names), []).append({
+            "total": row["total_count"], "count": row["value_count"], "sum": row["value_sum"],
+            "min": row["value_min"], "max": row["value_max"],
+            "snm": row["first_value"], "lst": row["last_value"],
+        })
+    rows = []
+    for key, key_parts in parts.items():
+        merged = merge_aggregates(key_parts)
+        row = {name.lower(): value for name, value in zip(key_names, key)}
+        row.update(grain="M", period_start=month, total_count=merged["total"], value_count=merged["count"],
+                   value_sum=merged["sum"] if merged["count"] else None, value_min=merged["min"],
+                   value_max=merged["max"], first_value=merged["snm"], last_value=merged["lst"])
+        rows.append(row)
+    return rows
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return datetime.datetime.fromisoformat(str(value))
+
+
+def _none_if_nan(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class RollupService:
+    """
+    Итоги по суткам и месяцам для Tech_data_day, Xline_data_day и Lab_data.
+
+    Итоги строятся только по закрытым суткам (до вчерашнего дня) и обновляются, когда
+    закрываются новые сутки: по сырым строкам пересчитываются итоги суток, начиная
+    с REFRESHED_TO - lookback_days (чтобы учесть поздно введенные значения), а итог
+    закрытого месяца собирается из суточных итогов. Агрегаты за период собираются из итогов
+    полных месяцев, итогов суток по краям и сырых строк неполных суток на границах периода.
+
+    Для T и X вместе с итогами суток хранятся эскизы квантилей (QuantileSketch): квантили
+    периода не короче exact_max_days полных суток собираются объединением эскизов,
+    более короткие периоды считаются точно по ряду значений.
+    """
+
+    def __init__(self, report_pools=None, backend=None, lookback_days=3, refresh_interval=900.0,
+                 exact_max_days=31):
+        self.backend = backend
+        self.report_pools = report_pools if report_pools is not None else ConnectionPoolRegistry(backend.connect)
+        self.lookback_days = lookback_days
+        self.refresh_interval = refresh_interval
+        self.exact_max_days = exact_max_days
+        self.models = {
+            source_type: RollupDBModel(source, self.report_pools.get(source.db), backend)
+            for source_type, source in ROLLUP_SOURCES.items()
+        }
+        # Последний день, покрытый итогами, по источникам
+        self.refreshed_to = {}
+        self.refresh_lock = threading.Lock()
+        self.refresher = None
+
+    def ensure_schema(self):
+        for source_type, model in self.models.items():
+            model.ensure_schema()
+            self.refreshed_to[source_type] = model.get_refreshed_to()
+
+    def start_refresher(self):
+        """Обновляет итоги в фоновом потоке каждые refresh_interval секунд."""
+        if self.refresher is not None:
+            return
+        self.refresher = threading.Thread(target=self._refresh_loop, name="rollup-refresher", daemon=True)
+        self.refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Ошибка при обновлении итогов: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, today=None):
+        """Дополняет итоги всех источников по вчерашний день включительно."""
+        last_closed = (today or datetime.date.today()) - _DAY
+        with self.refresh_lock:
+            for source_type in self.models:
+                self.refresh_source(source_type, last_closed)
+
+    def refresh_source(self, source_type, last_closed):
+        model = self.models[source_type]
+        refreshed_to = model.get_refreshed_to()
+        if refreshed_to is None:
+            first_time = model.get_first_time()
+            if first_time is None:
+                return
+            day_from = _as_datetime(first_time).date()
+        elif last_closed <= refreshed_to:
+            return
+        else:
+            day_from = refreshed_to - datetime.timedelta(days=self.lookback_days)
+
+        # Сутки пересчитываются по месяцам, чтобы итог закрытого месяца записывался вместе с ними
+        source = ROLLUP_SOURCES[source_type]
+        while day_from <= last_closed:
+            month = _month_start(day_from)
+            month_end = _next_month(month) - _DAY
+            day_to = min(month_end, last_closed)
+            rows, sketch_rows = self.build_rollups(source_type, day_from, day_to)
+            complete_month = month_end <= last_closed
+            if complete_month:
+                day_rows = [{name.lower(): value for name, value in row.items()}
+                            for row in model.get_day_rollups(month, day_from - _DAY)] if day_from > month else []
+                rows = rows + merge_month_rows(source.key_names, month, day_rows + rows)
+            model.replace_rollups(day_from, day_to, rows, refreshed_to=day_to, sketch_rows=sketch_rows,
+                                  month=month if complete_month else None)
+            self.refreshed_to[source_type] = day_to
+            day_from = month_end + _DAY
+
+    def build_rollups(self, source_type, day_from, day_to):
+        """
+        Строки итогов по суткам за дни day_from..day_to и строки суточных эскизов
+        квантилей (для источников с таблицей эскизов).
+        """
+        columns = self.read_raw(source_type, _as_datetime(day_from), _as_datetime(day_to + _DAY) - _SECOND)
+        buckets = columns["time"].astype("datetime64[D]")
+        rows = []
+        for value_column, values in columns["values"].items():
+            keys, periods, totals = summarize(columns["keys"], buckets, values)
+            if totals is None:
+                continue
+            for index, period_start in enumerate(periods.astype(object)):
+                row = {name.lower(): int(keys[position][index])
+                       for position, name in enumerate(columns["key_names"])}
+                if value_column is not None:
+                    row["column_name"] = value_column
+                row.update(grain="D", period_start=period_start,
+                           total_count=int(totals["TOTAL_COUNT"][index]),
+                           value_count=int(totals["VALUE_COUNT"][index]))
+                for column in ("VALUE_SUM", "VALUE_MIN", "VALUE_MAX", "FIRST_VALUE", "LAST_VALUE"):
+                    row[column.lower()] = _none_if_nan(totals[column][index])
+                if not row["value_count"]:
+                    row["value_sum"] = None
+                rows.append(row)
+        sketch_rows = []
+        if ROLLUP_SOURCES[source_type].sketch_table is not None:
+            sketch_rows = self.build_sketches(columns)
+        return rows, sketch_rows
+
+    @staticmethod
+    def build_sketches(columns):
+        """Строки эскизов квантилей по суткам для источника с одним столбцом ключа и значения."""
+        ids = columns["keys"][0]
+        days = columns["time"].astype("datetime64[D]")
+        values = columns["values"][None]
+        valid = ~np.isnan(values)
+        ids, days, values = ids[valid], days[valid], values[valid]
+        if len(values) == 0:
+            return []
+        order = np.lexsort([days, ids])
+        ids, days, values = ids[order], days[order], values[order]
+        starts = np.flatnonzero(np.concatenate(([True], (ids[1:] != ids[:-1]) | (days[1:] != days[:-1]))))
+        ends = np.append(starts[1:], len(values))
+        name = columns["key_names"][0].lower()
+        return [
+            {name: int(ids[start]), "period_start": days[start].astype(object),
+             "sketch": QuantileSketch().add(values[start:end]).to_bytes()}
+            for start, end in zip(starts, ends)
+        ]
+
+    def read_raw(self, source_type, time_start, time_end, ids=None):
+        """
+        Сырые строки источника за период в столбцах: ключи, время и столбцы значений
+        ({None: PAR_VALUE} для T и X, {"Q": ..., "EL1": ...} для Lab_data).
+        ids - PAR_ID (PROD_ID для L), строки которых нужны; по умолчанию все.
+        """
+        model = self.models[source_type]
+        if source_type == "L":
+            key_names = ("PROD_ID", "LEVEL_ID", "SEQ_ID")
+            value_names = LAB_VALUE_COLUMNS
+            time_name = "PROD_TIME"
+        else:
+            key_names = ("PAR_ID",)
+            value_names = ("PAR_VALUE",)
+            time_name = "PAR_TIME"
+        dtypes = {name: np.int64 for name in key_names}
+        dtypes[time_name] = "datetime64[s]"
+        dtypes.update((name, np.float64) for name in value_names)
+        raw = model.get_raw_columns(dtypes, time_start, time_end, ids)
+        values = ({name: raw[name] for name in value_names} if source_type == "L"
+                  else {None: raw["PAR_VALUE"]})
+        return {"key_names": key_names, "keys": [raw[name] for name in key_names],
+                "time": raw[time_name], "values": values}
+
+    def get_aggregates(self, source_type, ids, time_start, time_end):
+        """
+        Агрегаты за период по итогам: {ключ: {"total", "count", "sum", "ave", "min", "max", "snm", "lst"}},
+        ключ - PAR_ID для T и X, (PROD_ID, LEVEL_ID, SEQ_ID, столбец) для L (ids - PROD_ID).
+        Возвращает None, если в периоде нет полных суток, покрытых итогами.
+        """
+        start = _as_datetime(time_start)
+        end = _as_datetime(time_end)
+        covered = self._covered_days(source_type, start, end)
+        if covered is None:
+            return None
+        first_full, last_full = covered
+
+        # Полные месяцы внутри [first_full, last_full] берутся из месячных итогов, края - из суточных
+        month_from = first_full if first_full.day == 1 else _next_month(first_full)
+        month_to_end = last_full if (last_full + _DAY).day == 1 else _month_start(last_full) - _DAY
+        empty = (first_full, first_full - _DAY)
+        if month_from > month_to_end:
+            months, head, tail = empty, (first_full, last_full), empty
+        else:
+            months = (month_from, _month_start(month_to_end))
+            head = (first_full, month_from - _DAY)
+            tail = (month_to_end + _DAY, last_full)
+
+        ids = set(ids)
+        parts = {}
+        raw_head_end = _as_datetime(first_full) - _SECOND
+        if start <= raw_head_end:
+            self._add_raw_parts(parts, source_type, ids, start, raw_head_end)
+        source = ROLLUP_SOURCES[source_type]
+        for row in self.models[source_type].get_rollups(ids, months[0], months[1], head[0], head[1],
+                                                         tail[0], tail[1]):
+            key = row[source.key_names[0]] if len(source.key_names) == 1 else \
+                tuple(row[name] for name in source.key_names)
+            parts.setdefault(key, []).append({
+                "total": row["TOTAL_COUNT"], "count": row["VALUE_COUNT"], "sum": row["VALUE_SUM"],
+                "min": row["VALUE_MIN"], "max": row["VALUE_MAX"],
+                "snm": row["FIRST_VALUE"], "lst": row["LAST_VALUE"],
+            })
+        raw_tail_start = _as_datetime(last_full + _DAY)
+        if raw_tail_start <= end:
+            self._add_raw_parts(parts, source_type, ids, raw_tail_start, end)
+        return {key: merge_aggregates(key_parts) for key, key_parts in parts.items()}
+
+    def get_sketches(self, source_type, ids, time_start, time_end):
+        """
+        Эскизы квантилей за период по PAR_ID: {PAR_ID: QuantileSketch}. Суточные эскизы
+        полных суток объединяются, строки неполных суток на границах добавляются из источника.
+        Возвращает None, если полных суток, покрытых итогами, меньше exact_max_days:
+        такой период дешевле и точнее посчитать по ряду значений.
+        """
+        if ROLLUP_SOURCES[source_type].sketch_table is None:
+            return None
+        start = _as_datetime(time_start)
+        end = _as_datetime(time_end)
+        covered = self._covered_days(source_type, start, end)
+        if covered is None:
+            return None
+        first_full, last_full = covered
+        if (last_full - first_full).days + 1 < self.exact_max_days:
+            return None
+
+        ids = set(ids)
+        sketches = {par_id: QuantileSketch() for par_id in ids}
+        for row in self.models[source_type].get_sketches(ids, first_full, last_full):
+            sketches[row["PAR_ID"]].merge(QuantileSketch.from_bytes(row["SKETCH"]))
+        raw_head_end = _as_datetime(first_full) - _SECOND
+        if start <= raw_head_end:
+            self._add_raw_sketches(sketches, source_type, ids, start, raw_head_end)
+        raw_tail_start = _as_datetime(last_full + _DAY)
+        if raw_tail_start <= end:
+            self._add_raw_sketches(sketches, source_type, ids, raw_tail_start, end)
+        return sketches
+
+    def _covered_days(self, source_type, start, end):
+        """Первые и последние полные сутки периода, покрытые итогами, или None."""
+        refreshed_to = self.refreshed_to.get(source_type)
+        if refreshed_to is None:
+            return None
+        first_full = start.date() if start.time() == datetime.time() else start.date() + _DAY
+        last_full = end.date() if end.time() >= datetime.time(23, 59, 59) else end.date() - _DAY
+        last_full = min(last_full, refreshed_to)
+        if first_full > last_full:
+            return None
+        return first_full, last_full
+
+    def _add_raw_sketches(self, sketches, source_type, ids, time_start, time_end):
+        """Значения неполных суток на границе периода в эскизы sketches."""
+        columns = self.read_raw(source_type, time_start, time_end, ids)
+        order = np.argsort(columns["keys"][0], kind="stable")
+        par_ids = columns["keys"][0][order]
+        values = columns["values"][None][order]
+        unique_ids, starts = np.unique(par_ids, return_index=True)
+        for par_id, start, end in zip(unique_ids, starts, np.append(starts[1:], len(par_ids))):
+            sketches[int(par_id)].add(values[start:end])
+
+    def _add_raw_parts(self, parts, source_type, ids, time_start, time_end):
+        """Итоги сырых строк неполных суток на границе периода."""
+        columns = self.read_raw(source_type, time_start, time_end, ids)
+        buckets = np.zeros(len(columns["time"]), dtype="datetime64[D]")
+        for value_column, values in columns["values"].items():
+            keys, _, totals = summarize(columns["keys"], buckets, values)
+            if totals is None:
+                continue
+            for index in range(len(keys[0])):
+                key = tuple(int(column[index]) for column in keys)
+                key = key[0] if value_column is None else key + (value_column,)
+                parts.setdefault(key, []).append({
+                    "total": int(totals["TOTAL_COUNT"][index]), "count": int(totals["VALUE_COUNT"][index]),
+                    "sum": float(totals["VALUE_SUM"][index]),
+                    "min": _none_if_nan(totals["VALUE_MIN"][index]),
+                    "max": _none_if_nan(totals["VALUE_MAX"][index]),
+                    "snm": _none_if_nan(totals["FIRST_VALUE"][index]),
+                    "lst": _none_if_nan(totals["LAST_VALUE"][index]),
+                })
+
+    def stats(self):
+        return {source_type: str(day) if day else None for source_type, day in self.refreshed_to.items()}
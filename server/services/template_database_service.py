@@ -3,253 +3,415 @@
 import re
 from collections import defaultdict
 
+import numpy as np
+
+from server.models.backends.factory import create_backend
+from server.models.connection_pool import ConnectionPoolRegistry
 from server.models.report_db_model import ReportDBModel
+from server.models.series import Series
+from server.services.formula_compiler import QUANTILE_FUNCTIONS, FormulaContext, FormulaError, compile_formula
+from server.services.rollup_service import merge_aggregates
+
+# Квантили, которые берутся из эскизов итогов: погрешность каждого из них не больше
+# QuantileSketch.relative_accuracy от его значения. На разность квантилей (iqr) оценка
+# не переносится - при близких квартилях ошибка разности в разы больше, поэтому iqr точный.
+SKETCH_QUANTILE_FUNCTIONS = ("median", "pct")
 
 class TemplateDatabaseService:
-    def handle_parse(self, expression, time_start, time_end):
+    def __init__(self, report_pools=None, backend=None, rollups=None, cache=None):
+        self.backend = backend if backend is not None else create_backend()
+        # Пулы соединений с базами параметров, общие для всех запросов сервера
+        self.report_pools = report_pools if report_pools is not None else ConnectionPoolRegistry(self.backend.connect)
+        # Итоги по суткам и месяцам (RollupService), если сервер их ведет
+        self.rollups = rollups
+        # Общий кэш результатов запросов к базам параметров (ResultCache), если он включен
+        self.cache = cache
+        # Функции формул над рядами значений шифров
+        self.functions = {
+            "lst": self.lst,
+            "ave": self.ave,
+            "snm": self.snm,
+            "count": self.count,
+            "max": self.maximum,
+            "min": self.minimum,
+            "sum": self.total,
+            "tave": self.tave,
+            "median": self.median,
+            "pct": self.pct,
+            "iqr": self.iqr,
+        }
+
+    def report_model(self, db_name):
+        return ReportDBModel(db=db_name, pool=self.report_pools.get(db_name), backend=self.backend, cache=self.cache)
+
+    def prefetch_parameters(self, expressions, time_start, time_end):
+        """
+        Этап планирования перед вычислением ячеек: собирает шифры всех формул
+        в одно множество и получает значения каждого шифра за период один раз.
+        Возвращает {шифр или (функция, шифр, ...): значение} для передачи в handle_parse всех ячеек.
+        """
+        series = {}
+        aggregates = {}
+        for expression in expressions:
+            if isinstance(expression, str) and expression.startswith("="):
+                formula = compile_formula(expression[1:])
+                series.update(formula.series)
+                aggregates.update(formula.aggregates)
+        return self.fetch_plan(series, aggregates, time_start, time_end)
+
+    def handle_parse(self, expression, time_start, time_end, prefetched=None):
+        """
+        Вычисляет выражение ячейки за период.
+        Формула разбирается в дерево один раз (compile_formula кэширует его по тексту),
+        значения шифров передаются в вычисление без преобразования в текст.
+        prefetched - значения шифров, уже полученные prefetch_parameters для всего
+        запроса; в БД запрашиваются только недостающие шифры.
+        """
         if not expression.startswith("="):
             return expression
 
         # Удаляем знак "="
-        expression = expression[1:]
-
-        tech_data = {}
-        analytic_data = {}
-        xline_data = {}
-        result_cipher_processing = defaultdict(list)
-
-        #Простые запросы ---------------------------------------------------------
-        getNameProd_pattern = r"getNameProd\((L|X|T)(\d+)\)"
-        getUnitProd_pattern = r"getUnitProd\((X|T)(\d+)\)"
-        getNamePrd_params = re.match(getNameProd_pattern, expression)
-        getUnitPrd_params = re.match(getUnitProd_pattern, expression)
-        # Запрос имени продукта
-        if getNamePrd_params:
-            value = [getNamePrd_params.group(1), getNamePrd_params.group(2)]
-            return self.get_name_prod(value)
-        # Запрос имени продукта
-        if getUnitPrd_params:
-            value = [getUnitPrd_params.group(1), getUnitPrd_params.group(2)]
-            return self.get_unit_prod(value)
-
-        # находим сразу функции получения начальной и конечной даты
-        if expression == "end_date()":
-            return time_end
-        elif expression == "start_date()":
-            return time_start
-        #-------------------------------------------------------------------------------
-
-        # Шаблоны для запросов данных из БД параметров
-        tech_pattern = r"(?<!\w)T[A-Za-z0-9_]+(?!\w)"  # Технологический параметр
-        analytic_pattern = r"L\d+(?:\.\d+)?(?:\.\w+)?(?:\.[PQT])?"  # Аналитический параметр
-        xline_pattern = r"(?<!\w)X[A-Za-z0-9_]+(?!\w)"  # X-линия
-
-        # Поиск параметров
-        tech_params = re.findall(tech_pattern, expression)
-        analytic_params = re.findall(analytic_pattern, expression)
-        xline_params = re.findall(xline_pattern, expression)
-
-        #Если нашли шифр идем в БД
-        if tech_params:
-            for element in tech_params:
-                result = self.process_parameters(element, "T", time_start, time_end)
-                result_cipher_processing[element].append(result)
-
-        if analytic_params:
-            for element in analytic_params:
-                result = self.process_parameters(element, "L", time_start, time_end)
-                result_cipher_processing[element].append(result)
-
-        if xline_params:
-            for element in xline_params:
-                result = self.process_parameters(element, "X", time_start, time_end)
-                result_cipher_processing[element].append(result)
-
-        #меняем шифры на полученные данные
-        expression = self.replace_ciphers(expression, result_cipher_processing)
-
-        # Обработка функций
-        updated_expression = self.process_functions(expression, time_start, time_end)
-
-        error_check = self.is_computable_math_expression(updated_expression)
-        if error_check is True:
-            # Если выражение вычисляется, возвращаем результат
-            return eval(updated_expression)
-        else:
+        formula = compile_formula(expression[1:])
+
+        #Если нашли шифры идем в БД: по одному запросу на источник данных
+        values = prefetched or {}
+        series = {param: param_type for param, param_type in formula.series.items() if param not in values}
+        aggregates = {key: param_type for key, param_type in formula.aggregates.items()
+                      if key not in values and key[1] not in values}
+        if series or aggregates:
+            values = dict(values)
+            values.update(self.fetch_plan(series, aggregates, time_start, time_end))
+
+        context = FormulaContext(values, time_start, time_end, self.functions, self.get_product_info)
+        try:
+            return formula.evaluate(context)
+        except FormulaError as e:
             # Возвращаем сообщение об ошибке
-            return error_check
+            return f"[ERROR: {e}]"
 
-    def replace_ciphers(self, expression, result_cipher_processing):
+    def fetch_plan(self, series, aggregates, time_start, time_end):
         """
-        Заменяет шифры в строке на соответствующие данные из result_cipher_processing.
-
-        :param expression: Исходная строка с шифрами.
-        :param result_cipher_processing: Словарь с данными для шифров.
-        :return: Строка с замененными шифрами на данные.
+        Получает значения по плану формул: ряды шифров series ({шифр: тип}) и
+        агрегаты aggregates ({(функция, шифр, *параметры): тип}). Агрегаты шифров, чей ряд
+        и так запрашивается, вычисляются по ряду; остальные T и X считаются в SQL или по итогам,
+        L - по итогам, если они ведутся. median и pct шифров T и X берутся из суточных эскизов,
+        если итоги ведутся; iqr и квантили L всегда вычисляются точно по ряду.
         """
-
-
-        analytic_pattern = r"L\d+(?:\.\d+)?(?:\.\w+)?(?:\.[PQT])?"
-        tech_pattern = r"(?<!\w)T[A-Za-z0-9_]+(?!\w)"
-        xline_pattern = r"(?<!\w)X[A-Za-z0-9_]+(?!\w)"
-        analytic_params = re.findall(analytic_pattern, expression)
-        tech_params = re.findall(tech_pattern, expression)
-        xline_params = re.findall(xline_pattern, expression)
-
-        all_ciphers = analytic_params + tech_params + xline_params
-        print("All params:", all_ciphers)
-
-        # Проходим по каждому шифру и заменяем его
-        for cipher in all_ciphers:
-            if cipher in result_cipher_processing:
-                # Берем первое значение из списка данных
-                replacement = result_cipher_processing[cipher].pop(0)
-
-                # Проверяем, что это за значение
-                if isinstance(replacement, list):
-                    replacement_str = str(replacement)  # Преобразуем список в строку
-                elif isinstance(replacement, str):
-                    replacement_str = f"[ERROR: {replacement}]"  # Ошибка как строка
+        series = dict(series)
+        pushdown = {}
+        quantiles = {}
+        for key, param_type in aggregates.items():
+            function_name, param = key[0], key[1]
+            if param in series:
+                continue
+            if function_name in QUANTILE_FUNCTIONS:
+                if param_type == "L" or self.rollups is None or function_name not in SKETCH_QUANTILE_FUNCTIONS:
+                    series[param] = param_type
                 else:
-                    replacement_str = str(replacement)  # Другое значение
+                    quantiles[key] = param_type
+            elif param_type == "L" and self.rollups is None:
+                # Значения элементов зависят от последовательности анализов: ряд нужен целиком
+                series[param] = param_type
+            else:
+                pushdown[key] = param_type
+        results = self.fetch_parameters(series, time_start, time_end) if series else {}
+        if pushdown:
+            results.update(self.fetch_aggregates(pushdown, time_start, time_end))
+        if quantiles:
+            results.update(self.fetch_quantiles(quantiles, time_start, time_end))
+        return results
+
+    def fetch_aggregates(self, aggregates, time_start, time_end):
+        """
+        Агрегаты шифров, вычисленные в SQL или по итогам: {(функция, шифр): значение}.
+        Шифр без значений за период (или с ошибкой ввода) возвращается как в
+        fetch_parameters - 0 или текст ошибки, и функция вычисляется над ним как обычно.
+        """
+        results = {}
+        requested = {"T": defaultdict(set), "X": defaultdict(set)}
+        analytic = defaultdict(set)
+        for (function_name, param), param_type in aggregates.items():
+            if param_type == "L":
+                analytic[param].add(function_name)
+                continue
+            split_data = param[1:]
+            if not self.is_valid_number(split_data):
+                results[param] = "Ошибка ввода"
+                continue
+            requested[param_type][(param, int(split_data))].add(function_name)
+
+        sources = (
+            ("T", "DB_NN_Technological_data", ReportDBModel.get_technological_aggregates),
+            ("X", "DB_NN_Xline_data", ReportDBModel.get_Xline_aggregates),
+        )
+        for param_type, db_name, get_aggregates in sources:
+            functions = requested[param_type]
+            if not functions:
+                continue
+            par_ids = {par_id for _, par_id in functions}
+            values = None
+            if self.rollups is not None:
+                values = self.rollups.get_aggregates(param_type, par_ids, time_start, time_end)
+            if values is None:
+                edges = any(name in ("lst", "snm") for names in functions.values() for name in names)
+                values = get_aggregates(self.report_model(db_name), par_ids, time_start, time_end, edges)
+            for (param, par_id), names in functions.items():
+                aggregate = values.get(par_id)
+                if not aggregate or not aggregate["count"]:
+                    results[param] = 0
+                    continue
+                for function_name in names:
+                    results[(function_name, param)] = self.aggregate_value(function_name, aggregate)
 
-                # Заменяем только первое вхождение шифра
-                expression = expression.replace(cipher, replacement_str, 1)
+        if analytic:
+            results.update(self.fetch_analytical_aggregates(analytic, time_start, time_end))
+        return results
 
-        return expression
+    def fetch_analytical_aggregates(self, analytic, time_start, time_end):
+        """
+        Агрегаты L шифров по итогам Lab_rollup: analytic - {шифр: {функции}}.
+        Итоги ведутся по (продукт, уровень, последовательность, столбец); значение элемента
+        берется из итогов столбца EL<позиция>, как в get_element_values. Шифры, которые
+        нельзя собрать из итогов, запрашиваются рядом.
+        """
+        results = {}
+        keys = {}
+        for param in analytic:
+            key = self.parse_analytical_cipher(param)
+            if isinstance(key, tuple):
+                keys[param] = key
+            else:
+                results[param] = key
+        if not keys:
+            return results
+
+        values = self.rollups.get_aggregates("L", {product for product, _, _, _ in keys.values()},
+                                             time_start, time_end)
+        if values is None:
+            results.update(self.fetch_parameters({param: "L" for param in keys}, time_start, time_end))
+            return results
+
+        columns = defaultdict(list)
+        for (product, level, seq_id, column), aggregate in values.items():
+            if aggregate["total"]:
+                columns[(product, level)].append((seq_id, column, aggregate))
+        sequences = None
+        fallback = {}
+        for param, (product, level, element, parm_type) in keys.items():
+            entries = columns.get((product, level), [])
+            seq_ids = {seq_id for seq_id, _, _ in entries}
+            if parm_type == "Q":
+                if len(seq_ids) > 1:
+                    # Порядок строк разных последовательностей по итогам не восстановить
+                    fallback[param] = "L"
+                    continue
+                aggregate = merge_aggregates([entry for _, column, entry in entries if column == "Q"])
+            else:
+                if len(seq_ids) > 1:
+                    results[param] = "Несколько последовательностей анализов за период"
+                    continue
+                if not seq_ids:
+                    results[param] = 0
+                    continue
+                if sequences is None:
+                    sequences = self.report_model("DB_NN_Analytical_data").get_lab_sequences()
+                element_name = element.strip().casefold()
+                positions = [el_vpos for el_name, el_vpos in sequences.get(seq_ids.pop(), [])
+                             if el_name.strip().casefold() == element_name and 1 <= el_vpos <= 14]
+                aggregate = merge_aggregates([entry for el_vpos in positions for _, column, entry in entries
+                                              if column == f"EL{el_vpos}"])
+            if not aggregate["count"]:
+                results[param] = 0
+                continue
+            for function_name in analytic[param]:
+                results[(function_name, param)] = self.aggregate_value(function_name, aggregate)
+        if fallback:
+            results.update(self.fetch_parameters(fallback, time_start, time_end))
+        return results
+
+    def fetch_quantiles(self, quantiles, time_start, time_end):
+        """
+        Квантили T и X шифров по суточным эскизам итогов: {(функция, шифр, *параметры): значение}.
+        Если период короче RollupService.exact_max_days полных суток, ряды шифров
+        запрашиваются целиком и квантили вычисляются точно.
+        """
+        results = {}
+        requested = {"T": defaultdict(set), "X": defaultdict(set)}
+        for key, param_type in quantiles.items():
+            param = key[1]
+            split_data = param[1:]
+            if not self.is_valid_number(split_data):
+                results[param] = "Ошибка ввода"
+                continue
+            requested[param_type][(param, int(split_data))].add(key)
+
+        for param_type, functions in requested.items():
+            if not functions:
+                continue
+            sketches = self.rollups.get_sketches(param_type, {par_id for _, par_id in functions},
+                                                 time_start, time_end)
+            if sketches is None:
+                results.update(self.fetch_parameters({param: param_type for param, _ in functions},
+                                                     time_start, time_end))
+                continue
+            for (param, par_id), keys in functions.items():
+                sketch = sketches.get(par_id)
+                if sketch is None or not sketch.count:
+                    results[param] = 0
+                    continue
+                for key in keys:
+                    results[key] = self.sketch_value(key, sketch)
+        return results
+
+    def sketch_value(self, key, sketch):
+        """Значение median / pct по эскизу квантилей (эскиз не пустой)."""
+        function_name, params = key[0], key[2:]
+        if function_name == "median" and not params:
+            return sketch.quantile(0.5)
+        if function_name == "pct" and len(params) == 1 and 0 <= params[0] <= 100:
+            return sketch.quantile(params[0] / 100)
+        return "Ошибка ввода"
+
+    def aggregate_value(self, function_name, aggregate):
+        """Значение функции по агрегатам, вычисленным в SQL (ряд не пустой)."""
+        if function_name == "tave":
+            return aggregate["sum"] / aggregate["total"]
+        if function_name == "count":
+            return aggregate["count"]
+        return aggregate[function_name]
 
     def process_parameters(self, param, type, time_start, time_end):
         # Ищем значения в БД
         # Параметр param_type определяет, какую таблицу использовать (T, L, X)
-        value = []
-
+        return self.fetch_parameters({param: type}, time_start, time_end)[param]
 
-        # Запрос аналитичеких данных
-        if type == "L":
-            split_data = param[1:].split(".")  # Остальные части
-            if len(split_data) < 3:
-                result = "Ошибка ввода"
-                return result
-            data = {
-                "product": split_data[0],
-                "level": split_data[1],
-                "element": split_data[2],
-            }
-            if len(split_data) > 3:
-                parm_type = split_data[3]
-
-                if parm_type == "P":
-                    db_name = "DB_NN_Analytical_data"
-                    db_model = ReportDBModel(db=db_name)
-                    value = db_model.get_analytical_value_element(data, time_start, time_end)
-                elif parm_type == "Q":
-                    db_name = "DB_NN_Analytical_data"
-                    db_model = ReportDBModel(db=db_name)
-                    value = db_model.get_analytical_value_tonnage(data, time_start, time_end)
-            else:
-                return "Ошибка ввода"
-
-        # Запрос технологических данных
-        elif type == "T":
-            split_data = param[1:]  # Удаляем "T" и получаем ID
-
-            # проверяем корректный ввод шифра
-            if not self.is_valid_number(split_data):
-                return "Ошибка ввода"
-
-            data = {
-                "product": split_data
-            }
-            db_name = "DB_NN_Technological_data"
-            db_model = ReportDBModel(db=db_name)
-            value = db_model.get_technological_value(data, time_start, time_end)
+    def fetch_parameters(self, params, time_start, time_end):
+        """
+        Получает значения нескольких шифров за период.
+        params - {шифр: тип (T, L, X)}. Шифры одного источника запрашиваются
+        одним запросом (списком PAR_ID / PROD_ID), результат делится по шифрам в памяти.
+        Возвращает {шифр: ряд значений Series, 0 при отсутствии значений или текст ошибки}.
+        Ряды передаются в вычисление формул по ссылке и не изменяются.
+        """
+        results = {}
+        tech_ids = {}
+        xline_ids = {}
+        analytic_keys = {}
+
+        for param, param_type in params.items():
+            # Запрос технологических данных и данных ручного ввода
+            if param_type in ("T", "X"):
+                split_data = param[1:]  # Удаляем "T"/"X" и получаем ID
+                # проверяем корректный ввод шифра
+                if not self.is_valid_number(split_data):
+                    results[param] = "Ошибка ввода"
+                elif param_type == "T":
+                    tech_ids[param] = int(split_data)
+                else:
+                    xline_ids[param] = int(split_data)
 
-        # Запрос данных ручного ввода
-        elif type == "X":
-            split_data = param[1:]  # Удаляем "X" и получаем ID
+            # Запрос аналитичеких данных
+            elif param_type == "L":
+                key = self.parse_analytical_cipher(param)
+                if isinstance(key, tuple):
+                    analytic_keys[param] = key
+                else:
+                    results[param] = key
 
-            # проверяем корректный ввод шифра
-            if not self.is_valid_number(split_data):
-                return "Ошибка ввода"
+        if tech_ids:
+            db_model = self.report_model("DB_NN_Technological_data")
+            values = db_model.get_technological_values(set(tech_ids.values()), time_start, time_end)
+            for param, par_id in tech_ids.items():
+                results[param] = values.get(par_id) or 0
 
-            data = {
-                "product": split_data
-            }
-            db_name = "DB_NN_Xline_data"
-            db_model = ReportDBModel(db=db_name)
-            value = db_model.get_Xline_value(data, time_start, time_end)
+        if xline_ids:
+            db_model = self.report_model("DB_NN_Xline_data")
+            values = db_model.get_Xline_values(set(xline_ids.values()), time_start, time_end)
+            for param, par_id in xline_ids.items():
+                results[param] = values.get(par_id) or 0
 
-            #Обрабатываем полученные данные
-        return self.get_value_in_list(value)
+        if analytic_keys:
+            results.update(self.fetch_analytical_parameters(analytic_keys, time_start, time_end))
 
+        return results
 
+    def parse_analytical_cipher(self, param):
+        """
+        Разбирает шифр L<продукт>.<уровень>.<элемент>.<P|Q>: возвращает (продукт, уровень, элемент, P|Q)
+        или значение шифра без запроса к БД (текст ошибки или 0 для других типов).
+        """
+        split_data = param[1:].split(".")  # Остальные части
+        if len(split_data) <= 3:
+            return "Ошибка ввода"
+        product, level, element, parm_type = split_data[:4]
+        if parm_type not in ("P", "Q"):
+            return 0
+        try:
+            return int(product), int(level), element, parm_type
+        except ValueError:
+            return "Ошибка ввода"
 
-    def process_functions(self, expression, time_start, time_end):
+    def fetch_analytical_parameters(self, analytic_keys, time_start, time_end):
         """
-        Обрабатывает функции в строке, заменяет их результаты и возвращает обновлённое выражение.
+        Значения аналитических шифров: {шифр: (продукт, уровень, элемент, P|Q)}.
+        Строки Lab_data всех продуктов запрашиваются одним запросом и делятся
+        по (продукт, уровень); значение элемента берется из колонки EL<позиция>
+        по последовательности анализов, как в get_analytical_value_element.
         """
-        # Поиск функций вида func(param)
-        function_pattern = r"(\w+)\(\s*([^)]*)\s*\)" # Ищет имя функции и её параметр
-        functions = re.findall(function_pattern, expression)
-
-        function_results = {}
-        if functions:
-            for func_name, func_param in functions:
-
-                # Если параметр содержит ошибку, пропускаем обработку этой функции
-                if "[ERROR:" in func_param:
-                    print(f"Пропуск функции {func_name}({func_param}) из-за ошибки в параметре.")
-                    function_results[f"{func_name}({func_param})"] = func_param
-                    continue
-                try:
-                    # Обрабатываем функцию
-                    if func_name == "lst":
-                        result = self.lst(eval(func_param))
-
-                    elif func_name == "ave":
-                        result = self.ave(eval(func_param))
-
-                    elif func_name == "snm":
-                        result = self.snm(eval(func_param))
-
-                    elif func_name == "count":
-                        result = len(eval(func_param))
-
-                    elif func_name == "max":
-                        result = max(eval(func_param))
-
-                    elif func_name == "min":
-                        result = min(eval(func_param))
-
-                    elif func_name == "sum":
-                        result = sum(eval(func_param))
-
-                    elif func_name == "tave":
-                        param_values = eval(func_param)
-                        result = self.tave(eval(param_values), len(param_values))
-                    else:
-                        # Если функция не поддерживается
-                        result = f"[ERROR: Функция '{func_name}' не поддерживается]"
-                except Exception:
-                    # Обработка ошибок выполнения функции
-                    result = f"[ERROR: Ошибка ввода]"
-
-                # Заменяем функцию в строке на её результат
-                expression = expression.replace(f"{func_name}({func_param})", str(result))
-        else:
-            return expression
-        return expression
+        db_model = self.report_model("DB_NN_Analytical_data")
+        products = {product for product, _, _, _ in analytic_keys.values()}
+        lab_rows = defaultdict(list)
+        for row in db_model.get_analytical_rows(products, time_start, time_end):
+            lab_rows[(row["PROD_ID"], row["LEVEL_ID"])].append(row)
+        sequences = None
+
+        results = {}
+        for param, (product, level, element, parm_type) in analytic_keys.items():
+            rows = lab_rows.get((product, level), [])
+            if parm_type == "Q":
+                value = Series.from_columns([row["PROD_TIME"] for row in rows], [row["Q"] for row in rows])
+            else:
+                if sequences is None:
+                    sequences = db_model.get_lab_sequences()
+                value = self.get_element_values(rows, sequences, element)
+            results[param] = value if isinstance(value, str) else value or 0
+        return results
+
+    def get_element_values(self, rows, sequences, element):
+        """Ряд значений элемента в строках Lab_data одного продукта и уровня."""
+        if not rows:
+            return Series.empty()
+        seq_ids = {row["SEQ_ID"] for row in rows}
+        if len(seq_ids) > 1:
+            return "Несколько последовательностей анализов за период"
+        # Имена элементов сравниваются без учета регистра, как в SQL Server
+        element_name = element.strip().casefold()
+        positions = [(el_name, el_vpos) for el_name, el_vpos in sequences.get(seq_ids.pop(), [])
+                     if el_name.strip().casefold() == element_name and 1 <= el_vpos <= 14]
+        return Series.from_columns([row["PROD_TIME"] for row in rows for _ in positions],
+                                   [row[f"EL{el_vpos}"] for row in rows for _, el_vpos in positions])
+
+
 
     # -----------------------Функции-------------------------
+    # Функции вычисляются над массивом значений ряда (numpy) без обхода значений в Python.
+    # Шифр без значений за период передается числом 0, несколько аргументов - кортежем.
+    def series_values(self, values):
+        """Массив float64 значений аргумента функции."""
+        if isinstance(values, Series):
+            return values.values
+        if isinstance(values, (list, tuple)):
+            return np.asarray(values, dtype=np.float64)
+        raise TypeError(f"Ожидался ряд значений, получено {type(values).__name__}")
+
     def lst(self, values):
         """
         Возвращает последнее значение из списка или само значение, если оно одно.
         """
-        if isinstance(values, list) and values:
-            return values[-1]
-        elif isinstance(values, (int, float)):
+        if isinstance(values, (int, float)):
             return values
-        return 0
+        array = self.series_values(values)
+        return float(array[-1]) if array.size else 0
 
     def ave(self, values):
         """
@@ -258,59 +420,84 @@ class TemplateDatabaseService:
         """
         if not values:
             return 0
-        result = sum(values) / len(values)
-        return result
+        return float(self.series_values(values).mean())
 
     def snm(self, values):
         """
         Возвращает первое достоверное значение из списка.
         """
-        if isinstance(values, list) and values:
-            return values[0]
-        elif isinstance(values, (int, float)):
+        if isinstance(values, (int, float)):
             return values
-        return 0
+        array = self.series_values(values)
+        return float(array[0]) if array.size else 0
 
-    def tave(self, values, total_count):
+    def tave(self, values):
         """
         Среднее всех значений за период (с учетом полного количества значений).
         TAVE = сумма достоверных значений / полное количество значений.
         """
-        if not values or total_count == 0:
+        if not values:
             return 0
-        return sum(values) / total_count
+        total_count = values.total if isinstance(values, Series) else len(values)
+        return float(self.series_values(values).sum() / total_count)
+
+    def count(self, values):
+        return int(self.series_values(values).size)
+
+    def total(self, values):
+        return float(self.series_values(values).sum())
+
+    def minimum(self, values):
+        return float(self.series_values(values).min())
 
-    def get_value_in_list(self, values):
-        # Извлекаем все числовые значения, игнорируя ключ el_name
-        numeric_values = []
-        for entry in values:
-            for key, value in entry.items():
-                if key != "el_name" and isinstance(value, (int, float)):  # Игнорируем ключ el_name
-                    numeric_values.append(value)
+    def maximum(self, values):
+        return float(self.series_values(values).max())
 
-        if not numeric_values:  # Если нет числовых значений
+    def median(self, values):
+        if not values:
+            return 0
+        return float(np.median(self.series_values(values)))
+
+    def pct(self, arguments):
+        """pct(шифр, p) - процентиль p (0..100) значений за период."""
+        values, percent = arguments
+        if not 0 <= percent <= 100:
+            raise ValueError(f"Процентиль вне диапазона 0..100: {percent}")
+        if not values:
             return 0
-        else:
-            return numeric_values
+        return float(np.percentile(self.series_values(values), percent))
+
+    def iqr(self, values):
+        """Межквартильный размах: 75-й процентиль минус 25-й."""
+        if not values:
+            return 0
+        quartiles = np.percentile(self.series_values(values), [25, 75])
+        return float(quartiles[1] - quartiles[0])
+
+    def get_product_info(self, function_name, cipher_type, product):
+        """Значение getNameProd / getUnitProd для шифра."""
+        if function_name == "getNameProd":
+            return self.get_name_prod([cipher_type, product])
+        return self.get_unit_prod([cipher_type, product])
 
     def get_name_prod(self, value):
         # Запрос аналитичеких данных
         if value[0] == "L":
             data = value[1]
             db_name = "DB_NN_Analytical_data"
-            db_model = ReportDBModel(db=db_name)
+            db_model = self.report_model(db_name)
             return db_model.get_name_product_analytical(data)
         # Запрос технологических данных
         elif value[0] == "T":
             data = value[1]
             db_name = "DB_NN_Technological_data"
-            db_model = ReportDBModel(db=db_name)
+            db_model = self.report_model(db_name)
             return db_model.get_name_product_technological(data)
         # Запрос данных ручного ввода
         elif value[0] == "X":
             data = value[1]
             db_name = "DB_NN_Xline_data"
-            db_model = ReportDBModel(db=db_name)
+            db_model = self.report_model(db_name)
             return db_model.get_name_product_Xline(data)
 
     def get_unit_prod(self, value):
@@ -318,14 +505,14 @@ class TemplateDatabaseService:
         if value[0] == "T":
             data = value[1]
             db_name = "DB_NN_Technological_data"
-            db_model = ReportDBModel(db=db_name)
+            db_model = self.report_model(db_name)
             return db_model.get_unit_product_technological(data)
 
         # Запрос данных ручного ввода
         elif value[0] == "X":
             data = value[1]
             db_name = "DB_NN_Xline_data"
-            db_model = ReportDBModel(db=db_name)
+            db_model = self.report_model(db_name)
             return db_model.get_unit_product_Xline(data)
 
     def is_valid_number(self, data):
@@ -335,22 +522,6 @@ class TemplateDatabaseService:
         print(f"Проверка: {data} -> {input_str} -> {bool(match)}")  # Отладочный вывод
         return bool(match)
 
-    def is_computable_math_expression(self, expression):
-        """
-        Проверяет, можно ли вычислить математическое выражение, и возвращает результат или сообщение об ошибке.
-        """
-        try:
-            eval(expression)  # Проверяем, вычисляется ли выражение
-            return True
-        except SyntaxError:
-            return "[ERROR: Синтаксическая ошибка в выражении]"
-        except ZeroDivisionError:
-            return "[ERROR: Деление на ноль]"
-        except NameError:
-            return "[ERROR: Некорректное имя переменной или функции]"
-        except Exception as e:
-            return f"[ERROR: Неизвестная ошибка: {str(e)}]"
-
 # service = TemplateDatabaseService()
 #
 # # Пример использования
@@ -0,0 +1,91 @@
+# server/services/worker_pool.py
+import queue
+import threading
+import time
+
+
+class WorkerPool:
+    """
+    Пул обработчиков фиксированного размера с ограниченной очередью запросов.
+
+    Если очередь заполнена, submit() не ставит задачу и возвращает False:
+    сервер сразу отвечает клиенту "занято, повторите через N мс" вместо того,
+    чтобы увеличивать задержку для всех остальных запросов.
+    """
+
+    def __init__(self, size=8, queue_depth=64, retry_after_ms=200):
+        self.size = size
+        self.queue_depth = queue_depth
+        self.retry_after_ms = retry_after_ms
+        self.tasks = queue.Queue(maxsize=queue_depth)
+
+        self.lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Скользящее среднее времени обработки одной задачи, в секундах
+        self.average_task_time = 0.0
+
+        self.workers = []
+        for index in range(size):
+            worker = threading.Thread(target=self._work, name=f"worker-{index}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, func, *args):
+        """Ставит задачу в очередь. Возвращает False, если очередь заполнена."""
+        try:
+            self.tasks.put_nowait((func, args))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+
+    def suggested_retry_after_ms(self):
+        """
+        Оценка, через сколько миллисекунд имеет смысл повторить отклоненный запрос:
+        время, за которое пул разберет текущую очередь, но не меньше retry_after_ms.
+        """
+        with self.lock:
+            average_task_time = self.average_task_time
+        backlog_ms = self.tasks.qsize() * average_task_time * 1000 / self.size
+        return max(self.retry_after_ms, int(backlog_ms))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "queue_depth": self.queue_depth,
+                "queued": self.tasks.qsize(),
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "average_task_ms": round(self.average_task_time * 1000, 2),
+            }
+
+    def _work(self):
+        while True:
+            func, args = self.tasks.get()
+            with self.lock:
+                self.active += 1
+            started = time.perf_counter()
+            failed = False
+            try:
+                func(*args)
+            except Exception as e:
+                failed = True
+                print(f"Ошибка в обработчике пула: {e}")
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+                    if failed:
+                        self.failed += 1
+                    self.average_task_time = (
+                        elapsed if self.completed == 1 else self.average_task_time * 0.9 + elapsed * 0.1
+                    )
+                self.tasks.task_done()
@@ -0,0 +1,32 @@
+# tests/conftest.py
+import datetime
+import sqlite3
+
+import pytest
+
+from server.models.backends.sqlite_backend import SQLiteBackend
+
+
+@pytest.fixture(scope="session")
+def demo_backend(tmp_path_factory):
+    """Хранилище SQLite с тестовыми суточными данными за январь - март 2024 года."""
+    backend = SQLiteBackend(str(tmp_path_factory.mktemp("sqlite")))
+    backend.create_schema()
+    backend.seed_demo_data(start=datetime.date(2024, 1, 1), days=91, parameters=5)
+    return backend
+
+
+@pytest.fixture
+def duplicate_times_backend(tmp_path):
+    """Хранилище, в котором у первых и последних суток по две строки времени с одним PAR_TIME."""
+    backend = SQLiteBackend(str(tmp_path))
+    backend.create_schema()
+    times = [(4, "2024-01-01 00:00:00"), (2, "2024-01-01 00:00:00"), (3, "2024-01-02 00:00:00"),
+             (6, "2024-01-03 00:00:00"), (5, "2024-01-03 00:00:00")]
+    values = {2: 10.0, 4: 20.0, 3: 30.0, 5: 40.0, 6: 50.0}
+    for db, prefix in (("DB_NN_Technological_data", "Tech"), ("DB_NN_Xline_data", "Xline")):
+        with sqlite3.connect(backend.path(db)) as connection:
+            connection.executemany(f"INSERT INTO {prefix}_time_day (PAR_TIME_ID, PAR_TIME) VALUES (?, ?)", times)
+            connection.executemany(f"INSERT INTO {prefix}_data_day (PAR_ID, PAR_TIME_ID, PAR_VALUE) VALUES (?, ?, ?)",
+                                   [(1, time_id, values[time_id]) for time_id, _ in times])
+    return backend
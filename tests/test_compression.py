@@ -0,0 +1,22 @@
+# tests/test_compression.py
+import zlib
+
+from common.protocol.compression import CompressionPolicy
+
+
+def test_level_depends_on_size():
+    policy = CompressionPolicy()
+    small = policy.level_for(4 * 1024)
+    medium = policy.level_for(512 * 1024)
+    large = policy.level_for(4 * 1024 * 1024)
+    assert small < medium < large
+    assert policy.level_for(64 * 1024) == small
+    assert policy.level_for(64 * 1024 + 1) == medium
+
+
+def test_compress_round_trip():
+    policy = CompressionPolicy()
+    data = b'{"status": "success", "values": [' + b"1.25, " * 20000 + b"0]}"
+    compressed, body = policy.compress(data, "PARSE_CELL")
+    assert compressed and len(body) < len(data)
+    assert zlib.decompress(body) == data
@@ -0,0 +1,51 @@
+# tests/test_quantiles.py
+import datetime
+
+import numpy as np
+import pytest
+
+from server.services.quantile_sketch import QuantileSketch
+from server.services.rollup_service import RollupService
+from server.services.template_database_service import TemplateDatabaseService
+
+# Погрешность эскиза: квантиль отличается от значения ряда с тем же рангом не больше чем
+# на relative_accuracy (1%). С интерполяцией np.percentile между соседними значениями
+# на тестовых данных расхождение не превышает той же величины с небольшим запасом.
+SKETCH_TOLERANCE = 0.011
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_sketch_quantiles_within_relative_accuracy(seed):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.lognormal(3, 1, 5000), -rng.lognormal(1, 0.5, 500), np.zeros(50)])
+    sketch = QuantileSketch()
+    for part in np.array_split(values, 10):
+        sketch.merge(QuantileSketch.from_bytes(QuantileSketch().add(part).to_bytes()))
+    assert sketch.count == len(values)
+    for q in (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99):
+        expected = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(expected, rel=sketch.relative_accuracy, abs=1e-9)
+
+
+@pytest.fixture(scope="module")
+def services(demo_backend):
+    plain = TemplateDatabaseService(backend=demo_backend)
+    rollups = RollupService(plain.report_pools, demo_backend, exact_max_days=7)
+    rollups.ensure_schema()
+    rollups.refresh(today=datetime.date(2024, 4, 1))
+    return plain, TemplateDatabaseService(plain.report_pools, demo_backend, rollups=rollups)
+
+
+@pytest.mark.parametrize("time_start, time_end", [
+    ("2024-01-01", "2024-03-31"),
+    ("2024-01-15 12:00:00", "2024-03-03 06:00:00"),
+    ("2024-02-01", "2024-02-03"),
+])
+def test_sketch_quantiles_match_exact(services, time_start, time_end):
+    plain, rolled = services
+    for expression in ("=median(T1)", "=pct(T2, 95)", "=pct(X3, 5)", "=median(T3)"):
+        expected = plain.handle_parse(expression, time_start, time_end)
+        actual = rolled.handle_parse(expression, time_start, time_end)
+        assert actual == pytest.approx(expected, rel=SKETCH_TOLERANCE), expression
+    # iqr - разность близких квартилей, по эскизам не вычисляется
+    assert rolled.handle_parse("=iqr(T3)", time_start, time_end) == plain.handle_parse("=iqr(T3)", time_start, time_end)
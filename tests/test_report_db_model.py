@@ -0,0 +1,25 @@
+# tests/test_report_db_model.py
+import pytest
+
+from server.models.report_db_model import ReportDBModel
+from server.services.template_database_service import TemplateDatabaseService
+
+
+def test_edges_with_duplicate_times_follow_time_id(duplicate_times_backend):
+    model = ReportDBModel("DB_NN_Technological_data", backend=duplicate_times_backend)
+    aggregates = model.get_technological_aggregates({1}, "2024-01-01", "2024-01-03", edges=True)[1]
+    series = model.get_technological_values({1}, "2024-01-01", "2024-01-03")[1]
+    # Строки одного времени упорядочены по PAR_TIME_ID и в ряде, и в первом/последнем значении
+    assert series.tolist() == [10.0, 20.0, 30.0, 40.0, 50.0]
+    assert (aggregates["snm"], aggregates["lst"]) == (10.0, 50.0)
+
+
+@pytest.mark.parametrize("function_name", ["snm", "lst"])
+@pytest.mark.parametrize("cipher", ["T1", "X1"])
+def test_sql_edges_match_series_with_duplicate_times(duplicate_times_backend, function_name, cipher):
+    service = TemplateDatabaseService(backend=duplicate_times_backend)
+    expression = f"={function_name}({cipher})"
+    for _ in range(3):
+        series = service.fetch_parameters({cipher: cipher[0]}, "2024-01-01", "2024-01-03")
+        expected = service.handle_parse(expression, "2024-01-01", "2024-01-03", series)
+        assert service.handle_parse(expression, "2024-01-01", "2024-01-03") == expected
@@ -0,0 +1,97 @@
+# tests/test_result_cache.py
+import datetime
+
+import numpy as np
+import pytest
+
+from server.models.report_db_model import ReportDBModel
+from server.models.result_cache import ResultCache
+from server.services.template_database_service import TemplateDatabaseService
+
+PERIODS = [
+    ("2024-02-01", "2024-02-01"),
+    ("2024-01-01", "2024-01-31"),
+    ("2024-01-01", "2024-01-16"),
+    ("2024-01-03 06:30:00", "2024-01-20 12:00:00"),
+    ("2023-12-30 00:00:00", "2024-01-02 00:00:00"),
+]
+
+
+@pytest.mark.parametrize("time_start, time_end", PERIODS)
+def test_day_chunks_match_uncached_series(demo_backend, time_start, time_end):
+    cache = ResultCache()
+    cached = ReportDBModel("DB_NN_Technological_data", backend=demo_backend, cache=cache)
+    plain = ReportDBModel("DB_NN_Technological_data", backend=demo_backend)
+    # Первый проход заполняет кэш, второй собирает ряды из суточных частей
+    for _ in range(2):
+        actual = cached.get_technological_values({1, 2, 3, 999}, time_start, time_end)
+        expected = plain.get_technological_values({1, 2, 3, 999}, time_start, time_end)
+        for par_id, series in expected.items():
+            assert actual[par_id].total == series.total
+            assert np.array_equal(actual[par_id].times, series.times)
+            assert np.array_equal(actual[par_id].values, series.values)
+
+
+@pytest.mark.parametrize("expression", ["=T1", "=median(T1)", "=pct(T2, 90)", "=ave(T1*T2)", "=count(X3)"])
+def test_cache_does_not_change_formula_results(demo_backend, expression):
+    plain = TemplateDatabaseService(backend=demo_backend)
+    cached = TemplateDatabaseService(plain.report_pools, demo_backend, cache=ResultCache())
+    for time_start, time_end in PERIODS:
+        for _ in range(2):
+            actual = cached.handle_parse(expression, time_start, time_end)
+            expected = plain.handle_parse(expression, time_start, time_end)
+            actual = actual.tolist() if hasattr(actual, "tolist") else actual
+            expected = expected.tolist() if hasattr(expected, "tolist") else expected
+            assert actual == expected, (expression, time_start, time_end)
+
+
+def test_missing_days_are_fetched_by_contiguous_runs(demo_backend, monkeypatch):
+    model = ReportDBModel("DB_NN_Technological_data", backend=demo_backend, cache=ResultCache())
+    model.get_technological_values({1}, "2024-01-01", "2024-01-10 23:59:59")
+    model.get_technological_values({2}, "2024-01-01", "2024-01-10 23:59:59")
+
+    queries = []
+    fetch_columns = model._fetch_columns
+
+    def recording_fetch(statement, par_ids, time_start, time_end, **options):
+        queries.append((sorted(par_ids), time_start.date(), time_end.date()))
+        return fetch_columns(statement, par_ids, time_start, time_end, **options)
+
+    monkeypatch.setattr(model, "_fetch_columns", recording_fetch)
+    model.get_technological_values({1, 2}, "2024-01-01", "2024-01-12 23:59:59")
+    assert queries == [([1, 2], datetime.date(2024, 1, 11), datetime.date(2024, 1, 12))]
+
+    # Устаревшие сутки одного шифра и новые сутки другого не читают весь промежуток между ними
+    queries.clear()
+    model.cache._remove((model.db, "technological_values_batch", 1, datetime.date(2024, 1, 2)))
+    model.get_technological_values({1, 2}, "2024-01-01", "2024-01-13 23:59:59")
+    assert sorted(queries) == [([1], datetime.date(2024, 1, 2), datetime.date(2024, 1, 2)),
+                               ([1, 2], datetime.date(2024, 1, 13), datetime.date(2024, 1, 13))]
+
+
+def test_lru_eviction_and_ttl():
+    now = [0.0]
+    cache = ResultCache(max_bytes=10_000, closed_ttl=100.0, open_ttl=1.0, clock=lambda: now[0])
+    cache.put("closed", [1.0], "2020-01-01 00:00:00")
+    cache.put("open", [1.0], datetime.datetime.now() + datetime.timedelta(days=1))
+    now[0] = 2.0
+    assert cache.get("closed") == [1.0]
+    assert cache.get("open") is None
+    for index in range(1000):
+        cache.put(index, list(range(20)), "2020-01-01 00:00:00")
+    stats = cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] > 0 and stats["expirations"] == 1
+
+
+def test_cache_key_does_not_depend_on_date_spelling(demo_backend):
+    cache = ResultCache()
+    model = ReportDBModel("DB_NN_Technological_data", backend=demo_backend, cache=cache)
+    expected = model.get_technological_aggregates({1, 2}, "2024-01-01", "2024-01-31 23:59:59")
+    entries = cache.stats()["entries"]
+    for time_start, time_end in (("2024-01-01 00:00:00", "2024-01-31T23:59:59"),
+                                 (datetime.date(2024, 1, 1), datetime.datetime(2024, 1, 31, 23, 59, 59))):
+        misses = cache.stats()["misses"]
+        assert model.get_technological_aggregates({1, 2}, time_start, time_end) == expected
+        assert cache.stats()["misses"] == misses
+    assert cache.stats()["entries"] == entries
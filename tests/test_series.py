@@ -0,0 +1,36 @@
+# tests/test_series.py
+import numpy as np
+import pytest
+
+from server.models.series import Series
+from server.services.template_database_service import TemplateDatabaseService
+
+
+def _series(values, start=0):
+    times = np.arange(start, start + len(values)).astype("datetime64[D]").astype("datetime64[s]")
+    return Series(times, np.array(values, dtype=np.float64))
+
+
+def test_series_arithmetic_aligns_by_time():
+    result = _series([1.0, 2.0, 3.0]) * _series([10.0, 20.0, 30.0], start=1)
+    assert result.tolist() == [20.0, 60.0]
+    assert (6 / _series([2.0, 3.0])).tolist() == [3.0, 2.0]
+
+
+@pytest.mark.parametrize("expression", ["=T1/0", "=T1/T2", "=T1//T2", "=T1%T2", "=1/T2"])
+def test_division_by_zero_is_an_error(demo_backend, expression):
+    service = TemplateDatabaseService(backend=demo_backend)
+    values = {"T1": _series([5.0, 6.0, 7.0]), "T2": _series([1.0, 0.0, 2.0])}
+    assert service.handle_parse(expression, "2024-01-01", "2024-01-03", values) == "[ERROR: Деление на ноль]"
+
+
+def test_division_by_zero_on_fetched_series(demo_backend):
+    service = TemplateDatabaseService(backend=demo_backend)
+    assert service.handle_parse("=T1/0", "2024-01-01", "2024-01-31") == "[ERROR: Деление на ноль]"
+
+
+def test_overflow_is_an_error(demo_backend):
+    service = TemplateDatabaseService(backend=demo_backend)
+    values = {"T1": _series([5.0, 1e300])}
+    assert service.handle_parse("=T1*1e300", "2024-01-01", "2024-01-02", values) \
+        == "[ERROR: Результат вне допустимого диапазона]"
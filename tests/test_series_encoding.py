@@ -0,0 +1,24 @@
+# tests/test_series_encoding.py
+import math
+
+import pytest
+
+from common.protocol.series_encoding import decode_series, encode_series
+
+
+@pytest.mark.parametrize("values, encoding", [
+    ([100.25 + index * 0.5 for index in range(20)], "delta"),
+    (list(range(-10, 10)), "delta"),
+    ([math.pi * index for index in range(20)], "xor"),
+])
+def test_round_trip(values, encoding):
+    encoded = encode_series(values, ["delta", "xor"])
+    assert encoded["encoding"] == encoding
+    assert decode_series(encoded) == values
+
+
+@pytest.mark.parametrize("bad_value", [math.nan, math.inf, -math.inf])
+def test_non_finite_values_are_not_packed(bad_value):
+    values = [1.5] * 10 + [bad_value]
+    assert encode_series(values, ["delta", "xor"]) is None
+    assert encode_series(values, ["delta"]) is None
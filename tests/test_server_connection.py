@@ -0,0 +1,52 @@
+# tests/test_server_connection.py
+import socket
+import threading
+
+from client.services import server_connection
+from client.services.server_connection import ServerConnection
+from common.protocol.framing import receive_message, send_message
+
+
+def _serve(listener):
+    """Отвечает на HELLO отказом (клиент остается на JSON), на остальные запросы - эхом."""
+    connection, _ = listener.accept()
+    with connection:
+        while True:
+            message = receive_message(connection)
+            if message is None:
+                return
+            request_id, *_, request = message
+            if request.get("type") == "HELLO":
+                send_message(connection, {"status": "error"}, request_id)
+            else:
+                send_message(connection, {"status": "success", "data": request.get("data")}, request_id)
+
+
+def test_connect_does_not_hold_connection_lock(monkeypatch):
+    listener = socket.create_server(("127.0.0.1", 0))
+    threading.Thread(target=_serve, args=(listener,), daemon=True).start()
+    connecting = threading.Event()
+    release = threading.Event()
+    create_connection = socket.create_connection
+
+    def slow_create_connection(address, *args, **kwargs):
+        connecting.set()
+        release.wait(5)
+        return create_connection(address, *args, **kwargs)
+
+    monkeypatch.setattr(server_connection.socket, "create_connection", slow_create_connection)
+    connection = ServerConnection("127.0.0.1", listener.getsockname()[1], response_timeout=5)
+    responses = []
+    requester = threading.Thread(target=lambda: responses.append(connection.request({"type": "PING", "data": 1})))
+    requester.start()
+    try:
+        assert connecting.wait(5)
+        # Пока идет подключение, блокировка ожидающих запросов свободна
+        assert connection.lock.acquire(timeout=1)
+        connection.lock.release()
+    finally:
+        release.set()
+        requester.join(5)
+    assert responses == [{"status": "success", "data": 1}]
+    connection.close()
+    listener.close()
@@ -0,0 +1,32 @@
+# tests/test_sqlite_backend.py
+import datetime
+
+from server.models.backends.sqlite_backend import normalize_datetime, translate_query
+from server.models.report_db_model import ReportDBModel
+
+
+def test_normalize_datetime():
+    assert normalize_datetime("2024-02-01") == "2024-02-01 00:00:00"
+    assert normalize_datetime("2024-02-01T06:30:00") == "2024-02-01 06:30:00"
+    assert normalize_datetime(datetime.date(2024, 2, 1)) == "2024-02-01 00:00:00"
+    assert normalize_datetime("не дата") == "не дата"
+
+
+def test_translate_query_normalizes_date_literals():
+    query = "SELECT * FROM dbo.T WHERE T BETWEEN '2024-02-01' AND '2024-02-03T12:00' AND NAME = %s"
+    assert translate_query(query) == (
+        "SELECT * FROM T WHERE T BETWEEN '2024-02-01 00:00:00' AND '2024-02-03 12:00:00' AND NAME = ?"
+    )
+
+
+def test_date_only_end_bound_includes_midnight(demo_backend):
+    # Как BETWEEN в SQL Server: граница '2024-01-31' включает отметку 2024-01-31 00:00:00
+    model = ReportDBModel("DB_NN_Technological_data", backend=demo_backend)
+    date_only = model.get_technological_values({1}, "2024-01-01", "2024-01-31")[1]
+    full = model.get_technological_values({1}, "2024-01-01 00:00:00", "2024-01-31 00:00:00")[1]
+    assert date_only.total == full.total == 31
+    assert date_only.times[-1] == full.times[-1]
+
+    aggregates = model.get_technological_aggregates({1}, "2024-01-01", "2024-01-31", edges=True)[1]
+    assert aggregates["total"] == 31
+    assert aggregates["lst"] == full.values[-1]
@@ -0,0 +1,29 @@
+# tests/test_zdict.py
+import json
+import zlib
+
+from common.protocol.zdict import DICTIONARIES, decompress, negotiate_version, train_dictionary
+
+
+def _samples():
+    return [json.dumps({"status": "success", "cell_name": f"B{index}", "value": index * 1.5,
+                        "config": {"background_color": "#FFFFFF", "font": "Arial,10", "merger": None}}).encode()
+            for index in range(200)]
+
+
+def test_trained_dictionary_has_no_shifted_copies():
+    dictionary = train_dictionary(_samples(), overlap_length=8)
+    pieces = [dictionary[offset:offset + 8] for offset in range(len(dictionary) - 7)]
+    # Сдвинутые копии одних и тех же отрезков повторяли бы большую часть подстрок
+    assert len(set(pieces)) > 0.75 * len(pieces)
+    for key in (b"background_color", b"cell_name", b"merger", b"success"):
+        assert key in dictionary
+
+
+def test_newest_dictionary_round_trip():
+    version = negotiate_version(DICTIONARIES)
+    assert version == max(DICTIONARIES)
+    data = _samples()[7]
+    compressor = zlib.compressobj(6, zdict=DICTIONARIES[version])
+    body = compressor.compress(data) + compressor.flush()
+    assert decompress(body) == data